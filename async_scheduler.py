@@ -0,0 +1,73 @@
+"""
+Asyncio scheduler for tracker jobs.
+
+Each job gets its own loop that sleeps until the job's next slot, so a slow
+GPU scrape never delays the CPU/mobo/RAM trackers. Trackers run in worker
+threads (pymongo and the pooled HTTP session are synchronous) behind a
+global concurrency limit, and the per-host rate limit in http_client and
+each site spec's connection limit are shared by every thread. Slots are
+computed from the schedule rather than from when the last run finished, so
+intervals do not drift, and a configurable jitter spreads jobs apart. A job
+never overlaps itself: slots missed while it was still running are skipped.
+"""
+
+import asyncio
+import logging
+import os
+import random
+
+SCHEDULER_MAX_CONCURRENT = int(os.getenv("SCHEDULER_MAX_CONCURRENT", "4"))  # trackers running at the same time
+SCHEDULER_JITTER = float(os.getenv("SCHEDULER_JITTER", "0.1"))  # +/- fraction of the interval
+
+
+class Job:
+    """A tracker function run every ``interval_minutes`` with jitter."""
+
+    def __init__(self, name, func, interval_minutes, jitter=SCHEDULER_JITTER):
+        self.name = name
+        self.func = func
+        self.interval = interval_minutes * 60
+        self.jitter = jitter
+        self.runs = 0
+        self.skipped = 0
+        self.last_duration = None
+
+    def next_delay(self):
+        """Seconds until the next slot: the interval with +/- jitter applied."""
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def __repr__(self):
+        return f"Job({self.name}, every {self.interval / 60:g} minutes, jitter {self.jitter:.0%})"
+
+
+async def _job_loop(job, semaphore):
+    loop = asyncio.get_running_loop()
+    next_run = loop.time() + job.next_delay()
+    while True:
+        await asyncio.sleep(max(0.0, next_run - loop.time()))
+        async with semaphore:
+            started = loop.time()
+            try:
+                await asyncio.to_thread(job.func)
+            except Exception as e:
+                logging.error(f"Error in scheduled job {job.name}: {e}", exc_info=True)
+            job.last_duration = loop.time() - started
+            job.runs += 1
+        logging.debug(f"{job.name} finished in {job.last_duration:.1f} seconds")
+
+        next_run += job.next_delay()
+        now = loop.time()
+        if next_run < now:
+            missed = int((now - next_run) // job.interval) + 1
+            job.skipped += missed
+            logging.warning(f"{job.name} took {job.last_duration:.1f} seconds and overran its interval, skipping {missed} run(s)")
+            next_run += missed * job.interval
+
+
+async def run_scheduler(jobs, max_concurrent=SCHEDULER_MAX_CONCURRENT):
+    """Run every job on its own schedule until cancelled."""
+    semaphore = asyncio.Semaphore(max_concurrent)
+    logging.info(f"Scheduler started with Jobs (max {max_concurrent} concurrent):")
+    for job in jobs:
+        logging.info(f"  {job}")
+    await asyncio.gather(*(_job_loop(job, semaphore) for job in jobs))
@@ -0,0 +1,233 @@
+"""
+Local Gameloot stand-in server for offline benchmarks.
+
+Serves synthetic WooCommerce/Kadence category pages at
+/product-category/<category>/page/<n>/ with a configurable number of pages,
+products per page, response latency and error rate. Pages carry an ETag and
+answer conditional requests with 304, and the catalog can be mutated
+between runs to simulate price changes, sales and new listings. Requests
+in flight are tracked per category group so benchmarks can check
+connection limits.
+
+Usage:
+    python bench_server.py [--port 8080] [--pages 20] [--products 24] [--latency 0.05] [--error-rate 0.01]
+"""
+
+import argparse
+import hashlib
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+PAGE_PATH_PATTERN = re.compile(r"^/product-category/([^/]+)/page/(\d+)/")
+
+
+def render_listing_page(page, pages, products, base_url):
+    """
+    Render a WooCommerce/Kadence style listing page with header, sidebar and footer chrome.
+
+    Args:
+        page: Page number being rendered
+        pages: Total number of pages (for the pagination block)
+        products: List of (product_id, price) tuples on this page
+        base_url: Category URL used in pagination links
+    """
+    menu = "".join(f'<li class="menu-item"><a href="https://gameloot.in/category-{i}/">Category {i}</a></li>' for i in range(150))
+    widgets = "".join(
+        f'<li class="cat-item"><a href="https://gameloot.in/tag-{i}/">Tag {i}</a> <span class="count">({i})</span></li>' for i in range(80)
+    )
+    amount = (
+        '<span class="woocommerce-Price-amount amount"><bdi><span class="woocommerce-Price-currencySymbol">Rs.</span>'
+        "&nbsp;{:,}</bdi></span>"
+    )
+    items = []
+    for product_id, price in products:
+        if product_id % 3 == 0:
+            price_html = f"<del>{amount.format(price + 5000)}</del> <ins>{amount.format(price)}</ins>"
+        else:
+            price_html = amount.format(price)
+        link = f"https://gameloot.in/product/item-{product_id}/"
+        items.append(
+            f'<div class="col-xxl-2 col-xl-3 col-md-4 col-sm-6 kad_product">'
+            f'<div class="grid_item product_item clearfix kad_product_fade_in">'
+            f'<a href="{link}" class="product_item_link product_img_link"><img src="https://gameloot.in/img/{product_id}.jpg" alt=""></a>'
+            f'<div class="product_details"><a href="{link}" class="product_item_link"><h5>Graphics Card Model {product_id} 8GB &amp; More (Used)</h5></a>'
+            f'<span class="price">{price_html}</span></div></div></div>'
+        )
+    pagination = "".join(
+        f'<li><a class="page-numbers" href="{base_url}/page/{n}/?stock=instock">{n}</a></li>' for n in range(1, pages + 1) if n != page
+    )
+    if page < pages:
+        pagination += f'<li><a class="next page-numbers" href="{base_url}/page/{page + 1}/?stock=instock">&rarr;</a></li>'
+    return (
+        '<!DOCTYPE html><html lang="en-US"><head><meta charset="UTF-8"><title>Category - Gameloot</title>'
+        + "".join(f'<script src="https://gameloot.in/js/{i}.js"></script>' for i in range(20))
+        + f'</head><body><header id="kad-banner"><nav><ul class="sf-menu">{menu}</ul></nav></header>'
+        + f'<div id="content"><div class="main"><div id="product_wrapper" class="products kt-masonry-init">{"".join(items)}</div>'
+        + f'<nav class="woocommerce-pagination"><ul class="page-numbers">{pagination}</ul></nav></div>'
+        + f'<aside class="sidebar"><ul>{widgets}</ul></aside></div>'
+        + f'<footer id="containerfooter"><ul>{widgets}</ul><p>&copy; Gameloot</p></footer></body></html>'
+    )
+
+
+class BenchServer:
+    """Threaded HTTP server holding a synthetic catalog per category."""
+
+    def __init__(self, pages=20, products_per_page=24, latency=0.0, error_rate=0.0, port=0, seed=0):
+        self.products_per_page = products_per_page
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.initial_products = pages * products_per_page
+        self.catalogs = {}  # category -> [(product_id, price), ...]
+        self.next_id = 0
+        self.requests = 0
+        self.not_modified = 0
+        self.errors = 0
+        self.in_flight = {}  # category group -> requests being served
+        self.peak_in_flight = {}  # category group -> highest in_flight seen
+        self._lock = threading.Lock()
+        self._rendered = {}  # (category, page) -> (body, etag), cleared on mutate
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_port
+
+    def category_url(self, category="graphics-card"):
+        return f"http://127.0.0.1:{self.port}/product-category/{category}"
+
+    def _new_products(self, count):
+        products = [(self.next_id + i, self.rng.randint(2000, 150000)) for i in range(count)]
+        self.next_id += count
+        return products
+
+    def catalog(self, category):
+        with self._lock:
+            if category not in self.catalogs:
+                self.catalogs[category] = self._new_products(self.initial_products)
+            return self.catalogs[category]
+
+    def mutate(self, category="graphics-card", price_changes=0.05, sold=0.03, new=0.03):
+        """Change prices, remove (sell) and add products as fractions of the category size."""
+        catalog = list(self.catalog(category))
+        with self._lock:
+            size = len(catalog)
+            for index in self.rng.sample(range(size), int(size * price_changes)):
+                product_id, price = catalog[index]
+                catalog[index] = (product_id, max(1000, price + self.rng.choice((-1, 1)) * self.rng.randint(100, 5000)))
+            for index in sorted(self.rng.sample(range(size), int(size * sold)), reverse=True):
+                del catalog[index]
+            # New listings show up first, like WooCommerce's newest-first ordering
+            catalog[:0] = self._new_products(int(size * new))
+            self.catalogs[category] = catalog
+            self._rendered = {key: value for key, value in self._rendered.items() if key[0] != category}
+
+    def page(self, category, page):
+        """Return (body, etag) for a page, or None past the last page."""
+        catalog = self.catalog(category)
+        pages = max(1, -(-len(catalog) // self.products_per_page))
+        if page > pages:
+            return None
+        with self._lock:
+            cached = self._rendered.get((category, page))
+        if cached is None:
+            products = catalog[(page - 1) * self.products_per_page : page * self.products_per_page]
+            body = render_listing_page(page, pages, products, self.category_url(category)).encode()
+            cached = (body, '"%s"' % hashlib.md5(body).hexdigest())
+            with self._lock:
+                self._rendered[(category, page)] = cached
+        return cached
+
+    def _handler_class(self):
+        bench = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, headers=(), body=b""):
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                if status != 304:
+                    self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                with bench._lock:
+                    bench.requests += 1
+                match = PAGE_PATH_PATTERN.match(self.path)
+                if not match:
+                    return self._send(404)
+                # Categories named "<group>.<name>" are counted together, e.g. per benchmark site
+                group = match.group(1).partition(".")[0]
+                with bench._lock:
+                    bench.in_flight[group] = bench.in_flight.get(group, 0) + 1
+                    bench.peak_in_flight[group] = max(bench.peak_in_flight.get(group, 0), bench.in_flight[group])
+                try:
+                    response = self._respond(match)
+                finally:
+                    # Leave in flight before the client can see the response and send its next request
+                    with bench._lock:
+                        bench.in_flight[group] -= 1
+                self._send(*response)
+
+            def _respond(self, match):
+                if bench.latency:
+                    time.sleep(bench.latency)
+                if bench.error_rate and bench.rng.random() < bench.error_rate:
+                    with bench._lock:
+                        bench.errors += 1
+                    return (503,)
+                result = bench.page(match.group(1), int(match.group(2)))
+                if result is None:
+                    return (404,)
+                body, etag = result
+                if self.headers.get("If-None-Match") == etag:
+                    with bench._lock:
+                        bench.not_modified += 1
+                    return 304, [("ETag", etag)]
+                return 200, [("Content-Type", "text/html; charset=UTF-8"), ("ETag", etag)], body
+
+        return Handler
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve synthetic Gameloot category pages")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--products", type=int, default=24)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    server = BenchServer(args.pages, args.products, args.latency, args.error_rate, port=args.port)
+    print(f"Serving {args.pages} pages x {args.products} products at {server.category_url()}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
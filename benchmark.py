@@ -0,0 +1,1953 @@
+"""
+Offline benchmarks for the scraper.
+
+Usage:
+    python benchmark.py parse [--pages 50] [--products 24] [--repeat 3] [--record URL ...]
+    python benchmark.py dedup [--products 100000] [--duplicates 0.1]
+    python benchmark.py messages [--sizes 1000 10000 100000]
+    python benchmark.py e2e [--pages 20] [--products 24] [--latency 0.05] [--error-rate 0]
+                            [--mongo mock|mongodb://localhost:27017/gamelootBench]
+                            [--storage mongo|sqlite] [--output result.json] [--baseline baseline.json]
+    python benchmark.py incremental [--pages 20] [--incremental-pages 2] [--storage sqlite|mongo]
+    python benchmark.py sites [--sites 3] [--categories 3] [--max-connections 2] [--storage sqlite|mongo]
+    python benchmark.py storage [--products 2000] [--mongo mock|URI]
+    python benchmark.py watch [--rules 1000 10000 100000] [--products 500]
+    python benchmark.py profile [--runs 5] [--pages 20] [--keep 3]
+    python benchmark.py journal [--pages 20] [--storage sqlite|mongo]
+    python benchmark.py api [--days 60] [--per-day 100] [--storage sqlite|mongo]
+    python benchmark.py identity [--sizes 1000 10000 100000] [--queries 200] [--storage sqlite|mongo]
+    python benchmark.py startup [--runs 5] [--budget-ms 300]
+    python benchmark.py workers [--workers 3] [--rounds 6] [--scope category|site] [--storage sqlite|mongo]
+
+parse: Parses the saved Gameloot listing pages in fixtures/gameloot with
+       the original full-DOM html.parser code and every installed HTML
+       parser backend and checks them against the expected products and
+       last page checked in next to each page. Then parses synthetic pages
+       with every backend, checks that all backends return exactly the
+       products of the original code and reports pages parsed per second.
+       Exits non-zero on a mismatch. --record URL ... saves live pages as
+       new golden files (review the expected output before committing).
+
+dedup: Deduplicates synthetic listings (with repeated links at other
+       prices) using ProductRecords under every dedup policy, checks that
+       the first-seen order is kept and that each policy keeps the right
+       price, and reports time and peak traced memory next to the old
+       full-dict tuple dedup on plain dictionaries.
+
+messages: Builds alert messages of increasing size with MessageBuilder and
+       split_paragraph, checks every part fits Telegram's limit with no
+       empty parts or lost entries, and fails if the time per entry grows
+       with the input size (i.e. building is not linear).
+
+e2e:   Starts a local stand-in server (bench_server.py) and runs
+       process_category_stock for the Gameloot GPU spec end to end against a local MongoDB or
+       mongomock, with Telegram sends stubbed out. Three runs are measured:
+       cold (empty database), unchanged (same pages again) and changed
+       (after a catalog mutation). Reports wall time, HTTP requests, DB
+       operations, peak RSS and products/s, and compares with a baseline
+       JSON written by an earlier --output. Exits non-zero if the stored
+       in-stock products do not match the served catalog after a run.
+
+storage: Runs the same conformance checks (diff writes, sold marking,
+       price history buckets and downsampling, page cache) against the
+       MongoDB and SQLite stores and compares their write throughput.
+
+incremental: Runs a full sweep, two incremental runs after small and
+       large batches of new listings and a forced full sweep against the
+       stand-in server. Fails if an incremental run misses a new listing or
+       marks anything sold, or if a full sweep does not match the catalog.
+
+sites: Builds several site specs from the Gameloot spec, each with its own
+       stand-in categories and a max_connections limit, and scrapes every
+       category once one at a time and once all at once (SQLite by
+       default). Exits non-zero if a site ever had more requests in flight
+       than its limit or a category's stored stock does not match.
+
+watch: Matches the changed products of a synthetic run against growing
+       sets of watch rules through the WatchIndex and by checking every
+       rule against every product, reports both times and the candidate
+       rules checked, and exits non-zero if the alerts differ.
+
+profile: Runs process_category_stock against the stand-in server with the
+       run profiler off, sampling every run, under cProfile and armed with
+       a slow-run threshold that is never reached, and reports the time per
+       run of each. Fails if disabled profiling wraps the job, if dumps are
+       missing or not rotated, or if the threshold mode keeps a dump.
+
+journal: Crashes process_category_stock mid-scrape, before and after the
+       stock write and between the write and the journal's "applied" mark,
+       and fails an alert delivery, then restarts it with only the
+       database left. Fails if checkpointed pages are fetched again (or
+       stale ones reused), the stock does not match the catalog, any change
+       is alerted other than exactly once, a replayed diff records a price
+       point twice or moves firstSeenAt, or a journal is left behind. Also
+       sends a batch of journaled alerts to a bot that fails one chat
+       partway and checks the restart sends each part exactly once.
+
+workers: Starts several lease-sharing workers (LeaseManagers with short
+       leases) over a few stand-in sites and fires every worker's slot for
+       every tracker at once, round after round. One worker dies without
+       releasing its leases and later a new one joins. Fails if a tracker
+       runs on two workers at once or not exactly once a round, the stock
+       does not match the catalog, or a change is not alerted exactly once.
+
+api:   Writes weeks of synthetic runs (new, repriced, sold and restocked
+       listings) and queries every stock API endpoint over HTTP, once
+       uncached and then repeatedly from the cache, reporting time and
+       database operations of each. Fails if a result differs from the
+       synthetic history, a cached request reaches the database, or a
+       tracker run does not drop the cached results of its type.
+
+identity: Checks the model keys of sample listing names, then resolves
+       retyped and unknown names against ModelIndexes of growing size and
+       against a scan of every known name, reporting the time per lookup.
+       Fails if a key is wrong, a lookup differs from the scan, or a
+       relisted model's new-listing alert lacks its earlier price range.
+
+startup: Imports scraper.py in fresh interpreters with -X importtime and
+       reports the median import time, the slowest packages and a bare
+       interpreter start, then runs the one-shot mode (scraper.py --once)
+       against the stand-in server. Fails if the import takes longer than
+       --budget-ms, a lazily loaded package (python-telegram-bot, bs4) is
+       imported up front, or a one-shot run picks the wrong trackers or
+       exit status.
+"""
+
+import argparse
+import collections
+import functools
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import tracemalloc
+from datetime import datetime, timedelta
+from contextlib import ExitStack, nullcontext
+from time import perf_counter, sleep
+from urllib.parse import urlparse
+from unittest import mock
+
+from bs4 import BeautifulSoup
+
+import logging_config
+import db_utils
+import http_client
+import leases
+import metrics
+import price_history
+import product_identity
+import profiling
+import run_journal
+import scraper
+import site_engine
+import stock_api
+import stock_diff
+import storage
+import telegram_helper
+import watchlist
+from html_parsers import available_backends
+from products import DEDUP_POLICIES, ProductRecord, dedup_products
+from sites import CategorySpec, SiteSpec, load_site_spec
+from stock_diff import StockDiff, compute_stock_diff
+from telegram_helper import MessageBuilder, split_paragraph, TELEGRAM_MAX_MESSAGE_LENGTH
+from bench_server import BenchServer, render_listing_page
+
+# Collection methods that cost a database round trip
+DB_OPERATIONS = {
+    "aggregate", "bulk_write", "count_documents", "create_index", "delete_many", "delete_one", "find",
+    "find_one", "find_one_and_update", "insert_many", "insert_one", "replace_one", "update_many", "update_one",
+}
+# StockStore methods that hit the database
+STORE_OPERATIONS = {
+    "load_stock_state", "load_names", "write_stock_changes", "record_price_history", "load_price_history",
+    "load_page_cache", "save_page_cache", "delete_page_cache", "maintain_price_history", "load_lowest_prices",
+    "load_watch_rules", "save_watch_rule", "delete_watch_rule", "load_run_journal", "save_run_journal", "delete_run_journal",
+    "acquire_lease", "renew_leases", "release_lease", "load_leases", "load_stock", "load_sell_times", "load_daily_new_listings",
+    "load_model_names", "write_model_keys", "load_model_price_ranges",
+}
+E2E_METRICS = ("wall_s", "requests", "db_ops", "peak_rss_mb", "products_per_s")
+RUN_STAGES = ("scrape", "diff", "watchlist", "write", "alerts")
+# Packages scraper.py must not import up front (loaded on first use)
+STARTUP_LAZY_PACKAGES = ("telegram", "bs4")
+# Saved Gameloot listing pages (NAME.html) and the products expected from them (NAME.json)
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "gameloot")
+
+
+def _original_price(price_str):
+    price_str = price_str.replace("\xa0", " ").replace("Rs. ", "").replace(",", "")
+    return int(price_str)
+
+
+def _original_name(name):
+    pos = name.rfind("(")
+    if pos != -1:
+        return name[:pos].strip()
+    return name.strip()
+
+
+def _parse_products_full_dom(content):
+    """The original hard-coded Gameloot parser: full html.parser DOM and find() calls, used as the parity reference."""
+    soup = BeautifulSoup(content, "html.parser")
+    products = []
+    for container in soup.find_all("div", class_="kad_product"):
+        name_tag = container.find("h5")
+        name = name_tag.text.strip() if name_tag else "No name found"
+        price_tag = container.find("ins")
+        if price_tag:
+            price = price_tag.find("span", class_="woocommerce-Price-amount").text.strip()
+        else:
+            price_tag = container.find("span", class_="woocommerce-Price-amount")
+            price = price_tag.text.strip() if price_tag else "No price found"
+        link_tag = container.find("a", class_="product_item_link")
+        href = link_tag["href"] if link_tag else "No link found"
+        products.append(
+            {"name": _original_name(name), "price": _original_price(price), "link": href, "inStock": True}
+        )
+    return products
+
+
+def _golden_expected(site, content):
+    """Expected output of a page: the products of the original parser and the last page of the pagination links."""
+    return {"products": _parse_products_full_dom(content), "lastPage": site_engine.parse_listing_page(site, content, "html.parser")[1]}
+
+
+def _record_golden(site, urls):
+    """Save listing pages as golden files with the output of the original parser (check it by hand before committing)."""
+    for url in urls:
+        response = http_client.get(url)
+        if response.status_code != 200:
+            print(f"{url}: HTTP {response.status_code}, not saved")
+            return 1
+        name = re.sub(r"[^a-z0-9]+", "-", urlparse(url).path.lower()).strip("-").replace("product-category-", "")
+        with open(os.path.join(GOLDEN_DIR, f"{name}.html"), "wb") as f:
+            f.write(response.content)
+        expected = _golden_expected(site, response.content)
+        with open(os.path.join(GOLDEN_DIR, f"{name}.json"), "w", encoding="utf-8") as f:
+            json.dump(expected, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"{url}: saved as {name}, {len(expected['products'])} products, last page {expected['lastPage']}")
+    return 0
+
+
+def _golden_mismatches(site, backends):
+    """
+    Parse every saved page in GOLDEN_DIR and compare with its checked-in expected output.
+
+    Returns:
+        list: (page, backend, what differs) for every mismatch
+    """
+    mismatches = []
+    for file_name in sorted(os.listdir(GOLDEN_DIR)):
+        if not file_name.endswith(".html"):
+            continue
+        page = file_name[: -len(".html")]
+        with open(os.path.join(GOLDEN_DIR, file_name), "rb") as f:
+            content = f.read()
+        with open(os.path.join(GOLDEN_DIR, f"{page}.json"), encoding="utf-8") as f:
+            expected = json.load(f)
+        if _parse_products_full_dom(content) != expected["products"]:
+            mismatches.append((page, "full-dom", "products"))
+        for backend in backends:
+            products, last_page = site_engine.parse_listing_page(site, content, backend)
+            if [record.to_dict() for record in products] != expected["products"]:
+                mismatches.append((page, backend, "products"))
+            if last_page != expected["lastPage"]:
+                mismatches.append((page, backend, f"last page {last_page}, expected {expected['lastPage']}"))
+    return mismatches
+
+
+def bench_parse(args):
+    """Check every backend against the golden pages, then parse the same synthetic pages with each for parity and pages/s."""
+    site = load_site_spec("gameloot")
+    if args.record:
+        return _record_golden(site, args.record)
+    failed = False
+    mismatches = _golden_mismatches(site, list(available_backends()))
+    for page, backend, what in mismatches:
+        print(f"{page}: {backend} {what} differ from the golden file")
+        failed = True
+    print(f"golden pages: {len([name for name in os.listdir(GOLDEN_DIR) if name.endswith('.html')])} checked, {len(mismatches)} mismatch(es)")
+
+    rng = random.Random(0)
+    catalog = [(product_id, rng.randint(2000, 150000)) for product_id in range(args.pages * args.products)]
+    pages = [
+        render_listing_page(n, args.pages, catalog[(n - 1) * args.products : n * args.products], "https://gameloot.in/product-category/graphics-card").encode()
+        for n in range(1, args.pages + 1)
+    ]
+    reference = [_parse_products_full_dom(content) for content in pages]
+    print(f"{len(pages)} pages x {args.products} products, {sum(map(len, pages)) / len(pages) / 1024:.0f} KiB/page")
+    for backend in ["full-dom"] + list(available_backends()):
+        if backend == "full-dom":
+            parse = _parse_products_full_dom
+        else:
+            results = [[record.to_dict() for record in site_engine.parse_listing_page(site, content, backend)[0]] for content in pages]
+            if results != reference:
+                print(f"{backend}: products differ from the full-DOM html.parser reference")
+                failed = True
+                continue
+            parse = functools.partial(site_engine.parse_listing_page, site, backend=backend)
+
+        best = None
+        for _ in range(args.repeat):
+            start = perf_counter()
+            for content in pages:
+                parse(content)
+            elapsed = perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{backend:>12}: {len(pages) / best:8.1f} pages/s ({best / len(pages) * 1000:.2f} ms/page)")
+    return 1 if failed else 0
+
+
+def bench_messages(args):
+    """Check MessageBuilder/split_paragraph output and that their cost per entry stays flat as inputs grow."""
+    failed = False
+    per_entry = {}
+    for size in args.sizes:
+        entries = [f"-Graphics Card Model {i} 8GB - {10000 + i} - https://gameloot.in/product/item-{i}/" for i in range(size)]
+        # One over-long line every 1000 entries exercises hard-wrapping
+        for i in range(0, size, 1000):
+            entries[i] = entries[i] + " x" * 3000
+
+        start = perf_counter()
+        builder = MessageBuilder(header="NEW PRODUCT IN STOCK! :")
+        for entry in entries:
+            builder.add_entry(entry)
+        parts = builder.parts()
+        build_time = perf_counter() - start
+
+        text = "\n\n".join(["NEW PRODUCT IN STOCK! :"] + entries)
+        start = perf_counter()
+        split_parts = split_paragraph(text)
+        split_time = perf_counter() - start
+
+        for name, result in (("MessageBuilder", parts), ("split_paragraph", split_parts)):
+            if any(not part or len(part) > TELEGRAM_MAX_MESSAGE_LENGTH for part in result):
+                print(f"{name}: empty or over-long part for {size} entries")
+                failed = True
+            if "".join(result).replace("\n", "") != text.replace("\n", ""):
+                print(f"{name}: text lost or reordered for {size} entries")
+                failed = True
+
+        per_entry[size] = (build_time + split_time) / size
+        print(
+            f"{size:>8} entries: {len(parts)} parts, build {build_time * 1000:8.1f} ms, split {split_time * 1000:8.1f} ms, "
+            f"{per_entry[size] * 1e6:.2f} us/entry"
+        )
+
+    smallest, largest = min(per_entry), max(per_entry)
+    if per_entry[largest] > per_entry[smallest] * args.max_growth:
+        print(f"Time per entry grew {per_entry[largest] / per_entry[smallest]:.1f}x from {smallest} to {largest} entries (limit {args.max_growth}x)")
+        failed = True
+    return 1 if failed else 0
+
+
+def _remove_list_duplicates_reference(dict_list):
+    """The original db_utils.remove_list_duplicates: hashes every field, loses the order."""
+    return [dict(t) for t in set(tuple(sorted(d.items())) for d in dict_list)]
+
+
+def _measure(func, make_args=tuple):
+    """Return (result, seconds, peak traced MiB): timed untraced, then called again on fresh arguments under tracemalloc."""
+    args = make_args()
+    start = perf_counter()
+    result = func(*args)
+    elapsed = perf_counter() - start
+    args = make_args()
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def bench_dedup(args):
+    """Compare key-based dedup on ProductRecords with the old full-dict tuple dedup and check every policy."""
+    rng = random.Random(0)
+    unique = int(args.products * (1 - args.duplicates))
+    rows = []
+    for i in range(args.products):
+        # Duplicates repeat an earlier listing with a different price and tracking query string
+        product_id = i if i < unique else rng.randrange(unique)
+        suffix = "" if i < unique else "?utm_source=feed"
+        rows.append((f"Graphics Card Model {product_id} 8GB", rng.randint(2000, 150000), f"https://gameloot.in/product/item-{product_id}/{suffix}"))
+    rng.shuffle(rows)
+
+    def build_dicts():
+        return [{"name": name, "price": price, "link": link, "inStock": True, "type": "gpu"} for name, price, link in rows]
+
+    def build_records():
+        return [ProductRecord(name, price, link, type="gpu") for name, price, link in rows]
+
+    dicts, dict_build, dict_mem = _measure(build_dicts)
+    _, record_build, record_mem = _measure(build_records)
+    print(f"{args.products} products, {unique} unique listings")
+    print(f"  build dicts:   {dict_build * 1000:8.1f} ms, peak {dict_mem:6.1f} MiB")
+    print(f"  build records: {record_build * 1000:8.1f} ms, peak {record_mem:6.1f} MiB")
+
+    reference, reference_time, reference_mem = _measure(_remove_list_duplicates_reference, lambda: (dicts,))
+    print(f"  old full-dict dedup: {reference_time * 1000:8.1f} ms, peak {reference_mem:6.1f} MiB, {len(reference)} kept (same link, other price = kept twice)")
+
+    failed = False
+    first_seen = []
+    expected = {policy: {} for policy in DEDUP_POLICIES}
+    for name, price, link in rows:
+        link = link.split("?")[0]
+        if link not in expected["first"]:
+            first_seen.append(link)
+            expected["first"][link] = price
+        expected["lowest"][link] = min(price, expected["lowest"].get(link, price))
+        expected["last"][link] = price
+    for policy in DEDUP_POLICIES:
+        kept, elapsed, peak = _measure(dedup_products, lambda: (build_records(), policy))
+        print(f"  {policy:>6} policy: {elapsed * 1000:8.1f} ms, peak {peak:6.1f} MiB, {len(kept)} kept")
+        if [record.link for record in kept] != first_seen:
+            print(f"{policy}: kept listings are missing or out of first-seen order")
+            failed = True
+        if {record.link: record.price for record in kept} != expected[policy]:
+            print(f"{policy}: kept prices do not follow the policy")
+            failed = True
+
+    # Stored at the prices the "last" policy keeps: earlier copies at other prices must leave no trace
+    state = {link: {"link": link, "price": price, "inStock": True} for link, price in expected["last"].items()}
+    diff = compute_stock_diff(build_records(), state, "last")
+    if diff.new or diff.restocked or diff.price_changed or diff.previous_prices:
+        print(f"last policy diff: {len(diff.price_changed)} price change(s), {len(diff.previous_prices)} old price(s) left by replaced copies")
+        failed = True
+    return 1 if failed else 0
+
+
+class _CountingCollection:
+    """Collection proxy that counts round-trip operations."""
+
+    def __init__(self, collection, counter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name not in DB_OPERATIONS:
+            return attr
+
+        def counted(*args, **kwargs):
+            self._counter[name] = self._counter.get(name, 0) + 1
+            return attr(*args, **kwargs)
+
+        return counted
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class _CountingStore:
+    """StockStore proxy that counts the calls that hit the database (used for SQLite, which has no round trips)."""
+
+    def __init__(self, store, counter):
+        self._store = store
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        if name not in STORE_OPERATIONS:
+            return attr
+
+        def counted(*args, **kwargs):
+            self._counter[name] = self._counter.get(name, 0) + 1
+            return attr(*args, **kwargs)
+
+        return counted
+
+
+def _deliver(message, chat_ids=None, on_done=None, resume=None):
+    """Stand-in for queue_telegram_message that delivers every alert right away."""
+    if on_done is not None:
+        on_done(True)
+
+
+def _stock_mismatches(store, catalog, product_type="gpu"):
+    """Count links whose stored in-stock price differs from the catalog the server is serving."""
+    expected = {f"https://gameloot.in/product/item-{product_id}/": price for product_id, price in catalog}
+    stored = {link: doc["price"] for link, doc in store.load_stock_state(product_type).items() if doc["inStock"]}
+    return len(set(expected.items()) ^ set(stored.items()))
+
+
+def _open_store(stack, backend, mongo, counter=None):
+    """
+    Install a fresh, empty store of the given backend as the shared store.
+
+    Args:
+        backend: "mongo" or "sqlite"
+        mongo: "mock" for mongomock or a MongoDB URI (its collections are dropped)
+        counter: Optional dict that receives per-operation counts
+
+    Returns:
+        StockStore: The store without any counting wrapper, or None if mongomock is missing
+    """
+    # Rules and journals cached from an earlier store must not leak into this one
+    watchlist.reset_watch_index()
+    stack.callback(watchlist.reset_watch_index)
+    run_journal.reset_run_journals()
+    stack.callback(run_journal.reset_run_journals)
+    product_identity.reset_model_indexes()
+    stack.callback(product_identity.reset_model_indexes)
+    if backend == "sqlite":
+        directory = stack.enter_context(tempfile.TemporaryDirectory())
+        store = storage.SQLiteStockStore(os.path.join(directory, "bench.db"))
+        stack.callback(store.close)
+        stack.enter_context(mock.patch.object(storage, "_store", store if counter is None else _CountingStore(store, counter)))
+        store.prepare()
+        return store
+
+    if mongo == "mock":
+        try:
+            import mongomock
+        except ImportError:
+            print("--mongo mock needs mongomock (pip install mongomock)")
+            return None
+        stack.enter_context(mock.patch.object(db_utils.pymongo, "MongoClient", mongomock.MongoClient))
+        mongo_uri = "mongodb://localhost:27017/gamelootBench"
+    else:
+        mongo_uri = mongo
+    stack.enter_context(mock.patch.dict(os.environ, {"MONGODB_URI": mongo_uri}))
+    stack.callback(db_utils.reset_mongo_client)
+
+    database = db_utils.get_mongo_conn(storage.GAMELOOT_COLLECTION).database
+    for collection in (
+        storage.GAMELOOT_COLLECTION,
+        storage.PAGE_CACHE_COLLECTION,
+        storage.WATCH_RULES_COLLECTION,
+        storage.RUN_JOURNAL_COLLECTION,
+        storage.LEASES_COLLECTION,
+        price_history.PRICE_HISTORY_COLLECTION,
+    ):
+        database.drop_collection(collection)
+
+    if counter is not None:
+        real_get_mongo_conn = db_utils.get_mongo_conn
+
+        def counting_get_mongo_conn(collection, *a, **kw):
+            return _CountingCollection(real_get_mongo_conn(collection, *a, **kw), counter)
+
+        stack.enter_context(mock.patch.object(storage, "get_mongo_conn", counting_get_mongo_conn))
+    # mongomock has no explain(), so skip the index verification there
+    store = storage.MongoStockStore(verify_indexes=mongo != "mock")
+    stack.enter_context(mock.patch.object(storage, "_store", store))
+    store.prepare()
+    return store
+
+
+def bench_e2e(args):
+    """Run process_category_stock end to end against the stand-in server and report per-run metrics."""
+    with ExitStack() as stack:
+        db_ops = {}
+        store = _open_store(stack, args.storage, args.mongo, db_ops)
+        if store is None:
+            return 2
+
+        alerts = []
+
+        def record_alert(message, chat_ids=None, on_done=None, resume=None):
+            alerts.append(message)
+            if on_done is not None:
+                on_done(True)
+
+        stack.enter_context(mock.patch.object(site_engine, "queue_telegram_message", record_alert))
+        stack.enter_context(mock.patch.object(http_client._rate_limiter, "rate", args.rate_limit))
+
+        server = BenchServer(args.pages, args.products, args.latency, args.error_rate).start()
+        stack.callback(server.stop)
+        # Every scenario is a full crawl, the incremental command covers partial runs
+        category = CategorySpec(load_site_spec("gameloot"), "gpu", server.category_url(), incremental_pages=0)
+
+        results = {}
+        failed = False
+        for scenario in ("cold", "unchanged", "changed"):
+            if scenario == "changed":
+                server.mutate()
+            db_ops.clear()
+            alerts.clear()
+            requests_before = server.requests
+            products = len(server.catalog("graphics-card"))
+            stages_before = {stage: metrics.RUN_STAGE_SECONDS.totals(job=category.job_name, stage=stage)[1] for stage in RUN_STAGES}
+            start = perf_counter()
+            outcome = site_engine.process_category_stock(category)
+            wall = perf_counter() - start
+            stages = {
+                stage: round(metrics.RUN_STAGE_SECONDS.totals(job=category.job_name, stage=stage)[1] - stages_before[stage], 3) for stage in RUN_STAGES
+            }
+            results[scenario] = {
+                "outcome": outcome or "OK",
+                "wall_s": round(wall, 3),
+                "requests": server.requests - requests_before,
+                "db_ops": sum(db_ops.values()),
+                "peak_rss_mb": round(_peak_rss_mb(), 1),
+                "products_per_s": round(products / wall, 1),
+                "alerts": len(alerts),
+                "db_ops_detail": dict(db_ops),
+                "stages_s": {stage: seconds for stage, seconds in stages.items() if seconds},
+            }
+            if outcome is None:
+                mismatched = _stock_mismatches(store, server.catalog("graphics-card"))
+                if mismatched:
+                    print(f"{scenario}: stored in-stock products differ from the served catalog for {mismatched} link(s)")
+                    failed = True
+
+    storage_label = "sqlite" if args.storage == "sqlite" else f"mongo {args.mongo}"
+    print(f"{args.pages} pages x {args.products} products, latency {args.latency}s, error rate {args.error_rate}, storage {storage_label}")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    for scenario, result in results.items():
+        parts = []
+        for metric in E2E_METRICS:
+            part = f"{metric}={result[metric]}"
+            if baseline and scenario in baseline and baseline[scenario].get(metric):
+                change = (result[metric] - baseline[scenario][metric]) / baseline[scenario][metric] * 100
+                part += f" ({change:+.0f}%)"
+            parts.append(part)
+        print(f"{scenario:>9} [{result['outcome']}]: " + ", ".join(parts) + f", db ops {result['db_ops_detail']}")
+        print(f"{'':>9}  stages (s): {result['stages_s']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2, default=str)
+        print(f"Wrote {args.output}")
+    return 1 if failed else 0
+
+
+def _catalog_links(server, category="graphics-card"):
+    return {f"https://gameloot.in/product/item-{product_id}/" for product_id, _ in server.catalog(category)}
+
+
+def bench_incremental(args):
+    """Full sweep, then incremental runs after small and large catalog changes, then a forced full sweep."""
+    with ExitStack() as stack:
+        store = _open_store(stack, args.storage, args.mongo)
+        if store is None:
+            return 2
+        stack.enter_context(mock.patch.object(site_engine, "queue_telegram_message", _deliver))
+        stack.enter_context(mock.patch.object(http_client._rate_limiter, "rate", 0))
+        server = BenchServer(args.pages, args.products, args.latency).start()
+        stack.callback(server.stop)
+        category = CategorySpec(
+            load_site_spec("gameloot"), "gpu", server.category_url(), incremental_pages=args.incremental_pages, full_sweep_minutes=24 * 60
+        )
+
+        failed = False
+        rows = []
+        # (run, new listings added before it)
+        for run, new in (("full", 0), ("incremental", 0.03), ("incremental", 0.15), ("full", 0)):
+            catalog_before = _catalog_links(server)
+            if new:
+                server.mutate(new=new)
+            if run == "full":
+                category.last_full_sweep = None
+            stored_before = {link for link, doc in store.load_stock_state("gpu").items() if doc["inStock"]}
+            requests_before = server.requests
+            start = perf_counter()
+            outcome = site_engine.process_category_stock(category)
+            wall = perf_counter() - start
+            requests = server.requests - requests_before
+            stored = {link for link, doc in store.load_stock_state("gpu").items() if doc["inStock"]}
+            if outcome is not None:
+                print(f"{run}: ended with {outcome}")
+                failed = True
+            elif run == "full" and _stock_mismatches(store, server.catalog("graphics-card")):
+                print(f"{run}: stored in-stock products differ from the served catalog")
+                failed = True
+            elif run == "incremental":
+                if not stored_before <= stored:
+                    print(f"{run}: {len(stored_before - stored)} product(s) marked sold by an incremental run")
+                    failed = True
+                missing = _catalog_links(server) - catalog_before - stored
+                if missing:
+                    print(f"{run}: {len(missing)} new listing(s) not found")
+                    failed = True
+            rows.append((run, new, requests, wall, len(stored - stored_before), len(stored_before - stored)))
+
+    print(f"{args.pages} pages x {args.products} products, first {args.incremental_pages} page(s) per incremental run, storage {args.storage}")
+    for run, new, requests, wall, added, removed in rows:
+        print(f"{run:>12} (+{new:.0%} new): {requests:3d} requests, {wall:6.2f}s, {added} product(s) added, {removed} marked sold")
+    return 1 if failed else 0
+
+
+def _bench_site_specs(server, sites, categories, max_connections):
+    """Site specs built from the Gameloot spec, each pointing at its own stand-in categories."""
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "sites", "gameloot.json")) as f:
+        template = json.load(f)
+    specs = []
+    for site_number in range(sites):
+        name = f"bench{site_number}"
+        doc = {key: value for key, value in template.items() if key != "type_prefix"}
+        doc.update(
+            name=name,
+            max_connections=max_connections,
+            categories=[{"type": f"c{n}", "url": server.category_url(f"{name}.c{n}")} for n in range(categories)],
+        )
+        specs.append(SiteSpec(doc))
+    return specs
+
+
+def bench_sites(args):
+    """Run several site specs one category at a time and all at once, checking per-site connection limits."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    results = {}
+    failed = False
+    for mode in ("serial", "concurrent"):
+        with ExitStack() as stack:
+            if _open_store(stack, args.storage, args.mongo) is None:
+                return 2
+            stack.enter_context(mock.patch.object(site_engine, "queue_telegram_message", _deliver))
+            stack.enter_context(mock.patch.object(http_client._rate_limiter, "rate", 0))
+            server = BenchServer(args.pages, args.products, args.latency).start()
+            stack.callback(server.stop)
+            specs = _bench_site_specs(server, args.sites, args.categories, args.max_connections)
+            categories = [category for site in specs for category in site.categories]
+
+            start = perf_counter()
+            if mode == "serial":
+                outcomes = [site_engine.process_category_stock(category) for category in categories]
+            else:
+                with ThreadPoolExecutor(max_workers=len(categories)) as executor:
+                    outcomes = list(executor.map(site_engine.process_category_stock, categories))
+            wall = perf_counter() - start
+
+            store = storage.get_stock_store()
+            for category, outcome in zip(categories, outcomes):
+                catalog = server.catalog(category.url.rsplit("/", 1)[-1])
+                if outcome is not None or _stock_mismatches(store, catalog, category.store_type):
+                    print(f"{mode}: {category.job_name} ended with {outcome or 'OK'} and does not match the served catalog")
+                    failed = True
+            peak = max(server.peak_in_flight.values())
+            if peak > args.max_connections:
+                print(f"{mode}: {peak} requests in flight to one site, limit is {args.max_connections}")
+                failed = True
+            results[mode] = (wall, server.requests, peak)
+
+    products = args.sites * args.categories * args.pages * args.products
+    print(
+        f"{args.sites} sites x {args.categories} categories x {args.pages} pages x {args.products} products, "
+        f"latency {args.latency}s, max {args.max_connections} connections per site, storage {args.storage}"
+    )
+    for mode, (wall, requests, peak) in results.items():
+        print(f"{mode:>10}: {wall:6.2f}s, {requests} requests, {products / wall:8.1f} products/s, peak {peak} in flight per site")
+    return 1 if failed else 0
+
+
+def _synthetic_records(count, start=0, price_shift=0, product_type="gpu"):
+    return [
+        ProductRecord(f"Graphics Card Model {i} 8GB", 10000 + i + price_shift, f"https://gameloot.in/product/item-{i}/", type=product_type)
+        for i in range(start, start + count)
+    ]
+
+
+def _check_store(store):
+    """Storage conformance checks: the same stock, price history and page cache semantics on every backend."""
+    problems = []
+
+    def expect(condition, message):
+        if not condition:
+            problems.append(message)
+
+    links = [f"https://gameloot.in/product/item-{i}/" for i in range(6)]
+    expect(store.load_stock_state("gpu") == {}, "fresh store is not empty")
+
+    # Cold run: six new products
+    diff = compute_stock_diff(_synthetic_records(6), store.load_stock_state("gpu"))
+    stock_diff.apply_stock_diff(store, diff, "gpu")
+    state = store.load_stock_state("gpu")
+    expect(sorted(state) == sorted(links), "new products not stored")
+    expect(all(doc["inStock"] is True for doc in state.values()), "new products not in stock")
+    expect(state[links[0]]["price"] == 10000, "new product price wrong")
+    expect(store.load_stock_state("cpu") == {}, "products leak across types")
+
+    # Second run: item-0 repriced, item-1 and item-2 sold, item-6 new
+    scraped = _synthetic_records(1, 0, price_shift=-500) + _synthetic_records(3, 3) + _synthetic_records(1, 6)
+    diff = compute_stock_diff(scraped, store.load_stock_state("gpu"))
+    expect(len(diff.new) == 1 and len(diff.price_changed) == 1 and len(diff.sold) == 2 and diff.unchanged == 3, f"diff wrong: {diff.summary()}")
+    stock_diff.load_sold_names(store, diff, "gpu")
+    expect(sorted(stored["name"] for stored in diff.sold) == ["Graphics Card Model 1 8GB", "Graphics Card Model 2 8GB"], "sold names not loaded")
+    stock_diff.apply_stock_diff(store, diff, "gpu")
+    state = store.load_stock_state("gpu")
+    expect(state[links[0]]["price"] == 9500, "price change not stored")
+    expect(state[links[1]]["inStock"] is False and state[links[2]]["inStock"] is False, "sold products still in stock")
+    expect(len(state) == 7, "sold products removed instead of marked")
+
+    # Third run: item-1 back in stock
+    diff = compute_stock_diff(_synthetic_records(1, 1), {links[1]: state[links[1]]})
+    expect(len(diff.restocked) == 1, "restock not detected")
+    stock_diff.apply_stock_diff(store, diff, "gpu")
+    expect(store.load_stock_state("gpu")[links[1]]["inStock"] is True, "restock not stored")
+
+    history = store.load_price_history("gpu", links[1])
+    expect([(point["price"], point["inStock"]) for point in history] == [(10001, True), (10001, False), (10001, True)], f"price history wrong: {history}")
+    expect(all(a["at"] <= b["at"] for a, b in zip(history, history[1:])), "price history not in time order")
+    expect([point["price"] for point in store.load_price_history("gpu", links[0])] == [10000, 9500], "price change not in history")
+    replayed = store.record_price_history([("gpu", links[1], point) for point in history], skip_recorded=True)
+    expect(replayed == 0 and len(store.load_price_history("gpu", links[1])) == 3, "price points recorded again on a replay")
+    lowest = store.load_lowest_prices("gpu", [links[0], links[1], "https://gameloot.in/product/missing/"])
+    expect(lowest == {links[0]: 9500, links[1]: 10001}, f"lowest prices wrong: {lowest}")
+
+    # Downsampling: six points a day for ten days (the last three within the window), with one stock flip
+    now = datetime.utcnow().replace(microsecond=0)
+    start = now - timedelta(days=price_history.PRICE_HISTORY_DOWNSAMPLE_DAYS + 7)
+    points = [
+        ("gpu", "https://gameloot.in/product/old/", price_history.price_point(1000 + i, start + timedelta(hours=4 * i), i != 13))
+        for i in range(60)
+    ]
+    store.record_price_history(points)
+    cutoff = now - timedelta(days=price_history.PRICE_HISTORY_DOWNSAMPLE_DAYS)
+    expected = price_history.downsample_points([point for _, _, point in points], cutoff)
+    expect(len(expected) < len(points), "downsampling check has nothing to remove")
+    store.maintain_price_history(now=now)
+    kept = store.load_price_history("gpu", "https://gameloot.in/product/old/")
+    expect([(p["price"], p["at"]) for p in kept] == [(p["price"], p["at"]) for p in expected], f"downsampling kept {len(kept)} points, expected {len(expected)}")
+
+    # Page cache
+    entries = [{"url": "https://gameloot.in/page/1/", "etag": '"x"', "lastModified": None, "digest": "d", "products": [{"name": "a", "price": 1, "link": "l", "inStock": True}], "lastPage": 2}]
+    expect(store.load_page_cache("gpu-url") == [], "missing page cache is not empty")
+    store.save_page_cache("gpu-url", entries)
+    expect(store.load_page_cache("gpu-url") == entries, "page cache round trip differs")
+    store.save_page_cache("gpu-url", entries[:0])
+    expect(store.load_page_cache("gpu-url") == [], "page cache not replaced")
+    store.delete_page_cache("gpu-url")
+    expect(store.load_page_cache("gpu-url") == [], "page cache not deleted")
+
+    # Watch rules
+    rule = watchlist.WatchRule("r1", 42, ["rtx", "3080"], type="gpu", max_price=40000).to_dict()
+    expect(store.load_watch_rules() == [], "fresh store has watch rules")
+    store.save_watch_rule(rule)
+    store.save_watch_rule({**rule, "maxPrice": 35000})
+    expect(store.load_watch_rules() == [{**rule, "maxPrice": 35000}], "watch rule not stored or not replaced")
+    expect(store.delete_watch_rule("r1") and not store.delete_watch_rule("r1"), "watch rule delete result wrong")
+    expect(store.load_watch_rules() == [], "watch rule not deleted")
+
+    # Run journal: dotted $set paths, replacement of nested fields, delete
+    expect(store.load_run_journal("job") is None, "fresh store has a run journal")
+    store.save_run_journal("job", {"runId": "a", "phase": "scraping", "pages": {"1": {"products": [], "lastPage": 3}}})
+    store.save_run_journal("job", {"pages.2": {"products": [], "lastPage": None}, "alerts.a-0": {"text": "x", "sent": False}})
+    store.save_run_journal("job", {"alerts.a-0.sent": True, "phase": "diffed"})
+    expected = {
+        "runId": "a",
+        "phase": "diffed",
+        "pages": {"1": {"products": [], "lastPage": 3}, "2": {"products": [], "lastPage": None}},
+        "alerts": {"a-0": {"text": "x", "sent": True}},
+    }
+    expect(store.load_run_journal("job") == expected, f"run journal updates wrong: {store.load_run_journal('job')}")
+    store.save_run_journal("job", {"pages": {}})
+    expect(store.load_run_journal("job")["pages"] == {}, "run journal field not replaced")
+    store.delete_run_journal("job")
+    expect(store.load_run_journal("job") is None, "run journal not deleted")
+
+    # atomic(): a failure inside the block must not leave its writes behind where the backend has transactions
+    try:
+        with store.atomic() as transactional:
+            store.save_run_journal("job", {"phase": "applied"})
+            raise RuntimeError("abort")
+    except RuntimeError:
+        pass
+    if transactional:
+        expect(store.load_run_journal("job") is None, "atomic() block not rolled back")
+    store.delete_run_journal("job")
+
+    # Leases: one holder at a time, taken over once expired with a new fencing token
+    token = store.acquire_lease("category:job", "w1", 60)
+    expect(token is not None, "free lease not acquired")
+    token = store.acquire_lease("category:job", "w1", 60)
+    expect(token is not None, "holder could not re-acquire its lease")
+    expect(store.acquire_lease("category:job", "w2", 60) is None, "held lease acquired by another worker")
+    expect(store.renew_leases(["category:job", "category:other"], "w1", 60) == {"category:job"}, "renewal wrong")
+    expect(store.renew_leases(["category:job"], "w2", 60) == set(), "lease renewed by a worker not holding it")
+    store.acquire_lease("category:expired", "w1", -1)
+    expired_token = store.acquire_lease("category:expired", "w2", 60)
+    expect(expired_token is not None, "expired lease not taken over")
+    leases_by_name = {lease["name"]: lease for lease in store.load_leases()}
+    expect(leases_by_name.get("category:expired", {}).get("owner") == "w2", f"lease owner wrong: {leases_by_name}")
+    expect(leases_by_name.get("category:expired", {}).get("token") == expired_token, "fencing token not stored")
+    store.acquire_lease("category:job", "w1", -1)
+    expect(store.acquire_lease("category:job", "w2", 60) not in (None, token), "fencing token not bumped on takeover")
+    store.release_lease("category:job", "w1")
+    expect(store.acquire_lease("category:job", "w1", 60) is None, "lease released by a worker not holding it")
+    store.release_lease("category:job", "w2")
+    expect(store.acquire_lease("category:job", "w1", 60) is not None, "released lease not free")
+    for name in ("category:job", "category:expired"):
+        store.release_lease(name, "w1")
+        store.release_lease(name, "w2")
+    expect(store.load_leases() == [], f"leases left behind: {store.load_leases()}")
+
+    # Model keys: written with the products, set afterwards by backfill and folded into per-model price ranges
+    ram = _synthetic_records(3, 20, product_type="ram")
+    ram[0].model = ram[1].model = "gskill|ddr4|16gb|3200"
+    stock_diff.apply_stock_diff(store, compute_stock_diff(ram, {}), "ram")
+    ram_links = [product.link for product in ram]
+    names = sorted(store.load_model_names("ram"))
+    expect(names == [(product.link, product.name, product.model) for product in ram], f"model names wrong: {names}")
+    store.write_model_keys("ram", {ram_links[2]: "name:graphics card model 22 8gb"})
+    expect(store.load_model_names("ram")[-1][2] is not None, "model key not written")
+    repriced = compute_stock_diff([ProductRecord(ram[1].name, 9000, ram_links[1], type="ram")], store.load_stock_state("ram"))
+    stock_diff.apply_stock_diff(store, repriced, "ram")
+    expect({product["link"]: product["modelKey"] for product in store.load_stock("ram")}[ram_links[1]] == ram[0].model, "model key lost by a write without one")
+    ranges = store.load_model_price_ranges("ram", [ram[0].model, "name:graphics card model 22 8gb", "msi|rtx 3060|12gb|-"])
+    expected = {ram[0].model: {"low": 9000, "high": 10021, "listings": 2}, "name:graphics card model 22 8gb": {"low": 10022, "high": 10022, "listings": 1}}
+    expect(ranges == expected, f"model price ranges wrong: {ranges}")
+    expect(store.load_model_price_ranges("gpu", [ram[0].model]) == {}, "model price ranges leak across types")
+    return problems
+
+
+def _store_throughput(store, count):
+    """Time a cold write, a state load and a 5% change write of ``count`` products."""
+    timings = {}
+    start = perf_counter()
+    diff = compute_stock_diff(_synthetic_records(count, product_type="bench"), store.load_stock_state("bench"))
+    stock_diff.apply_stock_diff(store, diff, "bench")
+    timings["cold write"] = perf_counter() - start
+
+    start = perf_counter()
+    state = store.load_stock_state("bench")
+    timings["state load"] = perf_counter() - start
+
+    changed = count // 20
+    scraped = _synthetic_records(changed, 0, 100, "bench") + _synthetic_records(count - 2 * changed, changed, 0, "bench")
+    start = perf_counter()
+    diff = compute_stock_diff(scraped, state)
+    stock_diff.apply_stock_diff(store, diff, "bench")
+    timings["5% change"] = perf_counter() - start
+    return timings
+
+
+def bench_storage(args):
+    """Run the storage conformance checks against every backend and compare their throughput."""
+    failed = False
+    throughput = {}
+    for backend in ("mongo", "sqlite"):
+        with ExitStack() as stack:
+            store = _open_store(stack, backend, args.mongo)
+            if store is None:
+                return 2
+            label = "sqlite" if backend == "sqlite" else f"mongo ({args.mongo})"
+            problems = _check_store(store)
+            for problem in problems:
+                print(f"{label}: {problem}")
+            failed = failed or bool(problems)
+            print(f"{label}: conformance {'FAILED' if problems else 'ok'}")
+            throughput[label] = _store_throughput(store, args.products)
+
+    print(f"Throughput with {args.products} products (products/s):")
+    if args.mongo == "mock":
+        print("  (mongomock is an in-process fake, pass --mongo URI for real MongoDB numbers)")
+    for label, timings in throughput.items():
+        print(f"  {label:>16}: " + ", ".join(f"{name} {args.products / seconds:10.0f}" for name, seconds in timings.items()))
+    return 1 if failed else 0
+
+
+WATCH_BRANDS = ["asus", "msi", "zotac", "gigabyte", "sapphire", "galax", "inno3d", "powercolor", "xfx", "palit"]
+WATCH_MODELS = ["rtx 3060", "rtx 3070", "rtx 3080", "rtx 3090", "rtx 4060", "rtx 4070", "rtx 4080", "rtx 4090", "gtx 1660", "rx 6600", "rx 6700", "rx 6800", "rx 7900"]
+WATCH_EDITIONS = ["ti", "super", "xt", "oc", "gaming", "twin", "eagle", "ventus", "strix", "tuf", "pulse", "nitro"]
+
+
+def _watch_products(rng, count):
+    """A synthetic run's diff: new, restocked and repriced GPUs (half of the repriced ones cheaper)."""
+    diff = StockDiff()
+    for i in range(count):
+        name = f"{rng.choice(WATCH_BRANDS).upper()} {rng.choice(WATCH_MODELS).upper()} {rng.choice(WATCH_EDITIONS).title()} {rng.choice((6, 8, 12, 16, 24))}GB"
+        record = ProductRecord(name, rng.randrange(10000, 150000, 500), f"https://gameloot.in/product/watch-{i}/", type="gpu")
+        kind = i % 3
+        if kind == 0:
+            diff.new.append(record)
+        elif kind == 1:
+            diff.restocked.append(record)
+        else:
+            diff.price_changed.append(record)
+            diff.previous_prices[record.link] = record.price + rng.choice((-2000, 2000))
+    return diff
+
+
+def _watch_rules(rng, count):
+    """Watchlist-like rules: mostly a model plus a brand or edition, some price-only and price-drop rules."""
+    rules = []
+    for i in range(count):
+        chat_id = rng.randrange(count // 10 + 1)
+        shape = rng.random()
+        model = rng.choice(WATCH_MODELS)
+        if shape < 0.8:
+            keywords = [model, rng.choice(WATCH_BRANDS)] + rng.sample(WATCH_EDITIONS, rng.randint(0, 1))
+            max_price = rng.choice((None, rng.randrange(20000, 150000, 1000)))
+            rules.append(watchlist.WatchRule(f"r{i}", chat_id, keywords, type=rng.choice((None, "gpu")), max_price=max_price))
+        elif shape < 0.9:
+            rules.append(watchlist.WatchRule(f"r{i}", chat_id, [model], pattern=r"\b(oc|gaming)\b", drop_percent=rng.choice((0, 5, 10))))
+        elif shape < 0.97:
+            rules.append(watchlist.WatchRule(f"r{i}", chat_id, type=rng.choice(("gpu", "cpu")), max_price=rng.randrange(5000, 15000, 500)))
+        else:
+            rules.append(watchlist.WatchRule(f"r{i}", chat_id, [rng.choice(WATCH_BRANDS), rng.choice(WATCH_EDITIONS)], drop_percent=rng.choice((0, 5))))
+    return rules
+
+
+def _watch_scan(rules, diff, product_type, lowest):
+    """Reference matcher: every rule against every changed product."""
+    alerts = set()
+    for product, _ in watchlist._diff_events(diff):
+        tokens = frozenset(watchlist.tokenize(product.name))
+        for rule in rules:
+            if not rule.matches(product, tokens, product_type):
+                continue
+            if rule.drop_percent is not None:
+                floor = lowest.get(product.link)
+                if floor is None or product.price > floor * (1 - rule.drop_percent / 100):
+                    continue
+            alerts.add((rule.chat_id, product.link))
+    return alerts
+
+
+def bench_watch(args):
+    """Compare indexed watch rule matching with a rules x products scan."""
+    rng = random.Random(0)
+    diff = _watch_products(rng, args.products)
+    lowest = {product.link: product.price + rng.randrange(-5000, 15000, 500) for product in diff.new + diff.restocked + diff.price_changed}
+    events = len(watchlist._diff_events(diff))
+    failed = False
+    logging.getLogger().setLevel(logging.ERROR)
+    print(f"{events} changed product(s) to match")
+    for count in args.rules:
+        rules = _watch_rules(rng, count)
+        start = perf_counter()
+        index = watchlist.WatchIndex(rules)
+        build = perf_counter() - start
+
+        lookups = []
+        checks = 0
+        start = perf_counter()
+        alerts = watchlist.match_watch_rules(index, diff, "gpu", lambda links: lookups.append(len(links)) or lowest)
+        indexed = perf_counter() - start
+        for product, _ in watchlist._diff_events(diff):
+            checks += index.match(product, "gpu")[1]
+
+        start = perf_counter()
+        expected = _watch_scan(rules, diff, "gpu", lowest)
+        scan = perf_counter() - start
+
+        got = {(chat_id, product.link) for chat_id, entries in alerts.items() for product, _, _ in entries}
+        if got != expected:
+            print(f"{count} rules: indexed alerts differ from the scan ({len(got ^ expected)} pair(s))")
+            failed = True
+        if len(lookups) > 1:
+            print(f"{count} rules: {len(lookups)} lowest price lookups, expected at most 1")
+            failed = True
+        print(
+            f"{count:>8} rules: index built in {build * 1000:7.1f} ms, matched in {indexed * 1000:7.1f} ms "
+            f"({checks} candidate checks), scan {scan * 1000:8.1f} ms ({count * events} checks), "
+            f"{len(expected)} alert(s), {scan / indexed:5.1f}x faster"
+        )
+    return 1 if failed else 0
+
+
+# (listing name, expected model key): relists of the same card must share a key
+IDENTITY_SAMPLES = [
+    ("ZOTAC Gaming GeForce RTX 3060 Ti Twin Edge 8GB", "zotac|rtx 3060|8gb|ti"),
+    ("Zotac RTX 3060Ti Twin Edge OC 8 GB", "zotac|rtx 3060|8gb|ti"),
+    ("MSI GeForce RTX 3060 Ventus 2X 12G OC", "msi|rtx 3060|12gb|-"),
+    ("ASUS TUF Gaming RTX 4070 SUPER 12GB", "asus|rtx 4070|12gb|super"),
+    ("Sapphire Pulse RX 6700XT 12GB", "sapphire|rx 6700|12gb|xt"),
+    ("Sapphire Nitro+ RX 7900 XTX 24GB", "sapphire|rx 7900|24gb|xtx"),
+    ("AMD Ryzen 5 5600G Processor", "amd|ryzen 5 5600g|-|-"),
+    ("Intel Core i5-12400F Processor", "intel|i5 12400f|-|-"),
+    ("G.Skill Ripjaws V 2x8GB DDR4 3200MHz", "gskill|ddr4|16gb|3200"),
+    ("ASUS ROG Strix B550-F Gaming WiFi", "asus|b550|-|-"),
+    ("Graphics Card Model 12 8GB", "name:graphics card model 12 8gb"),
+]
+IDENTITY_WORDS = (
+    "gaming", "mouse", "keyboard", "headset", "wireless", "rgb", "pro", "elite", "mechanical", "controller", "monitor",
+    "cabinet", "cooler", "liquid", "tower", "mini", "edition", "black", "white", "ultra", "core", "series", "optical",
+)
+
+
+def _identity_names(rng, count):
+    """Unparsed (non-chipset) listing names: a made-up brand, a few catalog words and a model number."""
+    names = []
+    for _ in range(count):
+        brand = "".join(rng.choice("bcdfgklmnprstvz") + rng.choice("aeiou") for _ in range(3))
+        words = rng.sample(IDENTITY_WORDS, 3)
+        names.append(f"{brand.title()} {' '.join(words).title()} {rng.choice('KMPQRSTVW')}{rng.randrange(100, 10000)}")
+    return names
+
+
+def _identity_relist(rng, name):
+    """The same listing as a seller might retype it: words swapped or dropped, "(Used)" added, other spacing."""
+    words = name.split()
+    edit = rng.randrange(3)
+    if edit == 0:
+        i = rng.randrange(1, len(words) - 2)
+        words[i], words[i + 1] = words[i + 1], words[i]
+    elif edit == 1:
+        del words[rng.randrange(1, len(words) - 1)]
+    else:
+        words.append("(Used)")
+    return "  ".join(words).upper() if rng.random() < 0.5 else " ".join(words)
+
+
+def _identity_scan(known, name):
+    """Reference resolution of an unparsed name: exact normalized name, else the best Dice score over every known name."""
+    text = product_identity.normalize_name(name)
+    for known_text, key in known:
+        if known_text == text:
+            return key
+    grams = product_identity.trigrams(text)
+    numbers = frozenset(re.findall(r"\d+", text))
+    best, best_rank = None, None
+    for name_id, (known_text, key) in enumerate(known):
+        if frozenset(re.findall(r"\d+", known_text)) != numbers:
+            continue
+        candidate = product_identity.trigrams(known_text)
+        score = 2 * len(grams & candidate) / (len(grams) + len(candidate))
+        if score >= product_identity.MODEL_MATCH_THRESHOLD and (best_rank is None or (score, -name_id) > best_rank):
+            best, best_rank = key, (score, -name_id)
+    return best or product_identity.NAME_KEY_PREFIX + text
+
+
+def _relist_alerts(store):
+    """Run process_category_stock over three fixed scrapes and return the alerts of the last one."""
+    runs = [
+        [("ZOTAC Gaming GeForce RTX 3060 Ti Twin Edge 8GB", 25000, "zotac-a"), ("Logitech G502 HERO Gaming Mouse", 3000, "mouse-a")],
+        [("ZOTAC Gaming GeForce RTX 3060 Ti Twin Edge 8GB", 24000, "zotac-a"), ("Logitech G502 HERO Gaming Mouse", 3000, "mouse-a")],
+        [
+            ("Zotac RTX 3060Ti Twin Edge OC 8 GB", 23000, "zotac-b"),
+            ("Logitech G502 Hero Mouse Gaming", 2800, "mouse-b"),
+            ("Logitech G503 Hero Mouse Gaming", 2900, "mouse-c"),
+            ("MSI GeForce RTX 4070 Ventus 2X 12GB", 52000, "msi-a"),
+        ],
+    ]
+    delivered = []
+    category = CategorySpec(load_site_spec("gameloot"), "gpu", "https://gameloot.in/product-category/graphics-card/", incremental_pages=0)
+    for products in runs:
+        records = [ProductRecord(name, price, f"https://gameloot.in/product/{slug}/") for name, price, slug in products]
+        delivered.clear()
+        with mock.patch.object(site_engine, "iter_category_pages", lambda *a, **kw: iter([(1, records)])), mock.patch.object(
+            site_engine, "queue_telegram_message", lambda message, chat_ids=None, on_done=None, resume=None: delivered.append(message)
+        ):
+            site_engine.process_category_stock(category)
+    return "\n".join(delivered)
+
+
+def bench_identity(args):
+    """Model keys of sample names, the trigram index against a linear scan and the relisting note in alerts."""
+    failed = False
+    logging.getLogger().setLevel(logging.ERROR)
+    for name, expected in IDENTITY_SAMPLES:
+        got = product_identity.model_key(name)
+        if got != expected:
+            print(f"{name!r}: key {got!r}, expected {expected!r}")
+            failed = True
+    index = product_identity.ModelIndex()
+    index.add("https://gameloot.in/product/a/", "MSI GeForce RTX 3060 Ventus 2X 12G OC")
+    joined = index.resolve("MSI RTX 3060 Ventus 2X OC")
+    if joined != "msi|rtx 3060|12gb|-":
+        print(f"name without a memory size not joined to the only known size: {joined!r}")
+        failed = True
+    print(f"{len(IDENTITY_SAMPLES)} sample names keyed{'' if failed else ' as expected'}")
+
+    rng = random.Random(0)
+    print(f"{'known names':>12}  {'build':>9}  {'index':>10}  {'scan':>10}  {'matched':>8}")
+    for size in args.sizes:
+        names = _identity_names(rng, size)
+        start = perf_counter()
+        index = product_identity.ModelIndex()
+        for i, name in enumerate(names):
+            index.add(f"https://gameloot.in/product/n-{i}/", name)
+        build = perf_counter() - start
+        known = [(text, key) for text, (_, key) in index._names.items()]
+        queries = [_identity_relist(rng, rng.choice(names)) for _ in range(args.queries // 2)] + _identity_names(rng, args.queries - args.queries // 2)
+
+        start = perf_counter()
+        got = [index.resolve(name) for name in queries]
+        indexed = (perf_counter() - start) / len(queries)
+        start = perf_counter()
+        expected = [_identity_scan(known, name) for name in queries]
+        scan = (perf_counter() - start) / len(queries)
+        differ = [name for name, a, b in zip(queries, got, expected) if a != b]
+        if differ:
+            print(f"{size} names: {len(differ)} lookup(s) differ from the scan, e.g. {differ[0]!r}")
+            failed = True
+        matched = sum(not key.startswith(product_identity.NAME_KEY_PREFIX + product_identity.normalize_name(name)) for name, key in zip(queries, got))
+        print(f"{size:>12}  {build * 1000:7.0f}ms  {indexed * 1e6:8.1f}us  {scan * 1e6:8.1f}us  {matched:>4}/{len(queries)}")
+
+    with ExitStack() as stack:
+        store = _open_store(stack, args.storage, args.mongo)
+        if store is None:
+            return 2
+        alerts = _relist_alerts(store)
+    expectations = [
+        ("zotac-b/ (seen before at 24000-25000, 1 listing(s))", "relisted card without its earlier price range"),
+        ("mouse-b/ (seen before at 3000-3000, 1 listing(s))", "retyped unparsed name not matched to the earlier listing"),
+        ("mouse-c/\n", "name with another model number matched"),
+        ("msi-a/\n", "model never seen before has a price range"),
+    ]
+    for text, problem in expectations:
+        if text not in alerts + "\n":
+            print(f"relisting alert: {problem}")
+            failed = True
+    print(f"relisting alerts ({args.storage}): {'ok' if not failed else 'FAILED'}")
+    return 1 if failed else 0
+
+
+def _import_times(module):
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    Returns:
+        tuple: ({module name: cumulative import microseconds} of the module and the imports under it,
+        names of every module loaded)
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    code = f"import sys, {module}; print(' '.join(sys.modules))"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, cwd=here, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        fields = line[len("import time:") :].split("|") if line.startswith("import time:") else ()
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            name = fields[2].strip()
+            times[name] = int(fields[1])
+            # A top-level line closes a tree: the interpreter's own start-up imports (site) come before the module's
+            if not fields[2].startswith("  ") and name != module:
+                times = {}
+    return times, set(proc.stdout.split())
+
+
+def _wall_time(code, runs):
+    """Median wall time of running ``python -c code`` in a fresh interpreter."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    for _ in range(runs):
+        start = perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=here, check=True, capture_output=True)
+        timings.append(perf_counter() - start)
+    return statistics.median(timings)
+
+
+def bench_startup(args):
+    """Import time of the scraper entry point against a budget, lazy packages and the one-shot mode."""
+    failed = False
+    runs = [_import_times("scraper") for _ in range(args.runs)]
+    total_ms = statistics.median(times["scraper"] for times, _ in runs) / 1000
+    loaded = runs[0][1]
+    here = os.path.dirname(os.path.abspath(__file__))
+    first_party = {name[:-3] for name in os.listdir(here) if name.endswith(".py")}
+    packages = collections.defaultdict(list)
+    for times, _ in runs:
+        for name, micros in times.items():
+            if "." not in name and name not in first_party:
+                packages[name].append(micros)
+    slowest = sorted(((statistics.median(micros) / 1000, name) for name, micros in packages.items()), reverse=True)[: args.top]
+    bare = _wall_time("pass", args.runs)
+    wall = _wall_time("import scraper", args.runs)
+
+    print(f"import scraper: {total_ms:.0f} ms (-X importtime, median of {args.runs}), budget {args.budget_ms:.0f} ms")
+    print(f"  wall: {wall * 1000:.0f} ms with the interpreter start, {bare * 1000:.0f} ms for a bare interpreter")
+    print("  slowest packages: " + ", ".join(f"{name} {ms:.0f} ms" for ms, name in slowest))
+    if total_ms > args.budget_ms:
+        print(f"import time {total_ms:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    eager = [name for name in STARTUP_LAZY_PACKAGES if name in loaded]
+    if eager:
+        print(f"imported up front instead of on first use: {', '.join(eager)}")
+        failed = True
+
+    # One-shot mode: the selected trackers only, and an exit status that tells cron whether they ran
+    with ExitStack() as stack:
+        store = _open_store(stack, "sqlite", None)
+        stack.enter_context(mock.patch.object(site_engine, "queue_telegram_message", _deliver))
+        stack.enter_context(mock.patch.object(http_client._rate_limiter, "rate", 0))
+        server = BenchServer(args.pages, args.products).start()
+        stack.callback(server.stop)
+        site = _bench_site_specs(server, 1, 2, 2)[0]
+        stack.enter_context(mock.patch.object(scraper, "load_site_specs", lambda: [site]))
+        first, second = site.categories
+
+        def stored(category):
+            return len(store.load_stock_state(category.store_type))
+
+        checks = []
+        checks.append(("one tracker by type", scraper.run_once([first.type]) == 0 and stored(first) and not stored(second)))
+        checks.append(("every tracker", scraper.run_once([]) == 0 and stored(second)))
+        checks.append(("by job name", scraper.run_once([second.job_name]) == 0))
+        checks.append(("stock matches", not _stock_mismatches(store, server.catalog(f"{site.name}.c0"), first.store_type)))
+        # The failing runs below log errors and tracebacks
+        logging.disable(logging.ERROR)
+        stack.callback(logging.disable, logging.NOTSET)
+        checks.append(("unknown tracker", scraper.run_once(["no-such-tracker"]) == 2))
+        with mock.patch.object(site_engine, "process_category_stock", side_effect=RuntimeError("boom")):
+            checks.append(("failed run", scraper.run_once([first.type]) == 1))
+    for name, ok in checks:
+        if not ok:
+            print(f"one-shot run: {name} check failed")
+            failed = True
+    print(f"one-shot runs: {sum(bool(ok) for _, ok in checks)}/{len(checks)} checks ok")
+    return 1 if failed else 0
+
+
+class _Crash(Exception):
+    """Stands in for the process dying at a chosen point of a run."""
+
+
+def _alert_links(messages):
+    """Count the product links in delivered alerts."""
+    counts = collections.Counter()
+    for message in messages:
+        counts.update(re.findall(r"https://gameloot\.in/product/item-\d+/", message))
+    return counts
+
+
+def _partial_delivery_problems(store):
+    """
+    Send journaled alerts through the real delivery queue to a bot that fails one chat partway, then restart.
+
+    Returns:
+        list: Problems found, empty if every part reached every chat exactly once and in order
+    """
+    from telegram.error import NetworkError
+
+    sent = collections.defaultdict(list)  # chat ID -> texts Telegram accepted
+    failing = {"chat": 2, "after": 1}  # the second message to chat 2 fails
+
+    class FlakyBot:
+        def __init__(self, token):
+            pass
+
+        async def send_message(self, chat_id, text):
+            if chat_id == failing["chat"] and len(sent[chat_id]) >= failing["after"]:
+                raise NetworkError("bench outage")
+            sent[chat_id].append(text)
+
+        async def shutdown(self):
+            pass
+
+    # A short alert, one long enough to take two parts and another short one, to both chats
+    long_alert = "\n".join(f"-Graphics Card Model {i} 8GB - {10000 + i} - https://gameloot.in/product/item-{i}/" for i in range(60))
+    alerts = [("NEW PRODUCT IN STOCK! : first", (1, 2)), (long_alert, (1, 2)), ("SOLD OUT! : last", (1, 2))]
+    expected = "\n\n".join(part for text, _ in alerts for part in split_paragraph(text))
+    key = "bench-partial-delivery"
+    problems = []
+    with mock.patch("telegram.Bot", FlakyBot), mock.patch.object(telegram_helper, "TELEGRAM_MAX_RETRIES", 1), mock.patch.multiple(
+        telegram_helper, TELEGRAM_GLOBAL_RATE=0, TELEGRAM_CHAT_RATE=0
+    ):
+        run_journal.reset_run_journals()
+        journal = run_journal.open_run_journal(store, key)
+        journal.begin()
+        journal.record_diff(StockDiff(), alerts)
+        journal.applied()
+        delivery = telegram_helper.TelegramDelivery(token="bench", coalesce_seconds=0.2)
+        journal.send_alerts(delivery.enqueue)
+        delivery.flush()
+        first = {chat_id: len(texts) for chat_id, texts in sent.items()}
+
+        # Restart with chat 2 reachable again
+        failing["chat"] = None
+        run_journal.reset_run_journals()
+        journal = run_journal.open_run_journal(store, key)
+        journal.send_alerts(delivery.enqueue)
+        delivery.flush()
+        delivery.stop()
+
+    if len(split_paragraph(long_alert)) < 2:
+        problems.append("the long alert fits one message")
+    if first.get(2) != 1:
+        problems.append(f"chat 2 took {first.get(2)} message(s) before the outage, expected 1")
+    if len(sent[1]) != first.get(1):
+        problems.append(f"chat 1 got {len(sent[1]) - first.get(1, 0)} message(s) again after the restart")
+    for chat_id, texts in sorted(sent.items()):
+        if "\n\n".join(texts) != expected:
+            problems.append(f"chat {chat_id} did not get every part exactly once and in order")
+    if store.load_run_journal(key) is not None:
+        store.delete_run_journal(key)
+        problems.append("journal left behind")
+    run_journal.reset_run_journals()
+    return problems
+
+
+def _history_counts(store, product_type="gpu"):
+    """Return {link: number of price points} of every stored product of a type."""
+    return {doc["link"]: len(store.load_price_history(product_type, doc["link"])) for doc in store.load_stock(product_type, in_stock_only=False)}
+
+
+def bench_journal(args):
+    """Crash runs at every phase, restart them and check the stock and the alerts delivered."""
+    failed = False
+    rows = []
+    with ExitStack() as stack:
+        store = _open_store(stack, args.storage, args.mongo)
+        if store is None:
+            return 2
+        delivered = []
+        delivery = {"fail": False}
+
+        def deliver(message, chat_ids=None, on_done=None, resume=None):
+            if not delivery["fail"]:
+                delivered.append(message)
+            if on_done is not None:
+                on_done(not delivery["fail"])
+
+        stack.enter_context(mock.patch.object(site_engine, "queue_telegram_message", deliver))
+        stack.enter_context(mock.patch.object(http_client._rate_limiter, "rate", 0))
+        # Checkpoint every page, so a crash loses nothing that was consumed
+        stack.enter_context(mock.patch.object(run_journal, "RUN_JOURNAL_CHECKPOINT_SECONDS", 0))
+        server = BenchServer(args.pages, args.products, args.latency).start()
+        stack.callback(server.stop)
+        category = CategorySpec(load_site_spec("gameloot"), "gpu", server.category_url(), incremental_pages=0)
+        real_scrape_page = site_engine._scrape_page
+        real_apply = site_engine.apply_stock_diff
+
+        def crash_mid_scrape():
+            fetched = itertools.count(1)
+
+            def scrape_page(*a, **kw):
+                if next(fetched) > args.pages // 2:
+                    raise _Crash("mid-scrape")
+                return real_scrape_page(*a, **kw)
+
+            return mock.patch.object(site_engine, "_scrape_page", scrape_page)
+
+        def crash_before_write():
+            def apply(*a, **kw):
+                raise _Crash("before write")
+
+            return mock.patch.object(site_engine, "apply_stock_diff", apply)
+
+        def crash_after_write():
+            def apply(*a, **kw):
+                real_apply(*a, **kw)
+                raise _Crash("after write")
+
+            return mock.patch.object(site_engine, "apply_stock_diff", apply)
+
+        def crash_before_applied():
+            def applied(*a, **kw):
+                raise _Crash("before applied")
+
+            return mock.patch.object(run_journal.RunJournal, "applied", applied)
+
+        def failing_delivery():
+            delivery["fail"] = True
+            return nullcontext()
+
+        # (scenario, catalog change first, crash or failure, freshness minutes on restart)
+        for scenario, mutate, trouble, freshness in (
+            ("mid-scrape", False, crash_mid_scrape, run_journal.RUN_JOURNAL_FRESHNESS_MINUTES),
+            ("stale pages", True, crash_mid_scrape, 0),
+            ("before write", True, crash_before_write, run_journal.RUN_JOURNAL_FRESHNESS_MINUTES),
+            ("before applied", True, crash_before_applied, run_journal.RUN_JOURNAL_FRESHNESS_MINUTES),
+            ("after write", True, crash_after_write, run_journal.RUN_JOURNAL_FRESHNESS_MINUTES),
+            ("delivery failed", True, failing_delivery, run_journal.RUN_JOURNAL_FRESHNESS_MINUTES),
+        ):
+            before = {link for link, doc in store.load_stock_state("gpu").items() if doc["inStock"]}
+            points_before = _history_counts(store)
+            if mutate:
+                server.mutate()
+            after = _catalog_links(server)
+            delivered.clear()
+            requests_before = server.requests
+            crashed = False
+            with trouble():
+                try:
+                    site_engine.process_category_stock(category)
+                except _Crash:
+                    crashed = True
+            first_requests = server.requests - requests_before
+
+            # Restart: nothing survives but the database
+            restarted_at = datetime.utcnow()
+            run_journal.reset_run_journals()
+            category.last_full_sweep = None
+            delivery["fail"] = False
+            requests_before = server.requests
+            with mock.patch.object(run_journal, "RUN_JOURNAL_FRESHNESS_MINUTES", freshness):
+                outcome = site_engine.process_category_stock(category)
+            requests = server.requests - requests_before
+
+            problems = []
+            if outcome not in (None, "UNCHANGED"):
+                problems.append(f"restarted run ended with {outcome}")
+            if _stock_mismatches(store, server.catalog("graphics-card")):
+                problems.append("stored in-stock products differ from the served catalog")
+            # Every new, restocked and sold listing alerted exactly once over both runs
+            alerted = _alert_links(delivered)
+            if alerted != collections.Counter(after ^ before):
+                duplicates = sum(count - 1 for count in alerted.values() if count > 1)
+                problems.append(f"{len(alerted)} listing(s) alerted ({duplicates} more than once) for {len(after ^ before)} change(s)")
+            if store.load_run_journal(category.job_name) is not None:
+                problems.append("journal left behind")
+            # A replayed diff must not add price points twice or move firstSeenAt to the replay
+            stored = {doc["link"]: doc for doc in store.load_stock("gpu", in_stock_only=False)}
+            # One run changes a product once, so it gains at most one price point
+            doubled = [link for link, count in _history_counts(store).items() if count - points_before.get(link, 0) > 1]
+            if doubled:
+                problems.append(f"{len(doubled)} product(s) with a price point recorded twice")
+            diff_journaled = trouble in (crash_before_write, crash_before_applied, crash_after_write)
+            if diff_journaled and any(stored[link]["firstSeenAt"] >= restarted_at for link in after - before if link in stored):
+                problems.append("firstSeenAt of new products set by the restarted run")
+            if scenario == "mid-scrape" and requests > args.pages + 1 - args.pages // 4:
+                problems.append(f"checkpointed pages fetched again ({requests} requests)")
+            if scenario == "stale pages" and requests < args.pages:
+                problems.append(f"stale checkpointed pages reused ({requests} requests)")
+            if trouble is not failing_delivery and not crashed:
+                problems.append("the run did not crash")
+            for problem in problems:
+                print(f"{scenario}: {problem}")
+            failed = failed or bool(problems)
+            rows.append((scenario, first_requests, requests, len(delivered), "FAILED" if problems else "ok"))
+
+        # Journaled alerts that reached only some of their chats resume per chat and part
+        problems = _partial_delivery_problems(store)
+        for problem in problems:
+            print(f"partial delivery: {problem}")
+        failed = failed or bool(problems)
+
+    print(f"{args.pages} pages x {args.products} products, storage {args.storage}")
+    for scenario, first_requests, requests, alerts, result in rows:
+        print(f"{scenario:>16}: {first_requests:3d} requests before the crash, {requests:3d} after the restart, {alerts} alert message(s) [{result}]")
+    print(f"{'partial delivery':>16}: resumed per chat and part [{'FAILED' if problems else 'ok'}]")
+    return 1 if failed else 0
+
+
+def bench_workers(args):
+    """Several lease-sharing workers firing every tracker at once, a worker dying and a new one joining."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    failed = False
+    rows = []
+    with ExitStack() as stack:
+        store = _open_store(stack, args.storage, args.mongo)
+        if store is None:
+            return 2
+        delivered = []
+        delivered_lock = threading.Lock()
+
+        def deliver(message, chat_ids=None, on_done=None, resume=None):
+            with delivered_lock:
+                delivered.append(message)
+            if on_done is not None:
+                on_done(True)
+
+        stack.enter_context(mock.patch.object(site_engine, "queue_telegram_message", deliver))
+        stack.enter_context(mock.patch.object(http_client._rate_limiter, "rate", 0))
+        # Full sweeps only, so every round's stock can be checked against the whole catalog
+        stack.enter_context(mock.patch.object(site_engine, "INCREMENTAL_SCRAPING", False))
+        server = BenchServer(args.pages, args.products, args.latency).start()
+        stack.callback(server.stop)
+        specs = _bench_site_specs(server, args.sites, args.categories, max_connections=4)
+        categories = [category for site in specs for category in site.categories]
+        stack.enter_context(mock.patch.object(leases, "set_tracker_active", lambda name, active: None))
+
+        running = {}  # job name -> worker running it
+        runs = []  # (job name, worker) of the current round
+        overlaps = []
+        lock = threading.Lock()
+
+        def track(category, worker):
+            with lock:
+                if category.job_name in running:
+                    overlaps.append((category.job_name, running[category.job_name], worker))
+                running[category.job_name] = worker
+            try:
+                site_engine.process_category_stock(category)
+                runs.append((category.job_name, worker))
+            finally:
+                with lock:
+                    del running[category.job_name]
+
+        workers = {}
+
+        def add_worker(name):
+            manager = leases.LeaseManager(store, name, args.lease_seconds, args.lease_seconds / 4).start()
+            stack.callback(manager.stop)
+            jobs = [
+                manager.leased(
+                    category.job_name,
+                    leases.lease_name(category, args.scope),
+                    functools.partial(track, category, name),
+                    functools.partial(run_journal.forget_run_journal, category.job_name),
+                    functools.partial(run_journal.run_journal_idle, category.job_name),
+                )
+                for category in categories
+            ]
+            workers[name] = (manager, jobs)
+
+        for number in range(args.workers):
+            add_worker(f"w{number}")
+
+        # (round, event before it)
+        plan = [(number, None) for number in range(args.rounds)]
+        plan[args.rounds // 3] = (args.rounds // 3, "kill")
+        plan[2 * args.rounds // 3] = (2 * args.rounds // 3, "join")
+        for number, event in plan:
+            if event == "kill":
+                # Dies without handing its leases back: peers must wait for them to expire
+                manager, _ = workers.pop("w0")
+                manager.stop(release=False)
+                sleep(args.lease_seconds * 1.5)
+            elif event == "join":
+                add_worker(f"w{args.workers}")
+                for manager, _ in workers.values():
+                    manager.heartbeat()
+            before = {}
+            for category in categories:
+                before[category.job_name] = {link for link, doc in store.load_stock_state(category.store_type).items() if doc["inStock"]}
+                if number:
+                    server.mutate(category.url.rsplit("/", 1)[-1])
+            delivered.clear()
+            runs.clear()
+            # Every worker's slot for every tracker comes up at the same time
+            slots = [job for _, jobs in workers.values() for job in jobs]
+            random.Random(number).shuffle(slots)
+            with ThreadPoolExecutor(max_workers=len(slots)) as executor:
+                list(executor.map(lambda job: job(), slots))
+
+            problems = []
+            ran = collections.Counter(job for job, _ in runs)
+            missed = [category.job_name for category in categories if ran[category.job_name] != 1]
+            if missed:
+                problems.append(f"{len(missed)} tracker(s) not run exactly once: {missed[:3]}")
+            expected = collections.Counter()
+            for category in categories:
+                catalog = server.catalog(category.url.rsplit("/", 1)[-1])
+                if _stock_mismatches(store, catalog, category.store_type):
+                    problems.append(f"{category.job_name} does not match the served catalog")
+                expected.update(_catalog_links(server, category.url.rsplit("/", 1)[-1]) ^ before[category.job_name])
+            if _alert_links(delivered) != expected:
+                problems.append("alerts differ from the catalog changes (missing or sent twice)")
+            for problem in problems:
+                print(f"round {number}: {problem}")
+            failed = failed or bool(problems)
+            per_worker = collections.Counter(worker for _, worker in runs)
+            rows.append((number, event, {name: per_worker[name] for name in workers}, "FAILED" if problems else "ok"))
+
+    if overlaps:
+        print(f"{len(overlaps)} tracker run(s) overlapped on two workers, e.g. {overlaps[0]}")
+        failed = True
+    print(
+        f"{args.workers} workers, {len(categories)} trackers ({args.sites} sites x {args.categories} categories), "
+        f"lease scope {args.scope}, leases of {args.lease_seconds:g}s, storage {args.storage}"
+    )
+    for number, event, per_worker, result in rows:
+        label = f" after {'w0 died' if event == 'kill' else 'a worker joined'}" if event else ""
+        print(f"  round {number}{label}: runs per worker {per_worker} [{result}]")
+    return 1 if failed else 0
+
+
+def _seed_listing_history(store, days, per_day, seed=7):
+    """
+    Write ``days`` days of synthetic runs (new, repriced, sold and restocked listings) ending today.
+
+    Returns:
+        dict: link -> {"price", "inStock", "firstSeen", "soldAt", "lowest", "points"}, what the API should answer
+    """
+    rng = random.Random(seed)
+    model = {}
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    for day in range(days):
+        now = today - timedelta(days=days - 1 - day) + timedelta(hours=rng.randrange(24), minutes=rng.randrange(60))
+        diff = StockDiff()
+        listed = [link for link, product in model.items() if product["inStock"]]
+        gone = [link for link, product in model.items() if not product["inStock"]]
+        for link in rng.sample(listed, len(listed) // 20):
+            diff.sold.append({"link": link, "price": model[link]["price"], "name": link})
+        sold = {stored["link"] for stored in diff.sold}
+        for link in rng.sample([link for link in listed if link not in sold], len(listed) // 10):
+            diff.previous_prices[link] = model[link]["price"]
+            diff.price_changed.append(ProductRecord(link, model[link]["price"] + rng.randrange(-2000, 2000), link, type="gpu"))
+        for link in rng.sample(gone, len(gone) // 10):
+            diff.restocked.append(ProductRecord(link, model[link]["price"], link, type="gpu"))
+        for number in range(per_day):
+            link = f"https://gameloot.in/product/item-{len(model) + number}/"
+            diff.new.append(ProductRecord(link, rng.randrange(5000, 90000), link, type="gpu"))
+        store.write_stock_changes("gpu", diff, now)
+        store.record_price_history(stock_diff.build_history_points(diff, "gpu", now))
+        for record in diff.new:
+            model[record.link] = {"price": record.price, "inStock": True, "firstSeen": now, "soldAt": None, "lowest": record.price, "points": 0}
+        for record in diff.new + diff.price_changed + diff.restocked:
+            product = model[record.link]
+            product.update(price=record.price, inStock=True, lowest=min(product["lowest"], record.price), points=product["points"] + 1)
+        for stored in diff.sold:
+            product = model[stored["link"]]
+            product.update(inStock=False, soldAt=product["soldAt"] or now, points=product["points"] + 1)
+    return model
+
+
+def bench_api(args):
+    """Check the stock API queries against a synthetic history and measure what the cache saves a polling dashboard."""
+    import socket
+    from urllib.request import urlopen
+
+    counter = collections.Counter()
+    failed = False
+    with ExitStack() as stack:
+        store = _open_store(stack, args.storage, args.mongo, counter)
+        if store is None:
+            return 2
+        model = _seed_listing_history(store, args.days, args.per_day)
+        stack.enter_context(mock.patch.object(stock_api, "_cache", stock_api.QueryCache(seconds=3600, size=64)))
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        server = stock_api.start_api_server("127.0.0.1", port)
+        stack.callback(server.shutdown)
+
+        def get(path):
+            with urlopen(f"http://127.0.0.1:{port}{path}", timeout=30) as response:
+                return json.loads(response.read())
+
+        sample = sorted(model)[len(model) // 3]
+        in_stock = sorted((product["price"], link) for link, product in model.items() if product["inStock"])
+        hours = sorted((product["soldAt"] - product["firstSeen"]).total_seconds() / 3600 for product in model.values() if product["soldAt"])
+        first_seen = collections.Counter(product["firstSeen"].date().isoformat() for product in model.values())
+        quoted = sample.replace(":", "%3A").replace("/", "%2F")
+        queries = [
+            ("stock", "/api/stock?type=gpu", lambda result: [(product["price"], product["link"]) for product in result["products"]] == in_stock),
+            ("history", f"/api/history?type=gpu&link={quoted}", lambda result: len(result["points"]) == model[sample]["points"]),
+            ("lowest", f"/api/lowest?type=gpu&link={quoted}", lambda result: result["lowest"] == model[sample]["lowest"]),
+            (
+                "time-to-sell",
+                "/api/time-to-sell?type=gpu",
+                lambda result: result["sold"] == len(hours) and abs(result["medianHours"] - round(statistics.median(hours), 2)) < 0.02,
+            ),
+            (
+                "new-listings",
+                f"/api/new-listings?type=gpu&days={args.days}",
+                lambda result: {row["day"]: row["count"] for row in result["days"]} == {day: first_seen.get(day, 0) for day in (row["day"] for row in result["days"])}
+                and sum(row["count"] for row in result["days"]) == len(model),
+            ),
+        ]
+        rows = []
+        for name, path, check in queries:
+            counter.clear()
+            start = perf_counter()
+            result = get(path)
+            cold = perf_counter() - start
+            cold_ops = sum(counter.values())
+            counter.clear()
+            start = perf_counter()
+            for _ in range(args.polls):
+                cached = get(path)
+            warm = (perf_counter() - start) / args.polls
+            ok = check(result) and cached == result and not counter
+            if not ok:
+                print(f"{name}: {'cached result differs or hit the database' if check(result) else 'wrong result'}")
+            failed = failed or not ok
+            rows.append((name, cold, cold_ops, warm, sum(counter.values())))
+
+        # A finished tracker run drops the cached results of its type, and only those
+        probe_result = get("/api/stock?type=gpu")
+        get("/api/stock?type=cpu")
+        added = f"https://gameloot.in/product/item-{len(model)}/"
+
+        def fake_run(category):
+            diff = StockDiff()
+            diff.new.append(ProductRecord(added, 1000, added, type="gpu"))
+            stock_diff.apply_stock_diff(store, diff, "gpu")
+
+        category = CategorySpec(load_site_spec("gameloot"), "gpu", "https://gameloot.in/product-category/graphics-card/")
+        with mock.patch.object(site_engine, "process_category_stock", fake_run):
+            site_engine.track_category(category)
+        counter.clear()
+        after_run = get("/api/stock?type=gpu")
+        get("/api/stock?type=cpu")
+        if after_run["count"] != probe_result["count"] + 1 or after_run["products"][0]["link"] != added:
+            print("stock API served a stale result after a tracker run")
+            failed = True
+        if sum(counter.values()) != 1:
+            print(f"expected one query after the run, for gpu only, got {dict(counter)}")
+            failed = True
+
+    print(f"{len(model)} products over {args.days} days ({args.per_day} new a day), {args.polls} polls per query, storage {args.storage}")
+    print(f"{'query':>14}  {'uncached':>10}  {'db ops':>6}  {'cached':>10}  {'db ops':>6}")
+    for name, cold, cold_ops, warm, warm_ops in rows:
+        print(f"{name:>14}  {cold * 1000:8.2f}ms  {cold_ops:6}  {warm * 1000:8.2f}ms  {warm_ops:6}")
+    return 1 if failed else 0
+
+
+def bench_profile(args):
+    """Overhead of the run profiler per mode, dump rotation and the disabled no-op."""
+    failed = False
+    timings = {}
+    with ExitStack() as stack:
+        _open_store(stack, "sqlite", None)
+        stack.enter_context(mock.patch.object(site_engine, "queue_telegram_message", _deliver))
+        stack.enter_context(mock.patch.object(http_client._rate_limiter, "rate", 0))
+        server = BenchServer(args.pages, args.products, args.latency).start()
+        stack.callback(server.stop)
+        category = CategorySpec(load_site_spec("gameloot"), "gpu", server.category_url(), incremental_pages=0)
+        directory = stack.enter_context(tempfile.TemporaryDirectory())
+        saved = (profiling.PROFILE_EVERY, profiling.PROFILE_SLOWER_THAN, profiling.PROFILE_DIR, profiling.PROFILE_MODE, profiling.PROFILE_KEEP)
+        stack.callback(lambda: profiling.configure(*saved))
+
+        def job():
+            return site_engine.process_category_stock(category)
+
+        # (mode, every, slower_than, profile mode)
+        for mode, every, slower_than, profile_mode in (
+            ("off", 0, 0, "sample"),
+            ("sample", 1, 0, "sample"),
+            ("cprofile", 1, 0, "cprofile"),
+            ("threshold", 0, 3600, "sample"),
+        ):
+            mode_dir = os.path.join(directory, mode)
+            profiling.configure(every, slower_than, mode_dir, profile_mode, args.keep)
+            wrapped = profiling.profiled(category.job_name, job)
+            if mode == "off" and wrapped is not job:
+                print("off: disabled profiling still wraps the job")
+                failed = True
+            walls = []
+            for _ in range(args.runs):
+                # A catalog change every run, so each run diffs and writes
+                server.mutate()
+                start = perf_counter()
+                wrapped()
+                walls.append(perf_counter() - start)
+            timings[mode] = sorted(walls)[len(walls) // 2]
+
+            dumps = sorted(os.listdir(mode_dir)) if os.path.isdir(mode_dir) else []
+            runs = {os.path.splitext(name)[0] for name in dumps}
+            expected = min(args.runs, args.keep) if every else 0
+            if len(runs) != expected:
+                print(f"{mode}: {len(runs)} profiled run(s) kept, expected {expected}")
+                failed = True
+            if mode == "sample" and dumps:
+                with open(os.path.join(mode_dir, [name for name in dumps if name.endswith(".txt")][-1])) as f:
+                    print(f"  sample summary: {f.readline().strip()}")
+
+    print(f"{args.runs} runs per mode, {args.pages} pages x {args.products} products, latency {args.latency}s")
+    for mode, wall in timings.items():
+        print(f"{mode:>10}: {wall * 1000:8.1f} ms per run (median), {(wall / timings['off'] - 1) * 100:+5.1f}% vs off")
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parse = commands.add_parser("parse", help="HTML parser backend parity and pages/s")
+    parse.add_argument("--pages", type=int, default=50)
+    parse.add_argument("--products", type=int, default=24)
+    parse.add_argument("--repeat", type=int, default=3)
+    parse.add_argument("--record", nargs="+", metavar="URL", help="save these listing pages as golden files instead")
+    parse.set_defaults(func=bench_parse)
+
+    dedup = commands.add_parser("dedup", help="key-based dedup policies vs the old full-dict dedup")
+    dedup.add_argument("--products", type=int, default=100000)
+    dedup.add_argument("--duplicates", type=float, default=0.1, help="fraction of products that repeat an earlier listing")
+    dedup.set_defaults(func=bench_dedup)
+
+    messages = commands.add_parser("messages", help="alert message building/splitting correctness and linear scaling")
+    messages.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    messages.add_argument("--max-growth", type=float, default=3.0, help="allowed growth of time per entry")
+    messages.set_defaults(func=bench_messages)
+
+    e2e = commands.add_parser("e2e", help="process_category_stock against the local stand-in server")
+    e2e.add_argument("--pages", type=int, default=20)
+    e2e.add_argument("--products", type=int, default=24)
+    e2e.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    e2e.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    e2e.add_argument("--rate-limit", type=float, default=0, help="HTTP requests/second per host (0 = unlimited)")
+    e2e.add_argument("--storage", choices=("mongo", "sqlite"), default="mongo")
+    e2e.add_argument("--mongo", default="mock", help="'mock' for mongomock or a MongoDB URI (its collections are dropped)")
+    e2e.add_argument("--output", help="write results as JSON")
+    e2e.add_argument("--baseline", help="compare with a JSON written by --output")
+    e2e.set_defaults(func=bench_e2e)
+
+    incremental = commands.add_parser("incremental", help="incremental runs between full sweeps against the stand-in server")
+    incremental.add_argument("--pages", type=int, default=20)
+    incremental.add_argument("--products", type=int, default=24)
+    incremental.add_argument("--latency", type=float, default=0.02, help="seconds added to every response")
+    incremental.add_argument("--incremental-pages", type=int, default=2)
+    incremental.add_argument("--storage", choices=("mongo", "sqlite"), default="sqlite")
+    incremental.add_argument("--mongo", default="mock", help="'mock' for mongomock or a MongoDB URI (its collections are dropped)")
+    incremental.set_defaults(func=bench_incremental)
+
+    sites = commands.add_parser("sites", help="several site specs at once under per-site connection limits")
+    sites.add_argument("--sites", type=int, default=3)
+    sites.add_argument("--categories", type=int, default=3)
+    sites.add_argument("--pages", type=int, default=8)
+    sites.add_argument("--products", type=int, default=24)
+    sites.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    sites.add_argument("--max-connections", type=int, default=2, help="max_connections of every site spec")
+    sites.add_argument("--storage", choices=("mongo", "sqlite"), default="sqlite")
+    sites.add_argument("--mongo", default="mock", help="'mock' for mongomock or a MongoDB URI (its collections are dropped)")
+    sites.set_defaults(func=bench_sites)
+
+    store = commands.add_parser("storage", help="storage backend conformance and throughput")
+    store.add_argument("--products", type=int, default=2000)
+    store.add_argument("--mongo", default="mock", help="'mock' for mongomock or a MongoDB URI (its collections are dropped)")
+    store.set_defaults(func=bench_storage)
+
+    watch = commands.add_parser("watch", help="indexed watch rule matching vs a rules x products scan")
+    watch.add_argument("--rules", type=int, nargs="+", default=[1000, 10000, 100000])
+    watch.add_argument("--products", type=int, default=500, help="changed products in the synthetic run")
+    watch.set_defaults(func=bench_watch)
+
+    journal = commands.add_parser("journal", help="crash runs at every phase and check the restarted run")
+    journal.add_argument("--pages", type=int, default=20)
+    journal.add_argument("--products", type=int, default=24)
+    journal.add_argument("--latency", type=float, default=0.01, help="seconds added to every response")
+    journal.add_argument("--storage", choices=("mongo", "sqlite"), default="sqlite")
+    journal.add_argument("--mongo", default="mock", help="'mock' for mongomock or a MongoDB URI (its collections are dropped)")
+    journal.set_defaults(func=bench_journal)
+
+    workers = commands.add_parser("workers", help="lease-sharing workers: no overlaps, takeover and rebalancing")
+    workers.add_argument("--workers", type=int, default=3)
+    workers.add_argument("--sites", type=int, default=2)
+    workers.add_argument("--categories", type=int, default=4)
+    workers.add_argument("--rounds", type=int, default=6)
+    workers.add_argument("--pages", type=int, default=4)
+    workers.add_argument("--products", type=int, default=24)
+    workers.add_argument("--latency", type=float, default=0.01, help="seconds added to every response")
+    workers.add_argument("--lease-seconds", type=float, default=2.0)
+    workers.add_argument("--scope", choices=leases.LEASE_SCOPES, default="category")
+    workers.add_argument("--storage", choices=("mongo", "sqlite"), default="sqlite")
+    workers.add_argument("--mongo", default="mock", help="'mock' for mongomock or a MongoDB URI (its collections are dropped)")
+    workers.set_defaults(func=bench_workers)
+
+    api = commands.add_parser("api", help="stock API results and cache savings against a synthetic history")
+    api.add_argument("--days", type=int, default=60)
+    api.add_argument("--per-day", type=int, default=100)
+    api.add_argument("--polls", type=int, default=50, help="cached requests per query")
+    api.add_argument("--storage", choices=("mongo", "sqlite"), default="sqlite")
+    api.add_argument("--mongo", default="mock", help="'mock' for mongomock or a MongoDB URI (its collections are dropped)")
+    api.set_defaults(func=bench_api)
+
+    identity = commands.add_parser("identity", help="model keys, trigram index vs a linear scan and relisting alerts")
+    identity.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="known names per index")
+    identity.add_argument("--queries", type=int, default=200, help="lookups per size, half of them retyped known names")
+    identity.add_argument("--storage", choices=("mongo", "sqlite"), default="sqlite")
+    identity.add_argument("--mongo", default="mock", help="'mock' for mongomock or a MongoDB URI (its collections are dropped)")
+    identity.set_defaults(func=bench_identity)
+
+    startup = commands.add_parser("startup", help="scraper import time against a budget, lazy imports and one-shot runs")
+    startup.add_argument("--runs", type=int, default=5, help="fresh interpreters to time")
+    startup.add_argument("--budget-ms", type=float, default=300, help="longest allowed import of scraper.py (-X importtime)")
+    startup.add_argument("--top", type=int, default=5, help="slowest packages to list")
+    startup.add_argument("--pages", type=int, default=3)
+    startup.add_argument("--products", type=int, default=24)
+    startup.set_defaults(func=bench_startup)
+
+    profile = commands.add_parser("profile", help="run profiler overhead per mode and dump rotation")
+    profile.add_argument("--runs", type=int, default=5)
+    profile.add_argument("--pages", type=int, default=20)
+    profile.add_argument("--products", type=int, default=24)
+    profile.add_argument("--latency", type=float, default=0.01, help="seconds added to every response")
+    profile.add_argument("--keep", type=int, default=3, help="PROFILE_KEEP for the run (checks rotation)")
+    profile.set_defaults(func=bench_profile)
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
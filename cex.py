@@ -1,42 +0,0 @@
-"""
-CEX scraper module.
-This is a placeholder for CEX-specific scraping logic.
-Implement similar functions as in gameloot.py for CEX website.
-"""
-
-import logging
-
-
-def scrape_cex_product_page(url):
-    """Scrape a single CEX product page."""
-    # TODO: Implement CEX-specific scraping logic
-    logging.info(f"Scraping CEX product page: {url}")
-    pass
-
-
-def scrape_all_cex_products(base_url):
-    """Scrape all products from CEX."""
-    # TODO: Implement CEX-specific scraping logic
-    logging.info(f"Scraping all CEX products from: {base_url}")
-    pass
-
-
-def process_cex_stock(base_url, mongo_col_name):
-    """Process CEX stock updates and send notifications."""
-    # TODO: Implement CEX-specific stock processing logic
-    logging.info(f"Processing CEX stock for: {base_url}")
-    pass
-
-
-def track_cex_gpu():
-    """Track CEX GPU stock."""
-    # TODO: Implement CEX GPU tracking
-    logging.info("Tracking CEX GPU")
-    pass
-
-
-def track_cex_cpu():
-    """Track CEX CPU stock."""
-    # TODO: Implement CEX CPU tracking
-    logging.info("Tracking CEX CPU")
-    pass
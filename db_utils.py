@@ -1,5 +1,7 @@
 import pymongo
-from pymongo.errors import ServerSelectionTimeoutError, ConnectionFailure, PyMongoError
+from pymongo.errors import ServerSelectionTimeoutError, ConnectionFailure, PyMongoError, OperationFailure
+import atexit
+import threading
 import time
 import logging
 import os
@@ -10,6 +12,23 @@ MONGO_CONNECTION_TIMEOUT = 5  # seconds
 MONGO_RETRY_DELAY = 5  # seconds between retries
 MONGO_MAX_RETRY_DELAY = 60  # maximum delay between retries
 MONGO_DEFAULT_DB = "gamelootScrape"  # used when db is not specified in URI
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "10"))  # connections in the shared client pool
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_HEALTH_CHECK_INTERVAL = int(os.getenv("MONGO_HEALTH_CHECK_INTERVAL", "60"))  # seconds between pings
+
+# Indexes backing the hot product queries: {"link", "type"} lookups/upserts and {"type", "inStock"} scans
+PRODUCT_INDEXES = [
+    {"keys": [("type", pymongo.ASCENDING), ("link", pymongo.ASCENDING)], "name": "type_link_unique", "unique": True},
+    {"keys": [("type", pymongo.ASCENDING), ("inStock", pymongo.ASCENDING)], "name": "type_inStock"},
+    # Daily new listing counts (stock_api.py)
+    {"keys": [("type", pymongo.ASCENDING), ("firstSeenAt", pymongo.ASCENDING)], "name": "type_firstSeenAt"},
+    # Other listings of a model (product_identity.py)
+    {"keys": [("type", pymongo.ASCENDING), ("modelKey", pymongo.ASCENDING)], "name": "type_modelKey"},
+]
+
+
+class IndexNotUsedError(Exception):
+    """Raised when a hot query's winning plan falls back to a collection scan."""
 
 
 def _db_name_from_uri(uri):
@@ -21,19 +40,99 @@ def _db_name_from_uri(uri):
     return MONGO_DEFAULT_DB
 
 
-def check_mongodb_available(mongo_uri=None, timeout=MONGO_CONNECTION_TIMEOUT):
+_client = None
+_client_uri = None
+_client_lock = threading.Lock()
+_last_ping = 0.0
+_retired_clients = []  # replaced clients other threads may still use, closed at exit
+
+
+def get_mongo_client(mongo_uri=None, force_ping=False):
     """
-    Check if MongoDB is available and accessible.
-    Returns True if available, False otherwise.
+    Return the process-wide MongoClient, creating it on first use.
+
+    The client is pinged lazily, at most once every MONGO_HEALTH_CHECK_INTERVAL
+    seconds (or always with force_ping). A failed ping only raises: the client
+    is shared by every tracker thread and keeps monitoring the topology, so it
+    finds the new primary after a failover by itself.
+
+    Args:
+        mongo_uri: MongoDB URI (defaults to MONGODB_URI)
+        force_ping: Ping even if the last successful ping is recent
+
+    Returns:
+        pymongo.MongoClient: Shared client
+
+    Raises:
+        ServerSelectionTimeoutError, ConnectionFailure: If the health check fails
     """
-    try:
-        if mongo_uri is None:
-            mongo_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+    global _client, _client_uri, _last_ping
+    if mongo_uri is None:
+        mongo_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+
+    with _client_lock:
+        if _client is None or _client_uri != mongo_uri:
+            if _client is not None:
+                _retired_clients.append(_client)
+            logging.info(f"Creating MongoDB client (pool size {MONGO_MIN_POOL_SIZE}-{MONGO_MAX_POOL_SIZE})")
+            _client = pymongo.MongoClient(
+                mongo_uri,
+                serverSelectionTimeoutMS=MONGO_CONNECTION_TIMEOUT * 1000,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                retryReads=True,
+                retryWrites=True,
+            )
+            _client_uri = mongo_uri
+            _last_ping = 0.0
+        client = _client
+        needs_ping = force_ping or time.monotonic() - _last_ping > MONGO_HEALTH_CHECK_INTERVAL
 
-        client = pymongo.MongoClient(mongo_uri, serverSelectionTimeoutMS=timeout * 1000)
-        # Try to ping the server
+    if needs_ping:
         client.admin.command("ping")
+        _last_ping = time.monotonic()
+    return client
+
+
+def reset_mongo_client(client=None):
+    """
+    Drop the shared client (only if it is still ``client`` when one is given) so the next call builds a fresh one.
+
+    The old client is not closed, since other threads may still hold its
+    collections, sessions or a bulk write in flight; it is closed at exit.
+    """
+    global _client, _client_uri
+    with _client_lock:
+        if _client is not None and (client is None or _client is client):
+            _retired_clients.append(_client)
+            _client = None
+            _client_uri = None
+
+
+def close_mongo_client():
+    """Shutdown hook: close the shared client and any replaced ones, with their connection pools."""
+    global _client, _client_uri
+    with _client_lock:
+        clients = _retired_clients + ([_client] if _client is not None else [])
+        _retired_clients.clear()
+        _client = None
+        _client_uri = None
+    if clients:
+        logging.info("Closing MongoDB client")
+    for client in clients:
         client.close()
+
+
+atexit.register(close_mongo_client)
+
+
+def check_mongodb_available(mongo_uri=None):
+    """
+    Check if MongoDB is available and accessible.
+    Returns True if available, False otherwise.
+    """
+    try:
+        get_mongo_client(mongo_uri, force_ping=True)
         return True
     except (ServerSelectionTimeoutError, ConnectionFailure, Exception) as e:
         logging.debug(f"MongoDB check failed: {e}")
@@ -94,9 +193,7 @@ def get_mongo_conn(collection, retry=True, max_retries=3):
 
     for attempt in range(max_retries):
         try:
-            client = pymongo.MongoClient(mongo_uri, serverSelectionTimeoutMS=MONGO_CONNECTION_TIMEOUT * 1000)
-            # Verify connection
-            client.admin.command("ping")
+            client = get_mongo_client(mongo_uri)
             db_name = _db_name_from_uri(mongo_uri)
             db = client[db_name]
             collection_obj = db[collection]
@@ -115,19 +212,70 @@ def get_mongo_conn(collection, retry=True, max_retries=3):
             raise
 
 
-def remove_list_duplicates(dict_list):
-    """Remove duplicate dictionaries from a list."""
-    logging.info("removing product duplicate")
-    logging.info(f"Original list length: {len(dict_list)}")
-    for i in dict_list:
-        logging.debug(i)
-    # Convert each dictionary to a tuple of sorted items
-    tuple_list = [tuple(sorted(d.items())) for d in dict_list]
+def ensure_indexes(collection, indexes=PRODUCT_INDEXES):
+    """
+    Create the given indexes if missing and confirm they exist.
+
+    A unique index that cannot be built because of existing duplicates is
+    logged as an error and created without the unique constraint, so the
+    queries it backs still avoid collection scans. A TTL index whose
+    expireAfterSeconds changed is updated in place with collMod.
 
-    # Remove duplicates by converting the list of tuples to a set
-    unique_tuples = set(tuple_list)
+    Args:
+        collection: MongoDB collection object
+        indexes: List of {"keys", "name", "unique", "expireAfterSeconds"} index specs
 
-    # Convert the tuples back to dictionaries
-    unique_dict_list = [dict(t) for t in unique_tuples]
-    logging.info(f"Deduplicate list length: {len(unique_dict_list)}")
-    return unique_dict_list
+    Returns:
+        list: Names of the indexes present on the collection
+    """
+    for index in indexes:
+        options = {"expireAfterSeconds": index["expireAfterSeconds"]} if "expireAfterSeconds" in index else {}
+        try:
+            collection.create_index(index["keys"], name=index["name"], unique=index.get("unique", False), **options)
+        except OperationFailure as e:
+            if options:
+                logging.info(f"Updating TTL of index {index['name']} on {collection.name} to {options['expireAfterSeconds']} seconds")
+                collection.database.command("collMod", collection.name, index={"name": index["name"], **options})
+                continue
+            if not index.get("unique"):
+                raise
+            logging.error(f"Could not create unique index {index['name']} on {collection.name}, duplicates exist? {e}")
+            collection.create_index(index["keys"], name=f"{index['name']}_nonunique")
+
+    existing = list(collection.index_information())
+    missing = [index["name"] for index in indexes if index["name"] not in existing and f"{index['name']}_nonunique" not in existing]
+    if missing:
+        raise OperationFailure(f"Indexes missing on {collection.name} after bootstrap: {missing}")
+    logging.info(f"Indexes on {collection.name}: {existing}")
+    return existing
+
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def verify_index_usage(collection, queries):
+    """
+    Check with explain() that each query's winning plan uses an index.
+
+    Args:
+        collection: MongoDB collection object
+        queries: List of filter documents to explain
+
+    Raises:
+        IndexNotUsedError: If any winning plan contains a COLLSCAN stage
+    """
+    for query in queries:
+        winning_plan = collection.find(query).explain()["queryPlanner"]["winningPlan"]
+        stages = list(_plan_stages(winning_plan))
+        if "COLLSCAN" in stages:
+            raise IndexNotUsedError(f"Query {query} on {collection.name} does a collection scan (plan stages: {stages})")
+        logging.debug(f"Query {query} on {collection.name} plan stages: {stages}")
@@ -0,0 +1,211 @@
+"""
+Listing page parser backends.
+
+Each backend extracts the raw name, price and link text of every product
+container plus the pagination page links from a listing page, driven by
+the CSS selectors of a site spec (ListingSelectors). Cleaning and price
+conversion stay in the site spec so every backend produces identical
+products.
+
+Backends:
+    selectolax: Lexbor C parser via selectolax (fastest, optional)
+    lxml: BeautifulSoup on lxml, restricted to the product grid and pagination
+    html.parser: BeautifulSoup on the pure-Python parser, restricted the same way
+
+GAMELOOT_HTML_PARSER picks one, "auto" (default) uses the fastest installed.
+BeautifulSoup is only imported once a bs4 backend parses a page.
+"""
+
+import functools
+import importlib.util
+import logging
+import os
+import re
+
+HTML_PARSER = os.getenv("GAMELOOT_HTML_PARSER", "auto")
+BACKENDS = ("selectolax", "lxml", "html.parser")
+
+# "tag", ".class" or "tag.class": handled with find() instead of the slower soupsieve engine
+SIMPLE_SELECTOR_PATTERN = re.compile(r"^([a-zA-Z][\w-]*)?(?:\.([\w-]+))?$")
+
+
+def _simple_steps(selector):
+    """Split a descendant selector into (tag, class) steps, or None if any part is not simple."""
+    steps = []
+    for part in selector.split():
+        match = SIMPLE_SELECTOR_PATTERN.match(part)
+        if not match or not any(match.groups()):
+            return None
+        steps.append((match.group(1) or True, match.group(2)))
+    return steps or None
+
+
+def _find_steps(node, steps):
+    tag, class_name = steps[0]
+    if len(steps) == 1:
+        return node.find(tag, class_=class_name) if class_name else node.find(tag)
+    matches = node.find_all(tag, class_=class_name) if class_name else node.find_all(tag)
+    for match in matches:
+        found = _find_steps(match, steps[1:])
+        if found is not None:
+            return found
+    return None
+
+
+def _bs4_find(selector):
+    """Return a function finding the first match of a selector under a bs4 node."""
+    steps = _simple_steps(selector)
+    if steps is None:
+        return lambda node: node.select_one(selector)
+    return lambda node: _find_steps(node, steps)
+
+
+def _bs4_find_all(selector):
+    """Return a function finding every match of a selector under a bs4 node."""
+    steps = _simple_steps(selector)
+    if steps is None or len(steps) != 1:
+        return lambda node: node.select(selector)
+    tag, class_name = steps[0]
+    if class_name:
+        return lambda node: node.find_all(tag, class_=class_name)
+    return lambda node: node.find_all(tag)
+
+
+class ListingSelectors:
+    """
+    CSS selectors of a listing page, compiled once per site spec.
+
+    Args:
+        item: Selector of one product container
+        name: Name selector inside the container
+        price: Price selector, or a list tried in order (e.g. sale price first)
+        link: Link selector inside the container
+        link_attribute: Attribute of the link element holding the URL
+        pages: Selector of the pagination links, or None
+    """
+
+    def __init__(self, item, name, price, link, link_attribute="href", pages=None):
+        self.item = item
+        self.name = name
+        self.price = [price] if isinstance(price, str) else list(price)
+        self.link = link
+        self.link_attribute = link_attribute
+        self.pages = pages
+        # bs4 lookups, compiled once
+        self.find_items = _bs4_find_all(item)
+        self.find_name = _bs4_find(name)
+        self.find_prices = [_bs4_find(selector) for selector in self.price]
+        self.find_link = _bs4_find(link)
+        self.find_pages = _bs4_find_all(pages) if pages else None
+
+    @functools.cached_property
+    def strainer(self):
+        """SoupStrainer restricting the bs4 DOM to containers and pagination links when both selectors are a simple tag.class."""
+        from bs4 import SoupStrainer
+
+        tags = []
+        classes = []
+        for selector in (self.item, self.pages):
+            if selector is None:
+                continue
+            steps = _simple_steps(selector)
+            if steps is None or len(steps) != 1 or steps[0][0] is True or steps[0][1] is None:
+                return None
+            tags.append(steps[0][0])
+            classes.append(re.escape(steps[0][1]))
+        # The regex matches a single class token whether bs4 hands the strainer the whole class string or each value
+        return SoupStrainer(tags, class_=re.compile(r"(^|\s)(%s)(\s|$)" % "|".join(classes)))
+
+    def __repr__(self):
+        return f"ListingSelectors(item={self.item!r}, name={self.name!r}, price={self.price!r}, link={self.link!r}, pages={self.pages!r})"
+
+
+@functools.lru_cache(maxsize=None)
+def available_backends():
+    """Return the installed backends, fastest first."""
+    backends = []
+    if importlib.util.find_spec("selectolax") is not None:
+        backends.append("selectolax")
+    if importlib.util.find_spec("lxml") is not None:
+        backends.append("lxml")
+    backends.append("html.parser")
+    return tuple(backends)
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_backend(backend=None):
+    """Resolve "auto"/None to the fastest installed backend and validate explicit choices."""
+    backend = backend or HTML_PARSER
+    installed = available_backends()
+    if backend == "auto":
+        return installed[0]
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown HTML parser backend: {backend} (choose from auto, {', '.join(BACKENDS)})")
+    if backend not in installed:
+        logging.warning(f"HTML parser backend {backend} is not installed, using {installed[0]}")
+        return installed[0]
+    return backend
+
+
+def _parse_listing_bs4(content, selectors, features):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, features, parse_only=selectors.strainer) if selectors.strainer else BeautifulSoup(content, features)
+    items = []
+    for container in selectors.find_items(soup):
+        name_tag = selectors.find_name(container)
+        name = name_tag.text if name_tag else None
+        price = None
+        for find_price in selectors.find_prices:
+            price_tag = find_price(container)
+            if price_tag:
+                price = price_tag.text
+                break
+        link_tag = selectors.find_link(container)
+        href = link_tag.get(selectors.link_attribute) if link_tag else None
+        items.append((name, price, href))
+    page_links = []
+    if selectors.find_pages:
+        page_links = [link_tag.get("href", "") for link_tag in selectors.find_pages(soup)]
+    return items, page_links
+
+
+def _parse_listing_selectolax(content, selectors):
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(content)
+    items = []
+    for container in tree.css(selectors.item):
+        name_tag = container.css_first(selectors.name)
+        name = name_tag.text() if name_tag else None
+        price = None
+        for selector in selectors.price:
+            price_tag = container.css_first(selector)
+            if price_tag:
+                price = price_tag.text()
+                break
+        link_tag = container.css_first(selectors.link)
+        href = link_tag.attributes.get(selectors.link_attribute) if link_tag else None
+        items.append((name, price, href))
+    page_links = []
+    if selectors.pages:
+        page_links = [link_tag.attributes.get("href") or "" for link_tag in tree.css(selectors.pages)]
+    return items, page_links
+
+
+def parse_listing(content, selectors, backend=None):
+    """
+    Extract raw product fields and pagination links from a listing page.
+
+    Args:
+        content: Page body (bytes or str)
+        selectors: ListingSelectors of the page's site
+        backend: Backend name or "auto" (defaults to GAMELOOT_HTML_PARSER)
+
+    Returns:
+        tuple: ([(name, price, href), ...], [pagination hrefs]) with None for missing fields
+    """
+    backend = resolve_backend(backend)
+    if backend == "selectolax":
+        return _parse_listing_selectolax(content, selectors)
+    return _parse_listing_bs4(content, selectors, backend)
@@ -0,0 +1,214 @@
+"""
+Shared HTTP client for all scrapers.
+
+Every request goes through one pooled requests.Session (keep-alive,
+gzip/brotli, connect/read timeouts) with retry and jittered backoff on
+429/5xx and connection errors. Each request is timed so a tracker run can
+log where its time went.
+"""
+
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+from metrics import HTTP_REQUEST_SECONDS
+
+# HTTP client settings
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))  # seconds
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))  # seconds
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))  # retries after the first attempt
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "1"))  # seconds, doubled per retry
+HTTP_BACKOFF_MAX = 30  # maximum delay between retries
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))  # keep-alive connections per host
+HTTP_HOST_RATE_LIMIT = float(os.getenv("HTTP_HOST_RATE_LIMIT", "4"))  # max requests/second per host, 0 = unlimited
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+USER_AGENT = "Mozilla/5.0 (compatible; gameloot-scrape-alert)"
+
+
+class HostRateLimiter:
+    """Space out request start times per host so concurrent workers stay polite."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.host_rates = {}  # host -> rate overriding the default, e.g. from a site spec
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        """Block until the next request slot for the URL's host is available."""
+        host = urlparse(url).netloc
+        rate = self.host_rates.get(host, self.rate)
+        if rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + 1 / rate
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RequestTimings:
+    """Thread-safe per-host request counters and latency totals."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hosts = {}
+
+    def record(self, url, elapsed, status, attempts):
+        host = urlparse(url).netloc
+        with self._lock:
+            stats = self.hosts.setdefault(host, {"requests": 0, "retries": 0, "errors": 0, "total": 0.0, "max": 0.0})
+            stats["requests"] += 1
+            stats["retries"] += attempts - 1
+            if status is None or status == 429 or status >= 500:
+                stats["errors"] += 1
+            stats["total"] += elapsed
+            stats["max"] = max(stats["max"], elapsed)
+
+    @property
+    def request_count(self):
+        with self._lock:
+            return sum(stats["requests"] for stats in self.hosts.values())
+
+    def summary(self):
+        """One-line summary per host, e.g. for the end-of-run log."""
+        with self._lock:
+            if not self.hosts:
+                return "no requests"
+            parts = []
+            for host, stats in self.hosts.items():
+                average = stats["total"] / stats["requests"]
+                parts.append(
+                    f"{host}: {stats['requests']} requests, {stats['retries']} retries, {stats['errors']} errors, "
+                    f"{stats['total']:.2f}s total, {average:.3f}s avg, {stats['max']:.3f}s max"
+                )
+            return "; ".join(parts)
+
+
+_session = None
+_session_lock = threading.Lock()
+_rate_limiter = HostRateLimiter(HTTP_HOST_RATE_LIMIT)
+_current_timings = contextvars.ContextVar("http_timings", default=None)
+total_timings = RequestTimings()
+
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                # ACCEPT_ENCODING includes br when the brotli package is installed
+                session.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": ACCEPT_ENCODING})
+                _session = session
+    return _session
+
+
+def set_host_rate_limit(host, rate):
+    """Override HTTP_HOST_RATE_LIMIT for one host (requests/second, 0 = unlimited)."""
+    _rate_limiter.host_rates[host] = rate
+
+
+def close_session():
+    """Close the pooled session and its keep-alive connections."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+@contextmanager
+def track_timings():
+    """Collect timings for every request made in this context (and tasks submitted from it)."""
+    timings = RequestTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def _record(url, start, status, attempts):
+    elapsed = time.perf_counter() - start
+    total_timings.record(url, elapsed, status, attempts)
+    HTTP_REQUEST_SECONDS.observe(elapsed, host=urlparse(url).netloc, status=status or "error")
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.record(url, elapsed, status, attempts)
+    logging.debug(f"GET {url} -> {status} in {elapsed:.3f}s ({attempts} attempt(s))")
+
+
+def _backoff_delay(attempt):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** (attempt - 1))))
+
+
+def _retry_after(response):
+    """Return the Retry-After delay in seconds if the server sent a numeric one."""
+    value = response.headers.get("Retry-After")
+    if value and value.strip().isdigit():
+        return min(int(value), HTTP_BACKOFF_MAX)
+    return None
+
+
+def get(url, timeout=None, **kwargs):
+    """
+    GET a URL through the shared session with rate limiting, timeouts and retries.
+
+    Args:
+        url: URL to fetch
+        timeout: (connect, read) timeout tuple, defaults to HTTP_CONNECT_TIMEOUT/HTTP_READ_TIMEOUT
+        **kwargs: Passed through to requests.Session.get
+
+    Returns:
+        requests.Response: Final response, which may still be a 429/5xx once retries are exhausted
+
+    Raises:
+        requests.RequestException: If every attempt failed to connect or timed out
+    """
+    if timeout is None:
+        timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    session = get_session()
+    attempt = 0
+    while True:
+        attempt += 1
+        _rate_limiter.wait(url)
+        if attempt == 1:
+            # Time from the first attempt, excluding rate-limit queueing before it
+            start = time.perf_counter()
+        try:
+            response = session.get(url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt > HTTP_MAX_RETRIES:
+                _record(url, start, None, attempt)
+                raise
+            delay = _backoff_delay(attempt)
+            logging.warning(f"GET {url} failed: {e}. Retrying in {delay:.1f} seconds (attempt {attempt}/{HTTP_MAX_RETRIES + 1})")
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or attempt > HTTP_MAX_RETRIES:
+                _record(url, start, response.status_code, attempt)
+                return response
+            delay = _retry_after(response)
+            response.close()
+            if delay is None:
+                delay = _backoff_delay(attempt)
+            logging.warning(
+                f"GET {url} returned {response.status_code}. Retrying in {delay:.1f} seconds (attempt {attempt}/{HTTP_MAX_RETRIES + 1})"
+            )
+        time.sleep(delay)
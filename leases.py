@@ -0,0 +1,243 @@
+"""
+Leases that let several scraper processes share the trackers (worker mode).
+
+With scraper.py --worker (or WORKER_MODE=1) every worker schedules every
+tracker as usual, but a run only goes ahead on the worker holding the
+tracker's lease in LEASES_COLLECTION of the configured StockStore: MongoDB
+for workers on several nodes, SQLite for several processes on one host.
+
+    - Leases are taken at run time and kept between runs, renewed by a
+      heartbeat thread every LEASE_HEARTBEAT_SECONDS. A worker that dies
+      stops renewing, and after LEASE_SECONDS its trackers go to the first
+      peer whose slot comes up.
+    - Each worker also holds a "worker:<id>" lease, so the live workers can
+      be counted. A worker takes no more than its fair share of the leases
+      (rounded up) and gives back leases above it after a run, so a new
+      worker gets work without anyone restarting.
+    - LEASE_SCOPE=category (default) leases every category on its own,
+      LEASE_SCOPE=site leases all categories of a site together, which
+      keeps the site's max_connections limit across workers.
+    - Before a run writes anything it renews its lease (check_lease()), and
+      stops with LeaseLost if another worker has taken it over meanwhile.
+
+Every acquisition bumps the lease's fencing token; a job that sees a new
+token drops its cached run journal, which another worker may have changed.
+Worker clocks must be in sync (NTP) to well within LEASE_SECONDS.
+"""
+
+import contextvars
+import functools
+import logging
+import math
+import os
+import socket
+import threading
+import time
+
+from metrics import LEASE_EVENTS, LEASES_HELD, set_tracker_active
+from storage import STORAGE_ERRORS
+
+WORKER_MODE = os.getenv("WORKER_MODE", "0") == "1"
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+LEASE_SECONDS = float(os.getenv("LEASE_SECONDS", "120"))  # a dead worker's trackers move after this long
+LEASE_HEARTBEAT_SECONDS = float(os.getenv("LEASE_HEARTBEAT_SECONDS", "30"))
+LEASE_SCOPE = os.getenv("LEASE_SCOPE", "category")
+LEASE_SCOPES = ("category", "site")
+WORKER_LEASE_PREFIX = "worker:"
+
+_current_lease = contextvars.ContextVar("current_lease", default=None)  # (manager, lease name) of the running job
+
+
+class LeaseLost(Exception):
+    """The worker no longer holds the lease of the run it is in the middle of."""
+
+
+def lease_name(category, scope=None):
+    """Lease of a spec category: the category itself or its whole site, per LEASE_SCOPE."""
+    scope = scope or LEASE_SCOPE
+    if scope not in LEASE_SCOPES:
+        raise ValueError(f"Unknown lease scope: {scope} (choose from {', '.join(LEASE_SCOPES)})")
+    return f"site:{category.site.name}" if scope == "site" else f"category:{category.job_name}"
+
+
+class LeaseManager:
+    """The leases of one worker, with the heartbeat thread that keeps them."""
+
+    def __init__(self, store, owner=None, seconds=None, heartbeat=None):
+        self.store = store
+        self.owner = owner or WORKER_ID
+        self.seconds = seconds or LEASE_SECONDS
+        self.heartbeat_seconds = heartbeat or LEASE_HEARTBEAT_SECONDS
+        if self.heartbeat_seconds >= self.seconds:
+            raise ValueError(f"LEASE_HEARTBEAT_SECONDS ({self.heartbeat_seconds:g}) must be shorter than LEASE_SECONDS ({self.seconds:g})")
+        self.names = set()  # job leases this worker runs trackers for
+        self.held = {}  # lease name -> fencing token
+        self.live_workers = 1
+        self._renewed_at = time.monotonic()
+        self._job_tokens = {}  # job name -> token of the lease its last run held
+        self._running = {}  # lease name -> runs in progress
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def worker_lease(self):
+        return f"{WORKER_LEASE_PREFIX}{self.owner}"
+
+    def start(self):
+        """Register the worker and start heartbeats."""
+        self.store.acquire_lease(self.worker_lease, self.owner, self.seconds)
+        self._count_workers()
+        self._renewed_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+        self._thread.start()
+        logging.info(f"Worker {self.owner} started ({self.live_workers} live worker(s), leases of {self.seconds:g}s)")
+        return self
+
+    def stop(self, release=True):
+        """Stop heartbeats and, unless release is False (a simulated crash), hand every lease back."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if not release:
+            return
+        with self._lock:
+            names = list(self.held) + [self.worker_lease]
+            self.held.clear()
+        for name in names:
+            try:
+                self.store.release_lease(name, self.owner)
+            except STORAGE_ERRORS as e:
+                logging.warning(f"Could not release lease {name}, it expires in {self.seconds:g}s: {e}")
+        LEASES_HELD.set(0)
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_seconds):
+            try:
+                self.heartbeat()
+            except STORAGE_ERRORS as e:
+                logging.warning(f"Lease heartbeat failed, retrying in {self.heartbeat_seconds:g}s: {e}")
+
+    def _count_workers(self):
+        now = time.time()
+        workers = [lease for lease in self.store.load_leases() if lease["name"].startswith(WORKER_LEASE_PREFIX) and lease["expiresAt"] >= now]
+        self.live_workers = max(1, len(workers))
+
+    def heartbeat(self):
+        """Renew every lease, dropping the ones another worker took over, and recount the live workers."""
+        with self._lock:
+            names = list(self.held) + [self.worker_lease]
+        started = time.monotonic()
+        kept = self.store.renew_leases(names, self.owner, self.seconds)
+        if self.worker_lease not in kept:
+            # Expired while we could not reach the database: register again
+            self.store.acquire_lease(self.worker_lease, self.owner, self.seconds)
+        with self._lock:
+            for name in [name for name in self.held if name not in kept]:
+                logging.warning(f"Lost lease {name} to another worker")
+                LEASE_EVENTS.inc(event="lost")
+                del self.held[name]
+            self._renewed_at = started
+            LEASES_HELD.set(len(self.held))
+        self._count_workers()
+
+    def fair_share(self):
+        return math.ceil(len(self.names) / self.live_workers)
+
+    def holds(self, name):
+        """True if the lease is ours and was renewed less than LEASE_SECONDS ago."""
+        with self._lock:
+            return name in self.held and time.monotonic() - self._renewed_at < self.seconds
+
+    def acquire(self, name):
+        """Try to take a lease. Returns True if this worker holds it now."""
+        token = self.store.acquire_lease(name, self.owner, self.seconds)
+        with self._lock:
+            if token is None:
+                self.held.pop(name, None)
+                return False
+            if name not in self.held:
+                logging.info(f"Acquired lease {name} (token {token})")
+                LEASE_EVENTS.inc(event="acquired")
+            self.held[name] = token
+            LEASES_HELD.set(len(self.held))
+            return True
+
+    def release(self, name):
+        with self._lock:
+            if self.held.pop(name, None) is None:
+                return
+            LEASES_HELD.set(len(self.held))
+        self.store.release_lease(name, self.owner)
+        LEASE_EVENTS.inc(event="released")
+        logging.info(f"Released lease {name} ({len(self.held)} held, fair share {self.fair_share()} of {len(self.names)})")
+
+    def check(self, name):
+        """Renew one lease right before a write. Raises LeaseLost if another worker holds it now."""
+        if name not in self.store.renew_leases([name], self.owner, self.seconds):
+            with self._lock:
+                self.held.pop(name, None)
+            LEASE_EVENTS.inc(event="lost")
+            raise LeaseLost(f"Lease {name} was taken over by another worker")
+
+    def _claim(self, job_name, name):
+        """Hold the lease for a run: already ours, or free and within our fair share."""
+        if self.holds(name):
+            return True
+        with self._lock:
+            over_share = len(self.held) >= self.fair_share()
+        if over_share or not self.acquire(name):
+            LEASE_EVENTS.inc(event="skipped")
+            logging.debug(f"{job_name} left to another worker ({len(self.held)} lease(s) held, fair share {self.fair_share()})")
+            return False
+        return True
+
+    def leased(self, job_name, name, func, on_acquire=None, can_release=None):
+        """
+        Wrap a tracker function so it only runs on the worker holding lease ``name``.
+
+        Args:
+            job_name: Tracker name (several jobs can share a lease with LEASE_SCOPE=site)
+            name: Lease name (see lease_name)
+            on_acquire: Called before the first run under a newly acquired lease
+            can_release: Returns False while the job cannot be handed over yet
+                (e.g. alerts still being delivered)
+        """
+        self.names.add(name)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self._claim(job_name, name):
+                set_tracker_active(job_name, False)
+                return None
+            set_tracker_active(job_name, True)
+            with self._lock:
+                token = self.held.get(name)
+                fresh = self._job_tokens.get(job_name) != token
+                self._job_tokens[job_name] = token
+                self._running[name] = self._running.get(name, 0) + 1
+            if fresh and on_acquire is not None:
+                on_acquire()
+            context_token = _current_lease.set((self, name))
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _current_lease.reset(context_token)
+                with self._lock:
+                    self._running[name] -= 1
+                    rebalance = not self._running[name] and len(self.held) > self.fair_share()
+                if rebalance and (can_release is None or can_release()):
+                    try:
+                        self.release(name)
+                    except STORAGE_ERRORS as e:
+                        logging.warning(f"Could not release lease {name}: {e}")
+
+        return wrapper
+
+
+def check_lease():
+    """Make sure the running job still holds its lease (no-op outside worker mode). Raises LeaseLost."""
+    current = _current_lease.get()
+    if current is not None:
+        manager, name = current
+        manager.check(name)
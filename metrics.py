@@ -0,0 +1,285 @@
+"""
+In-process metrics with a Prometheus text endpoint and a tracker health check.
+
+Counters, gauges and histograms are defined here and updated by the
+scraper: HTTP fetch latency, listing parse time, per-stage run time,
+storage call counts and latency, Telegram send latency, products and
+changes per run and the last successful run of every tracker.
+
+start_metrics_server() serves them on METRICS_HOST:METRICS_PORT:
+
+    /metrics: Prometheus text format
+    /health: 200, or 503 listing the trackers without a successful run
+             in METRICS_STALE_FACTOR x their interval
+
+Usage:
+    python metrics.py health    # exit 0 if healthy (docker healthcheck)
+"""
+
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # 0.0.0.0 to let Prometheus scrape from outside the container
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 0 = no endpoint
+METRICS_STALE_FACTOR = float(os.getenv("METRICS_STALE_FACTOR", "3"))  # missed intervals before a tracker is stale
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value:g}" for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block (also when it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def totals(self, **labels):
+        """Return (observations, sum) for one label set."""
+        with self._lock:
+            counts, total = self._values.get(self._key(labels)) or ((), 0.0)
+            return sum(counts), total
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class StageTimer:
+    """Record consecutive stages of a run: each lap() observes the time since the previous one."""
+
+    def __init__(self, histogram, **labels):
+        self.histogram = histogram
+        self.labels = labels
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.histogram.observe(now - self._last, stage=stage, **self.labels)
+        self._last = now
+
+
+HTTP_REQUEST_SECONDS = Histogram("gameloot_http_request_seconds", "Page fetch latency including retries", ("host", "status"))
+PAGE_PARSE_SECONDS = Histogram("gameloot_page_parse_seconds", "Listing page parse time", ("site",))
+RUN_STAGE_SECONDS = Histogram(
+    "gameloot_run_stage_seconds", "Time per stage of a tracker run (scrape, diff, watchlist, write, alerts)", ("job", "stage")
+)
+RUNS = Counter("gameloot_runs_total", "Tracker runs by result", ("job", "result"))
+RUN_PRODUCTS = Gauge("gameloot_run_products", "Products scraped by the last run after deduplication", ("job",))
+RUN_CHANGES = Counter("gameloot_run_changes_total", "Products written by change kind", ("job", "change"))
+DUPLICATES_DROPPED = Counter("gameloot_duplicates_dropped_total", "Duplicate listings dropped while scraping", ("job",))
+STORAGE_OP_SECONDS = Histogram("gameloot_storage_op_seconds", "Storage call latency (the count is the number of calls)", ("backend", "op"))
+STORAGE_ERRORS = Counter("gameloot_storage_errors_total", "Storage calls that raised", ("backend", "op"))
+TELEGRAM_SEND_SECONDS = Histogram("gameloot_telegram_send_seconds", "Telegram send_message latency per attempt", ("outcome",))
+TRACKER_LAST_SUCCESS = Gauge("gameloot_tracker_last_success_timestamp_seconds", "Unix time of the last successful run", ("job",))
+TRACKER_INTERVAL = Gauge("gameloot_tracker_interval_seconds", "Scheduled interval of each tracker", ("job",))
+LEASES_HELD = Gauge("gameloot_leases_held", "Tracker leases held by this worker (worker mode)", ())
+LEASE_EVENTS = Counter("gameloot_lease_events_total", "Lease acquisitions, losses, releases and runs left to other workers", ("event",))
+API_QUERIES = Counter("gameloot_api_queries_total", "Stock API queries by cache result (hit, miss)", ("query", "result"))
+
+_trackers = {}  # job name -> (interval seconds, registered at)
+_inactive_trackers = set()  # trackers another worker runs (worker mode)
+_trackers_lock = threading.Lock()
+
+
+def register_tracker(name, interval_seconds):
+    """Make a tracker part of the health check."""
+    with _trackers_lock:
+        _trackers[name] = (interval_seconds, time.time())
+    TRACKER_INTERVAL.set(interval_seconds, job=name)
+
+
+def set_tracker_active(name, active):
+    """Leave a tracker out of the health check while another worker runs it, counting afresh once it is back."""
+    with _trackers_lock:
+        if active and name in _inactive_trackers:
+            _inactive_trackers.discard(name)
+            if name in _trackers:
+                _trackers[name] = (_trackers[name][0], time.time())
+        elif not active:
+            _inactive_trackers.add(name)
+
+
+def record_success(name):
+    TRACKER_LAST_SUCCESS.set(time.time(), job=name)
+
+
+def stale_trackers(now=None, factor=None):
+    """
+    Return the registered trackers without a successful run in ``factor`` x their interval.
+
+    A tracker that never succeeded counts from when it was registered (or
+    taken back from another worker); trackers other workers run are skipped.
+
+    Returns:
+        list: (job name, seconds since the last success or registration) tuples
+    """
+    now = now or time.time()
+    factor = METRICS_STALE_FACTOR if factor is None else factor
+    stale = []
+    with _trackers_lock:
+        trackers = [(name, tracker) for name, tracker in _trackers.items() if name not in _inactive_trackers]
+    for name, (interval, registered_at) in trackers:
+        last = max(TRACKER_LAST_SUCCESS.value(job=name), registered_at)
+        if now - last > interval * factor:
+            stale.append((name, now - last))
+    return stale
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._respond(200, render_metrics(), "text/plain; version=0.0.4")
+        elif self.path == "/health":
+            stale = stale_trackers()
+            if stale:
+                self._respond(503, "".join(f"stale: {name} ({age:.0f}s since last success)\n" for name, age in stale))
+            else:
+                self._respond(200, "ok\n")
+        else:
+            self._respond(404, "not found\n")
+
+    def _respond(self, status, body, content_type="text/plain"):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(f"metrics {self.address_string()} {format % args}")
+
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Serve /metrics and /health on a daemon thread. Returns the server, or None if disabled."""
+    if not port:
+        logging.info("Metrics endpoint disabled (METRICS_PORT=0)")
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logging.info(f"Metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def main():
+    from urllib.error import HTTPError, URLError
+    from urllib.request import urlopen
+
+    if sys.argv[1:] != ["health"]:
+        print(__doc__)
+        return 2
+    host = "127.0.0.1" if METRICS_HOST in ("", "0.0.0.0") else METRICS_HOST
+    try:
+        with urlopen(f"http://{host}:{METRICS_PORT}/health", timeout=5) as response:
+            print(response.read().decode(), end="")
+            return 0
+    except HTTPError as e:
+        print(e.read().decode(), end="")
+    except URLError as e:
+        print(f"Metrics endpoint not reachable: {e.reason}")
+    return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
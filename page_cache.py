@@ -0,0 +1,162 @@
+"""
+Persistent listing page cache.
+
+Stores the ETag/Last-Modified validators, a content hash and the parsed
+products for every listing page of a category, so the next run can send
+conditional requests and skip parsing pages whose bytes have not changed.
+Products of unchanged pages are not diffed again, and when every page of a
+category is unchanged the caller can skip the whole diff and MongoDB phase.
+
+One entry per category is kept in PAGE_CACHE_COLLECTION of the configured
+StockStore so the cache survives container restarts.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+
+from storage import STORAGE_ERRORS, get_stock_store
+
+PAGE_CACHE_ENABLED = os.getenv("GAMELOOT_PAGE_CACHE", "1") != "0"
+
+
+def content_digest(content):
+    """Return the SHA-256 hex digest of a page body."""
+    return hashlib.sha256(content).hexdigest()
+
+
+class PageCache:
+    """Validators, content hashes and parsed products for one category's listing pages."""
+
+    def __init__(self, category, entries=None, store=None):
+        self.category = category
+        self.store = store
+        self.entries = {entry["url"]: entry for entry in (entries or [])}
+        self.pages = {}  # url -> entry seen during this run
+        self.unchanged_urls = set()
+        self._lock = threading.Lock()
+
+    def conditional_headers(self, url):
+        """Return If-None-Match/If-Modified-Since headers for a cached page, or None."""
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("lastModified"):
+            headers["If-Modified-Since"] = entry["lastModified"]
+        return headers or None
+
+    def match(self, url, response):
+        """Return the cached entry if the response is a 304 or has the same content hash, else None."""
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+        if response.status_code != 304 and content_digest(response.content) != entry["digest"]:
+            return None
+        entry = {
+            **entry,
+            "etag": response.headers.get("ETag", entry.get("etag")),
+            "lastModified": response.headers.get("Last-Modified", entry.get("lastModified")),
+        }
+        with self._lock:
+            self.pages[url] = entry
+            self.unchanged_urls.add(url)
+        return entry
+
+    def update(self, url, response, products, last_page):
+        """Record a freshly parsed page for this run."""
+        entry = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "lastModified": response.headers.get("Last-Modified"),
+            "digest": content_digest(response.content),
+            "products": [product.to_dict() for product in products],
+            "lastPage": last_page,
+        }
+        with self._lock:
+            self.pages[url] = entry
+            self.unchanged_urls.discard(url)
+
+    def forget(self, url):
+        """Drop the cached entry of a page this run took from elsewhere (the run journal), so no commit keeps it."""
+        with self._lock:
+            self.entries.pop(url, None)
+
+    def is_unchanged(self, url):
+        """True if the page matched its cached entry during this run."""
+        with self._lock:
+            return url in self.unchanged_urls
+
+    def _product_page_urls(self, entries):
+        return {url for url, entry in entries.items() if entry["products"]}
+
+    @property
+    def changed_page_count(self):
+        with self._lock:
+            return len(self._product_page_urls(self.pages) - self.unchanged_urls)
+
+    def category_unchanged(self):
+        """True if this run saw exactly the cached product pages and none of them changed."""
+        with self._lock:
+            current = self._product_page_urls(self.pages)
+            previous = self._product_page_urls(self.entries)
+            return bool(current) and current == previous and current <= self.unchanged_urls
+
+    def fetched_pages_unchanged(self):
+        """True if every product page fetched this run matched its cached entry (for runs that stop early)."""
+        with self._lock:
+            current = self._product_page_urls(self.pages)
+            return bool(current) and current <= self.unchanged_urls
+
+    def commit(self, merge=False):
+        """Persist this run's pages as the new cache for the category.
+
+        Call only after the run's database updates succeeded, so a failed run
+        is never skipped as "unchanged" on the next attempt.
+
+        Args:
+            merge: Keep the cached entries of pages this run did not fetch
+                (incremental runs), instead of replacing the whole category
+        """
+        if self.store is None:
+            return
+        with self._lock:
+            pages = {**self.entries, **self.pages} if merge else self.pages
+            entries = [entry for entry in pages.values() if entry["products"]]
+        try:
+            self.store.save_page_cache(self.category, entries)
+        except STORAGE_ERRORS as e:
+            logging.warning(f"Failed to save page cache for {self.category}: {e}")
+            # The stale cache no longer matches the database, drop it so the next run diffs every page
+            try:
+                self.store.delete_page_cache(self.category)
+            except STORAGE_ERRORS as e:
+                logging.warning(f"Failed to drop stale page cache for {self.category}: {e}")
+
+
+def load_page_cache(category, store=None):
+    """
+    Load the page cache for a category.
+
+    Args:
+        category: Category URL
+        store: StockStore holding the cache (defaults to the shared store)
+
+    Returns:
+        PageCache: Cache loaded from storage (empty if nothing cached yet)
+        None: If the cache is disabled or storage is unavailable
+    """
+    if not PAGE_CACHE_ENABLED:
+        return None
+    if store is None:
+        store = get_stock_store()
+    try:
+        entries = store.load_page_cache(category)
+    except STORAGE_ERRORS as e:
+        logging.warning(f"Page cache unavailable for {category}, fetching without it: {e}")
+        return None
+    logging.info(f"Loaded page cache for {category}: {len(entries)} page(s)")
+    return PageCache(category, entries, store)
@@ -0,0 +1,249 @@
+"""
+Bucketed price history.
+
+Price points used to be $push'ed onto an embedded priceHistory array in
+every product document, so long-lived listings grew without bound. They now
+live in PRICE_HISTORY_COLLECTION as bucket documents, each holding up to
+PRICE_HISTORY_BUCKET_SIZE points of one product:
+
+    {type, link, start, end, count, points: [{price, at, inStock}, ...]}
+
+New points go to the product's open bucket (count below the limit), or to a
+fresh bucket created by the same upsert. Buckets whose newest point is
+older than PRICE_HISTORY_RETENTION_DAYS are removed by a TTL index, and
+downsample_price_history() thins points older than
+PRICE_HISTORY_DOWNSAMPLE_DAYS to one point per day, keeping every stock
+change.
+
+Usage:
+    python price_history.py migrate [--batch 500] [--dry-run]
+    python price_history.py maintain
+"""
+
+import argparse
+import logging
+import os
+from datetime import datetime, timedelta
+
+import pymongo
+from pymongo import ReplaceOne, UpdateOne
+from db_utils import get_mongo_conn, ensure_indexes
+
+PRICE_HISTORY_COLLECTION = "gameloot_price_history"
+PRICE_HISTORY_BUCKET_SIZE = int(os.getenv("PRICE_HISTORY_BUCKET_SIZE", "200"))  # points per bucket document
+PRICE_HISTORY_RETENTION_DAYS = int(os.getenv("PRICE_HISTORY_RETENTION_DAYS", "730"))  # 0 = keep forever
+PRICE_HISTORY_DOWNSAMPLE_DAYS = int(os.getenv("PRICE_HISTORY_DOWNSAMPLE_DAYS", "30"))  # 0 = never downsample
+
+
+def price_history_indexes(retention_days=PRICE_HISTORY_RETENTION_DAYS):
+    """Index specs for the bucket collection: open-bucket lookups and the retention TTL."""
+    indexes = [
+        {"keys": [("type", pymongo.ASCENDING), ("link", pymongo.ASCENDING), ("count", pymongo.ASCENDING)], "name": "type_link_count"},
+    ]
+    if retention_days > 0:
+        indexes.append({"keys": [("end", pymongo.ASCENDING)], "name": "end_ttl", "expireAfterSeconds": retention_days * 86400})
+    return indexes
+
+
+def price_point(price, at, in_stock):
+    return {"price": price, "at": at, "inStock": in_stock}
+
+
+def build_history_ops(points, bucket_size=PRICE_HISTORY_BUCKET_SIZE):
+    """
+    Build the upserts that append price points to each product's open bucket.
+
+    Args:
+        points: List of (product_type, link, point) tuples, point from price_point()
+
+    Returns:
+        list: UpdateOne operations, one per point
+    """
+    ops = []
+    for product_type, link, point in points:
+        ops.append(
+            UpdateOne(
+                {"type": product_type, "link": link, "count": {"$lt": bucket_size}},
+                {
+                    "$push": {"points": point},
+                    "$inc": {"count": 1},
+                    "$min": {"start": point["at"]},
+                    "$max": {"end": point["at"]},
+                },
+                upsert=True,
+            )
+        )
+    return ops
+
+
+def unrecorded_points(collection, points, session=None):
+    """Leave out the points whose product already has a point at that time (one query per timestamp)."""
+    links = {}
+    for product_type, link, point in points:
+        links.setdefault((product_type, point["at"]), set()).add(link)
+    recorded = set()
+    for (product_type, at), batch in links.items():
+        query = {"type": product_type, "link": {"$in": list(batch)}, "points.at": at}
+        recorded.update((product_type, bucket["link"], at) for bucket in collection.find(query, {"_id": 0, "link": 1}, session=session))
+    return [(product_type, link, point) for product_type, link, point in points if (product_type, link, point["at"]) not in recorded]
+
+
+def record_price_history(collection, points, session=None, skip_recorded=False):
+    """
+    Append price points in one unordered bulk_write (in the session's transaction if one is given).
+
+    Args:
+        skip_recorded: Leave out points already stored, e.g. when replaying a diff an interrupted run partly wrote
+
+    Returns:
+        int: Number of points written
+    """
+    if skip_recorded:
+        points = unrecorded_points(collection, points, session)
+    ops = build_history_ops(points)
+    if ops:
+        collection.bulk_write(ops, ordered=False, session=session)
+    return len(ops)
+
+
+def load_price_history(collection, product_type, link):
+    """Return every stored point of one product, oldest first."""
+    buckets = collection.find({"type": product_type, "link": link}, {"_id": 0, "points": 1})
+    return sorted((point for bucket in buckets for point in bucket["points"]), key=lambda point: point["at"])
+
+
+def downsample_points(points, cutoff):
+    """Keep the last point of each day before the cutoff plus every point where the stock state flipped."""
+    kept = []
+    for index, point in enumerate(points):
+        if point["at"] >= cutoff:
+            kept.append(point)
+            continue
+        following = points[index + 1] if index + 1 < len(points) else None
+        last_of_day = following is None or following["at"].date() != point["at"].date() or following["at"] >= cutoff
+        stock_flip = not kept or kept[-1]["inStock"] != point["inStock"]
+        if last_of_day or stock_flip:
+            kept.append(point)
+    return kept
+
+
+def downsample_price_history(collection, older_than_days=PRICE_HISTORY_DOWNSAMPLE_DAYS, now=None):
+    """
+    Thin out points older than ``older_than_days`` in every bucket that has new ones.
+
+    Buckets remember the cutoff they were compacted to, so each run only
+    reads buckets with points added since the previous run's cutoff.
+
+    Returns:
+        int: Number of points removed
+    """
+    if older_than_days <= 0:
+        return 0
+    cutoff = (now or datetime.utcnow()) - timedelta(days=older_than_days)
+    query = {
+        "start": {"$lt": cutoff},
+        "$or": [{"compactedUntil": {"$exists": False}}, {"$expr": {"$gte": ["$end", "$compactedUntil"]}}],
+    }
+    ops = []
+    removed = 0
+    for bucket in collection.find(query, {"points": 1}):
+        points = sorted(bucket["points"], key=lambda point: point["at"])
+        kept = downsample_points(points, cutoff)
+        removed += len(points) - len(kept)
+        update = {"compactedUntil": cutoff}
+        if len(kept) != len(points):
+            update.update({"points": kept, "count": len(kept)})
+        ops.append(UpdateOne({"_id": bucket["_id"], "count": len(points)}, {"$set": update}))
+    if ops:
+        # The count filter skips buckets that received a point meanwhile, the next run picks them up
+        collection.bulk_write(ops, ordered=False)
+    logging.info(f"Downsampled price history older than {older_than_days} days: {len(ops)} bucket(s), {removed} point(s) removed")
+    return removed
+
+
+def migrate_embedded_history(products, history, batch_size=500, dry_run=False, bucket_size=PRICE_HISTORY_BUCKET_SIZE):
+    """
+    Move embedded priceHistory arrays from product documents into buckets.
+
+    Buckets get deterministic ids, so re-running after an interruption
+    rewrites the same buckets instead of duplicating points. The array is
+    only unset after its buckets have been written.
+
+    Returns:
+        tuple: (products migrated, points moved)
+    """
+    migrated = 0
+    moved = 0
+    cursor = products.find({"priceHistory": {"$exists": True}}, {"type": 1, "link": 1, "priceHistory": 1}, batch_size=batch_size)
+    bucket_ops = []
+    product_ops = []
+
+    def flush():
+        if dry_run:
+            return
+        if bucket_ops:
+            history.bulk_write(bucket_ops, ordered=False)
+        if product_ops:
+            products.bulk_write(product_ops, ordered=False)
+
+    for doc in cursor:
+        points = sorted((price_point(p.get("price"), p["at"], p.get("inStock", True)) for p in doc["priceHistory"] if p.get("at")), key=lambda p: p["at"])
+        for number, start in enumerate(range(0, len(points), bucket_size)):
+            chunk = points[start : start + bucket_size]
+            bucket = {
+                "_id": f"migrated:{doc['type']}:{doc['link']}:{number}",
+                "type": doc["type"],
+                "link": doc["link"],
+                "start": chunk[0]["at"],
+                "end": chunk[-1]["at"],
+                # Full buckets stay closed, the last one keeps taking points
+                "count": len(chunk),
+                "points": chunk,
+            }
+            bucket_ops.append(ReplaceOne({"_id": bucket["_id"]}, bucket, upsert=True))
+        product_ops.append(UpdateOne({"_id": doc["_id"]}, {"$unset": {"priceHistory": ""}}))
+        migrated += 1
+        moved += len(points)
+        if len(product_ops) >= batch_size:
+            flush()
+            bucket_ops.clear()
+            product_ops.clear()
+            logging.info(f"Migrated {migrated} product(s), {moved} point(s) so far")
+    flush()
+    logging.info(f"{'Would migrate' if dry_run else 'Migrated'} {migrated} product(s) and {moved} price point(s)")
+    return migrated, moved
+
+
+def main():
+    # Only configure logging and load .env when run as a script
+    import logging_config
+    from dotenv import load_dotenv
+    from storage import STORAGE_ERRORS, get_stock_store
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Price history maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate", help="move embedded priceHistory arrays into the bucket collection (MongoDB)")
+    migrate.add_argument("--collection", default="gameloot_products")
+    migrate.add_argument("--batch", type=int, default=500)
+    migrate.add_argument("--dry-run", action="store_true")
+    commands.add_parser("maintain", help="apply retention and downsampling now (any storage backend)")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "migrate":
+            history = get_mongo_conn(PRICE_HISTORY_COLLECTION)
+            ensure_indexes(history, price_history_indexes())
+            migrate_embedded_history(get_mongo_conn(args.collection), history, args.batch, args.dry_run)
+        else:
+            store = get_stock_store()
+            store.prepare()
+            store.maintain_price_history()
+    except STORAGE_ERRORS as e:
+        logging.error(f"Price history {args.command} failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
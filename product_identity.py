@@ -0,0 +1,306 @@
+"""
+Product identity: canonical model keys for listing names.
+
+Stock is tracked per listing link, so a card relisted under a new URL used
+to look like a product never seen before. Each stored product now also has
+a model key built from its name:
+
+    brand|chipset|memory|variant    e.g. "zotac|rtx 3060|12gb|ti"
+
+    brand: board partner or maker (asus, msi, zotac, amd, ...), "-" if none
+    chipset: GPU/CPU/chipset model (rtx 3060, rx 6700, ryzen 5 5600x,
+             i7 12700k, b550) or memory type (ddr4)
+    memory: VRAM or RAM capacity (kits added up), "-" if none
+    variant: ti/super/xt/xtx/gre for GPUs, the speed for RAM
+
+Names without a recognisable chipset fall back to "name:<normalized name>".
+
+A ModelIndex per product type holds the known keys and a character
+trigram inverted index over the names. A name whose memory size is
+missing joins the only known memory size of its brand/chipset/variant.
+An unparsed name is matched to the most similar known name (Dice
+similarity of trigrams, MODEL_MATCH_THRESHOLD, same numbers). Only the
+names with the same numbers are scored, or for a name without numbers
+those sharing one of its rarest trigrams (enough of them that any name
+above the threshold must hold one), so a lookup does not scan every known
+name.
+
+New-listing alerts use the keys to show the price range the same model
+was listed at before (see site_engine).
+
+Usage:
+    python product_identity.py key "ZOTAC Gaming GeForce RTX 3060 Ti Twin Edge 8GB"
+    python product_identity.py backfill [--type gpu]    # key stored products that have none
+"""
+
+import argparse
+import logging
+import math
+import os
+import re
+import threading
+import time
+
+MODEL_MATCH_THRESHOLD = float(os.getenv("MODEL_MATCH_THRESHOLD", "0.8"))  # trigram similarity an unparsed name needs to join a known one
+MODEL_INDEX_REFRESH_MINUTES = float(os.getenv("MODEL_INDEX_REFRESH_MINUTES", "60"))  # reload of the stored keys (other workers' listings)
+NAME_KEY_PREFIX = "name:"
+
+# Board partners first: "ASUS ... NVIDIA GeForce" is an ASUS card
+BRANDS = (
+    "asus", "msi", "gigabyte", "zotac", "galax", "palit", "inno3d", "sapphire", "powercolor", "xfx", "evga", "pny",
+    "colorful", "gainward", "asrock", "biostar", "corsair", "gskill", "kingston", "adata", "xpg", "crucial",
+    "teamgroup", "hyperx", "nvidia", "amd", "intel",
+)
+_BRAND_RANK = {brand: rank for rank, brand in enumerate(BRANDS)}
+_ALIASES = [
+    (re.compile(r"\bg\.?\s?skill\b"), "gskill"),
+    (re.compile(r"\bteam\s?group\b|\bt-force\b"), "teamgroup"),
+    (re.compile(r"\binno\s?3d\b"), "inno3d"),
+    (re.compile(r"\bpower\s?color\b"), "powercolor"),
+    (re.compile(r"\b(rtx|gtx|rx)(?=\d)"), r"\1 "),
+    (re.compile(r"\b(\d{3,4})(ti|super|xtx|xt|gre)\b"), r"\1 \2"),
+    (re.compile(r"\b(i[3579])-(?=\d)"), r"\1 "),
+    (re.compile(r"(\d+)\s*gb\b"), r"\1gb"),
+    # "12G" VRAM, but not a "5600G" APU
+    (re.compile(r"\b(\d{1,2})\s*g\b"), r"\1gb"),
+    (re.compile(r"(\d+)\s*mhz\b"), r"\1mhz"),
+]
+# (pattern, chipset template), first match wins
+_CHIPSETS = [
+    (re.compile(r"\b(rtx|gtx|gt) (\d{3,4})\b"), "{0} {1}"),
+    (re.compile(r"\brx (\d{3,4})\b"), "rx {0}"),
+    (re.compile(r"\barc ([ab]\d{3})\b"), "arc {0}"),
+    (re.compile(r"\bryzen ([3579]) (\d{4}[a-z0-9]{0,3})\b"), "ryzen {0} {1}"),
+    (re.compile(r"\bthreadripper (\d{4}[a-z]{0,2})\b"), "threadripper {0}"),
+    (re.compile(r"\b(i[3579]) (\d{4,5}[a-z]{0,2})\b"), "{0} {1}"),
+    (re.compile(r"\b([abhxz]\d{3})[a-z]?\b"), "{0}"),
+    (re.compile(r"\bddr([345])\b"), "ddr{0}"),
+]
+_CHIP_MAKERS = {"rtx": "nvidia", "gtx": "nvidia", "gt": "nvidia", "rx": "amd", "ryzen": "amd", "threadripper": "amd", "arc": "intel"}
+_GPU_VARIANTS = ("ti", "super", "xtx", "xt", "gre")
+_KIT = re.compile(r"\b(\d+)\s?x\s?(\d+)gb\b")
+_MEMORY = re.compile(r"\b(\d+)gb\b")
+_SPEED = re.compile(r"\b(\d{4})mhz\b")
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_NUMBER = re.compile(r"\d+")
+
+
+def normalize_name(name):
+    """Lowercase a name, unify brand spellings and units and reduce it to words separated by single spaces."""
+    text = name.lower().replace("&amp;", "&")
+    for pattern, replacement in _ALIASES:
+        text = pattern.sub(replacement, text)
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def extract_model(name):
+    """
+    Pick brand, chipset, memory and variant out of a listing name.
+
+    Returns:
+        dict: {"brand", "chipset", "memory", "variant"}, None for parts not found
+    """
+    text = normalize_name(name)
+    model = {"brand": None, "chipset": None, "memory": None, "variant": None}
+    for pattern, template in _CHIPSETS:
+        match = pattern.search(text)
+        if match:
+            model["chipset"] = template.format(*match.groups())
+            if model["chipset"].startswith("ddr"):
+                speed = _SPEED.search(text)
+                model["variant"] = speed.group(1) if speed else None
+            else:
+                variants = [word for word in text[match.end() :].split()[:2] if word in _GPU_VARIANTS]
+                model["variant"] = " ".join(variants) or None
+            break
+    brands = [word for word in text.split() if word in _BRAND_RANK]
+    if brands:
+        model["brand"] = min(brands, key=_BRAND_RANK.get)
+    elif model["chipset"]:
+        first = model["chipset"].split()[0]
+        model["brand"] = _CHIP_MAKERS.get(first) or ("intel" if re.fullmatch(r"i[3579]", first) else None)
+    # "2x8gb" is a RAM kit, "Ventus 2X 12GB" a card
+    kit = _KIT.search(text) if (model["chipset"] or "").startswith("ddr") else None
+    if kit:
+        model["memory"] = f"{int(kit.group(1)) * int(kit.group(2))}gb"
+    else:
+        memory = _MEMORY.search(text)
+        model["memory"] = memory.group(0) if memory else None
+    return model
+
+
+def format_model_key(model):
+    return "|".join(model[part] or "-" for part in ("brand", "chipset", "memory", "variant"))
+
+
+def model_key(name):
+    """The model key of a name on its own, without a ModelIndex (see the module docstring)."""
+    model = extract_model(name)
+    if model["chipset"] is None:
+        return NAME_KEY_PREFIX + normalize_name(name)
+    return format_model_key(model)
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class ModelIndex:
+    """Known model keys of one product type, with a trigram index over the names they were seen under."""
+
+    def __init__(self):
+        self.keys = {}  # link -> model key
+        self._links = {}  # model key -> number of links
+        self._memory = {}  # (brand, chipset, variant) -> memory sizes seen
+        self._names = {}  # normalized name -> (name id, model key)
+        self._grams = []  # name id -> (trigrams, numbers, model key)
+        self._postings = {}  # trigram -> name ids of names without numbers
+        self._numbered = {}  # numbers in a name -> name ids
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._links)
+
+    def add(self, link, name, key=None):
+        """Remember a listing under ``key`` (resolved from the name if None). Returns the key."""
+        key = key or self.resolve(name)
+        with self._lock:
+            previous = self.keys.get(link)
+            if previous == key:
+                return key
+            if previous is not None:
+                self._links[previous] -= 1
+            self.keys[link] = key
+            self._links[key] = self._links.get(key, 0) + 1
+            if not key.startswith(NAME_KEY_PREFIX):
+                brand, chipset, memory, variant = key.split("|")
+                if memory != "-":
+                    self._memory.setdefault((brand, chipset, variant), set()).add(memory)
+            text = normalize_name(name)
+            if text not in self._names:
+                name_id = len(self._grams)
+                grams = trigrams(text)
+                numbers = frozenset(_NUMBER.findall(text))
+                self._names[text] = (name_id, key)
+                self._grams.append((grams, numbers, key))
+                if numbers:
+                    self._numbered.setdefault(numbers, []).append(name_id)
+                else:
+                    for gram in grams:
+                        self._postings.setdefault(gram, []).append(name_id)
+        return key
+
+    def resolve(self, name):
+        """The model key for a name, joined to a known model where the name leaves it open (see the module docstring)."""
+        model = extract_model(name)
+        with self._lock:
+            if model["chipset"] is not None:
+                key = format_model_key(model)
+                if model["memory"] is None and key not in self._links:
+                    sizes = self._memory.get((model["brand"] or "-", model["chipset"], model["variant"] or "-"), ())
+                    if len(sizes) == 1:
+                        key = format_model_key({**model, "memory": next(iter(sizes))})
+                return key
+            text = normalize_name(name)
+            known = self._names.get(text)
+            if known is not None:
+                return known[1]
+            match = self._best_match(text)
+        return match or NAME_KEY_PREFIX + text
+
+    def _best_match(self, text):
+        """Key of the most similar known name with the same numbers, or None below MODEL_MATCH_THRESHOLD."""
+        grams = trigrams(text)
+        numbers = frozenset(_NUMBER.findall(text))
+        if numbers:
+            return _most_similar(grams, numbers, self._numbered.get(numbers, ()), self._grams)
+        # A name with Dice similarity t shares at least t / (2 - t) of these trigrams,
+        # so it holds one of the rarest len(grams) - ceil(that share) + 1
+        shared = math.ceil(MODEL_MATCH_THRESHOLD / (2 - MODEL_MATCH_THRESHOLD) * len(grams) - 1e-9)
+        ranked = sorted(grams, key=lambda gram: (len(self._postings.get(gram, ())), gram))
+        candidates = {name_id for gram in ranked[: len(grams) - shared + 1] for name_id in self._postings.get(gram, ())}
+        return _most_similar(grams, numbers, candidates, self._grams)
+
+
+def _most_similar(grams, numbers, name_ids, known):
+    """Key of the known name scoring highest (earliest added on a tie) at or above MODEL_MATCH_THRESHOLD."""
+    best, best_rank = None, None
+    for name_id in name_ids:
+        candidate, candidate_numbers, key = known[name_id]
+        if candidate_numbers != numbers:
+            continue
+        score = 2 * len(grams & candidate) / (len(grams) + len(candidate))
+        if score >= MODEL_MATCH_THRESHOLD and (best_rank is None or (score, -name_id) > best_rank):
+            best, best_rank = key, (score, -name_id)
+    return best
+
+
+_indexes = {}  # product type -> (ModelIndex, loaded at)
+_indexes_lock = threading.Lock()
+
+
+def get_model_index(store, product_type):
+    """
+    Return the ModelIndex of a product type, loading the stored names and keys at most every MODEL_INDEX_REFRESH_MINUTES.
+
+    Products stored before model keys existed are keyed on load (see backfill).
+    """
+    with _indexes_lock:
+        cached = _indexes.get(product_type)
+        if cached is not None and time.monotonic() - cached[1] < MODEL_INDEX_REFRESH_MINUTES * 60:
+            return cached[0]
+        index = ModelIndex()
+        for link, name, key in store.load_model_names(product_type):
+            index.add(link, name or "", key)
+        _indexes[product_type] = (index, time.monotonic())
+        logging.debug(f"Loaded {len(index.keys)} {product_type} listing(s) into the model index ({len(index)} model(s))")
+        return index
+
+
+def reset_model_indexes():
+    """Drop the loaded indexes so the next run reloads them."""
+    with _indexes_lock:
+        _indexes.clear()
+
+
+def main():
+    # Only configure logging and load .env when run as a script
+    import logging_config
+    from dotenv import load_dotenv
+    from sites import load_site_specs
+    from storage import STORAGE_ERRORS, get_stock_store
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Product model keys")
+    commands = parser.add_subparsers(dest="command", required=True)
+    key = commands.add_parser("key", help="show the model key of a listing name")
+    key.add_argument("name")
+    backfill = commands.add_parser("backfill", help="store model keys for products stored without one")
+    backfill.add_argument("--type", action="append", help="product type to key (default: every spec category)")
+    args = parser.parse_args()
+
+    if args.command == "key":
+        print(model_key(args.name))
+        return 0
+    types = args.type or sorted({category.store_type for site in load_site_specs() for category in site.categories})
+    store = get_stock_store()
+    try:
+        store.prepare()
+        for product_type in types:
+            stored = store.load_model_names(product_type)
+            index = ModelIndex()
+            # Keyed products first, so the unkeyed ones can join their models
+            for link, name, stored_key in sorted(stored, key=lambda row: row[2] is None):
+                index.add(link, name or "", stored_key)
+            missing = {link: index.keys[link] for link, _, stored_key in stored if stored_key is None}
+            store.write_model_keys(product_type, missing)
+            print(f"{product_type}: keyed {len(missing)} of {len(stored)} product(s), {len(index)} model(s)")
+    except STORAGE_ERRORS as e:
+        logging.error(f"Model key backfill failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,159 @@
+"""
+Compact product records and key-based deduplication.
+
+Scraped products travel through the pipeline as ProductRecord objects
+(``__slots__``, no per-instance dict) and are only turned into dictionaries
+when they are written to MongoDB or the page cache.
+
+Duplicates are detected on a normalized (type, canonical link) key in one
+set/dict lookup per product, instead of hashing every field of every
+product. When the same listing shows up twice (e.g. on two pages while the
+shop reorders), GAMELOOT_DEDUP_POLICY decides which copy is kept:
+
+    first: the first copy seen (default)
+    lowest: the copy with the lowest price
+    last: the last copy seen
+
+The surviving products keep the order in which their key was first seen.
+"""
+
+import logging
+import os
+from urllib.parse import urlsplit, urlunsplit
+
+DEDUP_POLICIES = ("first", "lowest", "last")
+DEDUP_POLICY = os.getenv("GAMELOOT_DEDUP_POLICY", "first")
+
+
+class ProductRecord:
+    """One scraped listing."""
+
+    __slots__ = ("name", "price", "link", "in_stock", "type", "model")
+
+    def __init__(self, name, price, link, in_stock=True, type=None, model=None):
+        self.name = name
+        self.price = price
+        self.link = link
+        self.in_stock = in_stock
+        self.type = type
+        self.model = model  # model key (see product_identity), set for changed products before they are written
+
+    @classmethod
+    def from_dict(cls, doc):
+        return cls(doc["name"], doc["price"], doc["link"], doc.get("inStock", True), doc.get("type"), doc.get("modelKey"))
+
+    def to_dict(self):
+        """Return the document stored in MongoDB ("type" and "modelKey" only once they are set)."""
+        doc = {"name": self.name, "price": self.price, "link": self.link, "inStock": self.in_stock}
+        if self.type is not None:
+            doc["type"] = self.type
+        if self.model is not None:
+            doc["modelKey"] = self.model
+        return doc
+
+    @property
+    def key(self):
+        return (self.type, self.link)
+
+    def __eq__(self, other):
+        if not isinstance(other, ProductRecord):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        return f"ProductRecord({self.name!r}, {self.price!r}, {self.link!r}, in_stock={self.in_stock}, type={self.type!r})"
+
+
+def canonical_link(link):
+    """
+    Normalize a product link so the same listing always gets the same key.
+
+    Lowercases the scheme and host and drops the query string and fragment
+    (tracking parameters, ?stock=instock). Anything that is not an http(s)
+    URL, such as the "No link found" placeholder, is returned unchanged.
+    """
+    # Fast path: links scraped from the listing are normally canonical already
+    if "?" not in link and "#" not in link:
+        scheme, separator, rest = link.partition("://")
+        if scheme in ("http", "https") and separator:
+            host, slash, _ = rest.partition("/")
+            if slash and host and host == host.lower():
+                return link
+    parts = urlsplit(link)
+    if parts.scheme.lower() not in ("http", "https") or not parts.netloc:
+        return link
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", "", ""))
+
+
+def _resolve_policy(policy):
+    policy = policy or DEDUP_POLICY
+    if policy not in DEDUP_POLICIES:
+        raise ValueError(f"Unknown dedup policy: {policy} (choose from {', '.join(DEDUP_POLICIES)})")
+    return policy
+
+
+class ProductDeduplicator:
+    """
+    Streaming duplicate filter keyed on (type, canonical link).
+
+    Only the key and the current winner's price are kept per product, so a
+    whole category can be streamed through it page by page.
+    """
+
+    def __init__(self, policy=None):
+        self.policy = _resolve_policy(policy)
+        self.prices = {}  # key -> price of the copy currently kept
+        self.collisions = 0
+
+    def __len__(self):
+        return len(self.prices)
+
+    def __contains__(self, key):
+        return key in self.prices
+
+    def offer(self, record):
+        """
+        Canonicalize a record's link and check it against the copies seen so far.
+
+        Returns:
+            str: "new" for the first copy of a key, "replace" if this copy wins
+            over the one kept so far, "skip" if the kept copy stays
+        """
+        record.link = canonical_link(record.link)
+        key = record.key
+        if key not in self.prices:
+            self.prices[key] = record.price
+            return "new"
+
+        self.collisions += 1
+        logging.debug(f"Duplicate listing ({self.policy} wins): {record.link}")
+        if self.policy == "last" or (self.policy == "lowest" and record.price < self.prices[key]):
+            self.prices[key] = record.price
+            return "replace"
+        return "skip"
+
+    def log_summary(self):
+        if self.collisions:
+            logging.info(f"Dropped {self.collisions} duplicate listing(s) ({self.policy} wins)")
+
+
+def dedup_products(records, policy=None):
+    """
+    Remove duplicate listings from a list of records, keeping the original order.
+
+    Args:
+        records: ProductRecord list (links are canonicalized in place)
+        policy: "first", "lowest" or "last" (defaults to GAMELOOT_DEDUP_POLICY)
+
+    Returns:
+        list: One record per (type, canonical link), in first-seen order
+    """
+    dedup = ProductDeduplicator(policy)
+    kept = {}
+    for record in records:
+        outcome = dedup.offer(record)
+        if outcome != "skip":
+            # Assigning to an existing key keeps its first-seen position
+            kept[record.key] = record
+    dedup.log_summary()
+    return list(kept.values())
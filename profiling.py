@@ -0,0 +1,252 @@
+"""
+Optional profiler for tracker runs.
+
+Off by default, in which case scheduler jobs are not wrapped at all. Two
+triggers, which can be combined:
+
+    PROFILE_EVERY=N: profile every Nth run of each tracker
+    PROFILE_SLOWER_THAN=S: sample every run and keep the profile of runs
+        that took at least S seconds
+
+Runs are profiled with a stack sampler by default (PROFILE_MODE=sample):
+a background thread reads the stacks of the tracker thread and of its page
+fetch workers every PROFILE_INTERVAL seconds, so the overhead is a few
+percent whatever the code does. Samples are written in the folded format
+(one "frame;frame;frame count" line per stack) that flamegraph.pl,
+speedscope and inferno read. PROFILE_MODE=cprofile runs the Nth-run
+profiles under cProfile instead (.prof for pstats/snakeviz plus a text
+summary); it only sees the tracker thread and adds far more overhead, so
+slow-run captures always use the sampler.
+
+Dumps go to PROFILE_DIR as <time>-<job>-<seconds>s.<ext>, and only the
+newest PROFILE_KEEP runs are kept. Sampled runs also get a .txt summary
+of where the samples went (network, parsing, database, telegram, waiting
+or other, which is logged as well) and of the hottest frames.
+
+The settings can also be given to scraper.py (--profile-every,
+--profile-slower-than, --profile-dir, --profile-mode).
+"""
+
+import collections
+import cProfile
+import functools
+import io
+import itertools
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from datetime import datetime
+
+PROFILE_EVERY = int(os.getenv("PROFILE_EVERY", "0"))  # 0 = never
+PROFILE_SLOWER_THAN = float(os.getenv("PROFILE_SLOWER_THAN", "0"))  # seconds, 0 = never
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sample")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))  # profiled runs kept in PROFILE_DIR
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.01"))  # seconds between samples
+PROFILE_MODES = ("sample", "cprofile")
+PROFILE_EXTENSIONS = (".folded", ".prof", ".txt")
+
+# Where a sample's time went, by the first matching frame from the innermost one out
+SAMPLE_CATEGORIES = [
+    ("network", ("socket.py", "ssl.py", "/requests/", "/urllib3/", "/http/client.py", "http_client.py")),
+    ("parsing", ("/bs4/", "/lxml/", "selectolax", "html_parsers.py", "/html/parser.py")),
+    ("database", ("/pymongo/", "/bson/", "/mongomock/", "sqlite3", "storage.py", "price_history.py")),
+    ("telegram", ("/telegram/", "/httpx/", "telegram_helper.py")),
+]
+WAITING_FILES = ("threading.py", "/concurrent/futures/", "queue.py")
+
+
+def configure(every=None, slower_than=None, directory=None, mode=None, keep=None):
+    """Override the environment settings (used by the scraper.py flags)."""
+    global PROFILE_EVERY, PROFILE_SLOWER_THAN, PROFILE_DIR, PROFILE_MODE, PROFILE_KEEP
+    if mode is not None and mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode: {mode} (choose from {', '.join(PROFILE_MODES)})")
+    if every is not None:
+        PROFILE_EVERY = every
+    if slower_than is not None:
+        PROFILE_SLOWER_THAN = slower_than
+    if directory is not None:
+        PROFILE_DIR = directory
+    if mode is not None:
+        PROFILE_MODE = mode
+    if keep is not None:
+        PROFILE_KEEP = keep
+
+
+def profiling_enabled():
+    return PROFILE_EVERY > 0 or PROFILE_SLOWER_THAN > 0
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _fold(frame, root):
+    """Folded stack of a frame, outermost first."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.append(root)
+    return ";".join(reversed(labels))
+
+
+def _categorize(frame):
+    if any(part in frame.f_code.co_filename for part in WAITING_FILES):
+        return "waiting"
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        for category, parts in SAMPLE_CATEGORIES:
+            if any(part in filename for part in parts):
+                return category
+        frame = frame.f_back
+    return "other"
+
+
+class StackSampler:
+    """
+    Sample the stacks of one thread and of the threads whose name starts with a prefix.
+
+    Samples are counted as folded stacks and by category (see SAMPLE_CATEGORIES).
+    """
+
+    def __init__(self, thread_id, thread_prefix=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.thread_prefix = thread_prefix
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.categories = collections.Counter()
+        self.leaves = collections.Counter()  # samples per innermost frame (self time)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _threads(self):
+        threads = {self.thread_id: "tracker"}
+        if self.thread_prefix:
+            for thread in threading.enumerate():
+                if thread.name.startswith(self.thread_prefix):
+                    threads[thread.ident] = "fetch"
+        return threads
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident, root in self._threads().items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[_fold(frame, root)] += 1
+                    self.categories[_categorize(frame)] += 1
+                    self.leaves[_frame_label(frame.f_code)] += 1
+            del frames
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, top=20):
+        total = sum(self.leaves.values()) or 1
+        lines = [f"{total} samples every {self.interval * 1000:g} ms: {format_categories(self.categories)}", "", "Self time:"]
+        lines.extend(f"{count / total:6.1%}  {frame}" for frame, count in self.leaves.most_common(top))
+        return "\n".join(lines) + "\n"
+
+
+def format_categories(categories):
+    total = sum(categories.values()) or 1
+    return ", ".join(f"{name} {count / total:.0%}" for name, count in categories.most_common())
+
+
+def _rotate(directory, keep):
+    """Delete all but the newest ``keep`` profiled runs (every file of a run shares its stem)."""
+    runs = {}
+    for file_name in os.listdir(directory):
+        stem, ext = os.path.splitext(file_name)
+        if ext in PROFILE_EXTENSIONS:
+            runs.setdefault(stem, []).append(os.path.join(directory, file_name))
+    for stem in sorted(runs)[: max(0, len(runs) - keep)]:
+        for path in runs[stem]:
+            os.remove(path)
+
+
+def _dump_path(name, duration, ext):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    return os.path.join(PROFILE_DIR, f"{stamp}-{name}-{duration:.1f}s{ext}")
+
+
+def _write_sample(name, duration, sampler, reason):
+    path = _dump_path(name, duration, ".folded")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(sampler.folded())
+    with open(os.path.splitext(path)[0] + ".txt", "w", encoding="utf-8") as f:
+        f.write(sampler.summary())
+    _rotate(PROFILE_DIR, PROFILE_KEEP)
+    logging.info(f"Profile of {name} ({reason}, {duration:.1f}s): {format_categories(sampler.categories)} -> {path}")
+    return path
+
+
+def _write_cprofile(name, duration, profile):
+    path = _dump_path(name, duration, ".prof")
+    profile.dump_stats(path)
+    text = io.StringIO()
+    pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(40)
+    with open(os.path.splitext(path)[0] + ".txt", "w", encoding="utf-8") as f:
+        f.write(text.getvalue())
+    _rotate(PROFILE_DIR, PROFILE_KEEP)
+    logging.info(f"cProfile of {name} ({duration:.1f}s) -> {path}")
+    return path
+
+
+def _profile_run(name, run, func, args, kwargs):
+    nth = PROFILE_EVERY > 0 and run % PROFILE_EVERY == 0
+    if not nth and PROFILE_SLOWER_THAN <= 0:
+        return func(*args, **kwargs)
+
+    if nth and PROFILE_MODE == "cprofile":
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            _write_cprofile(name, time.perf_counter() - start, profile)
+
+    sampler = StackSampler(threading.get_ident(), f"{name}-").start()
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        duration = time.perf_counter() - start
+        sampler.stop()
+        if nth:
+            _write_sample(name, duration, sampler, f"run {run}")
+        elif duration >= PROFILE_SLOWER_THAN:
+            _write_sample(name, duration, sampler, f"slower than {PROFILE_SLOWER_THAN:g}s")
+
+
+def profiled(name, func):
+    """
+    Wrap a tracker function so its runs are profiled per the PROFILE_* settings.
+
+    Returns func itself when profiling is disabled, so disabled profiling
+    costs nothing. Worker threads named "<name>-..." are sampled with the
+    tracker thread.
+    """
+    if not profiling_enabled():
+        return func
+    runs = itertools.count(1)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return _profile_run(name, next(runs), func, args, kwargs)
+
+    return wrapper
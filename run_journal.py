@@ -0,0 +1,326 @@
+"""
+Crash-safe journal of tracker runs.
+
+Each category job keeps one journal document (RUN_JOURNAL_COLLECTION) that
+follows its run through three phases:
+
+    scraping: fetched listing pages are checkpointed every
+              RUN_JOURNAL_CHECKPOINT_SECONDS
+    diffed: the stock diff and the alerts it produces (the outbox) are
+            saved, before anything is written
+    applied: the diff is in the stock state and price history, and only
+             undelivered alerts are left
+
+The journal is only written once a run has something worth keeping, so a
+quick unchanged run costs nothing. When a run starts after a crash it looks
+at the journal first:
+
+    diffed: the saved diff is applied again with the timestamp of the
+            interrupted run, skipping price points it already recorded, and
+            its alerts are sent
+    applied: the alerts that were never delivered are sent again
+    scraping: pages checkpointed less than RUN_JOURNAL_FRESHNESS_MINUTES
+              ago are reused instead of fetched
+
+Without a transaction (standalone MongoDB) a crash can land between the
+stock writes and the "applied" mark. Replaying then rewrites the same
+documents with the same timestamps (so "firstSeenAt" keeps the original
+time) and adds no second copy of a price point.
+
+Alerts are only ever sent from the outbox and each one is marked as
+delivered on its own, so every alert goes out once. An alert that only
+reached some of its chats keeps how far each chat got, and the next run
+sends only the rest. The one gap left is a crash after Telegram accepted a
+message but before it was marked, which sends that message again.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from products import ProductRecord
+from stock_diff import StockDiff
+from storage import STORAGE_ERRORS
+
+RUN_JOURNAL_ENABLED = os.getenv("RUN_JOURNAL", "1") != "0"
+RUN_JOURNAL_FRESHNESS_MINUTES = float(os.getenv("RUN_JOURNAL_FRESHNESS_MINUTES", "10"))  # checkpointed pages reused on resume
+RUN_JOURNAL_CHECKPOINT_SECONDS = float(os.getenv("RUN_JOURNAL_CHECKPOINT_SECONDS", "10"))  # scraping time between page checkpoints
+
+_journals = {}  # job name -> RunJournal, the in-process state stays authoritative
+_journals_lock = threading.Lock()
+
+
+def diff_to_doc(diff):
+    """Serialize a StockDiff for the journal."""
+    return {
+        "new": [record.to_dict() for record in diff.new],
+        "restocked": [record.to_dict() for record in diff.restocked],
+        "priceChanged": [record.to_dict() for record in diff.price_changed],
+        "sold": [dict(stored) for stored in diff.sold],
+        # Links contain dots, which MongoDB field names must not
+        "previousPrices": [[link, price] for link, price in diff.previous_prices.items()],
+        "scraped": diff.scraped,
+        "unchanged": diff.unchanged,
+    }
+
+
+def diff_from_doc(doc):
+    diff = StockDiff()
+    diff.new = [ProductRecord.from_dict(record) for record in doc["new"]]
+    diff.restocked = [ProductRecord.from_dict(record) for record in doc["restocked"]]
+    diff.price_changed = [ProductRecord.from_dict(record) for record in doc["priceChanged"]]
+    diff.sold = doc["sold"]
+    diff.previous_prices = {link: price for link, price in doc["previousPrices"]}
+    diff.scraped = doc["scraped"]
+    diff.unchanged = doc["unchanged"]
+    return diff
+
+
+class RunJournal:
+    """The journal of one category job (see the module docstring)."""
+
+    def __init__(self, store, key, doc=None):
+        doc = doc or {}
+        self.store = store
+        self.key = key
+        self.run_id = doc.get("runId")
+        self.phase = doc.get("phase")
+        self.incremental = doc.get("incremental", False)
+        self.resumed = False
+        self._diff = doc.get("diff")
+        self._write_time = doc.get("writeTime")  # Unix time in milliseconds the diff's writes are stamped with
+        self._pages = doc.get("pages") or {}  # "page number" -> {"fetchedAt", "products", "lastPage"}
+        self._alerts = doc.get("alerts") or {}  # alert id -> {"chatIds", "text", "sent", "progress"}
+        self._in_flight = set()  # alert ids handed to the delivery queue
+        self._buffer = {}  # pages fetched since the last checkpoint
+        self._stored = bool(doc)  # a document exists in storage
+        self._header_saved = False  # this run's header fields are in that document
+        self._last_checkpoint = time.monotonic()
+        self._lock = threading.RLock()
+
+    def interrupted_diff(self):
+        """The StockDiff of an earlier run that died before writing it, or None."""
+        if self.phase != "diffed" or self._diff is None:
+            return None
+        return diff_from_doc(self._diff)
+
+    def begin(self, incremental=False):
+        """
+        Start a new run, keeping the fresh pages of an interrupted scrape and the undelivered alerts.
+
+        Returns:
+            bool: True if pages of an interrupted scrape are reused
+        """
+        with self._lock:
+            fresh = {}
+            if self.phase == "scraping":
+                cutoff = time.time() - RUN_JOURNAL_FRESHNESS_MINUTES * 60
+                fresh = {number: page for number, page in self._pages.items() if page["fetchedAt"] >= cutoff}
+                if fresh:
+                    logging.info(f"{self.key}: resuming run {self.run_id} with {len(fresh)} checkpointed page(s)")
+            self.run_id = uuid.uuid4().hex
+            self.phase = "scraping"
+            self.incremental = incremental
+            self.resumed = bool(fresh)
+            self._pages = fresh
+            self._diff = None
+            self._write_time = None
+            self._buffer = {}
+            self._header_saved = False
+            self._last_checkpoint = time.monotonic()
+            return self.resumed
+
+    def page(self, page_number):
+        """Return (products, last_page) of a page reused from an interrupted scrape, or None."""
+        page = self._pages.get(str(page_number))
+        if page is None:
+            return None
+        return [ProductRecord.from_dict(product) for product in page["products"]], page["lastPage"]
+
+    def record_page(self, page_number, products, last_page):
+        """Remember a fetched page for the next checkpoint (safe from fetch worker threads)."""
+        entry = {"fetchedAt": time.time(), "products": [product.to_dict() for product in products], "lastPage": last_page}
+        with self._lock:
+            self._buffer[str(page_number)] = entry
+
+    def _header(self):
+        return {"runId": self.run_id, "phase": self.phase, "incremental": self.incremental, "startedAt": time.time()}
+
+    def _save(self, fields):
+        self.store.save_run_journal(self.key, fields)
+        self._stored = True
+
+    def checkpoint(self, force=False):
+        """Save the pages fetched since the last checkpoint, at most every RUN_JOURNAL_CHECKPOINT_SECONDS unless forced."""
+        with self._lock:
+            if not self._buffer or (not force and time.monotonic() - self._last_checkpoint < RUN_JOURNAL_CHECKPOINT_SECONDS):
+                return
+            buffer, self._buffer = self._buffer, {}
+            if self._header_saved:
+                fields = {f"pages.{number}": page for number, page in buffer.items()}
+            else:
+                # Replaces the pages (and any diff) of an earlier run
+                fields = {**self._header(), "pages": {**self._pages, **buffer}, "diff": None}
+            self._save(fields)
+            self._header_saved = True
+            self._pages.update(buffer)
+            self._last_checkpoint = time.monotonic()
+        logging.debug(f"{self.key}: checkpointed {len(buffer)} page(s)")
+
+    def record_diff(self, diff, alerts):
+        """
+        Save the diff and its alerts before anything is written.
+
+        Args:
+            diff: StockDiff of the run
+            alerts: (text, chat_ids) tuples, chat_ids None for the default chats
+        """
+        with self._lock:
+            self.phase = "diffed"
+            self._diff = diff_to_doc(diff)
+            # Milliseconds, the precision MongoDB keeps, so a replay matches the points already written
+            self._write_time = int(time.time() * 1000)
+            fields = {**self._header(), "pages": {}, "diff": self._diff, "writeTime": self._write_time}
+            for number, (text, chat_ids) in enumerate(alerts):
+                alert_id = f"{self.run_id[:12]}-{number}"
+                self._alerts[alert_id] = {"chatIds": list(chat_ids) if chat_ids else None, "text": text, "sent": False}
+                # One field per alert, so alerts of an earlier run keep their delivery marks
+                fields[f"alerts.{alert_id}"] = self._alerts[alert_id]
+            self._save(fields)
+            self._header_saved = True
+            self._pages = {}
+            self._buffer = {}
+
+    def write_time(self):
+        """The UTC time the writes of the recorded diff are stamped with (the same on a replay), or None."""
+        if self._write_time is None:
+            return None
+        return datetime(1970, 1, 1) + timedelta(milliseconds=self._write_time)
+
+    def _unsent(self):
+        return [alert_id for alert_id, alert in self._alerts.items() if not alert["sent"]]
+
+    def applied(self):
+        """Mark the diff as written (called inside the write transaction where there is one)."""
+        with self._lock:
+            self.phase = "applied"
+            self._diff = None
+            if not self._unsent():
+                self._alerts = {}
+                if self._stored:
+                    self.store.delete_run_journal(self.key)
+                    self._stored = False
+            elif self._stored:
+                self.store.save_run_journal(self.key, {"phase": "applied", "diff": None})
+
+    def finish(self):
+        """End a run that wrote nothing (e.g. unchanged), dropping its checkpoints."""
+        with self._lock:
+            self._buffer = {}
+            self._pages = {}
+            self.phase = "applied"
+            if not self._stored:
+                return
+            if self._unsent():
+                self._save({"phase": "applied", "pages": {}, "diff": None})
+            else:
+                self._alerts = {}
+                self.store.delete_run_journal(self.key)
+                self._stored = False
+
+    def send_alerts(self, queue):
+        """
+        Hand every undelivered alert that is not already queued to queue(text, chat_ids=..., on_done=..., resume=...).
+
+        Returns:
+            int: Number of alerts queued
+        """
+        with self._lock:
+            if self.phase == "diffed":
+                # Not written yet
+                return 0
+            pending = [(alert_id, self._alerts[alert_id]) for alert_id in self._unsent() if alert_id not in self._in_flight]
+            self._in_flight.update(alert_id for alert_id, _ in pending)
+        for alert_id, alert in pending:
+            queue(
+                alert["text"],
+                chat_ids=alert["chatIds"],
+                on_done=lambda delivered, progress=None, alert_id=alert_id: self._alert_done(alert_id, delivered, progress),
+                resume=alert.get("progress"),
+            )
+        return len(pending)
+
+    def alerts_in_flight(self):
+        with self._lock:
+            return len(self._in_flight)
+
+    def _alert_done(self, alert_id, delivered, progress=None):
+        """
+        Delivery callback: mark the alert sent, and drop the journal once nothing is left to send.
+
+        Args:
+            progress: {str(chat_id): parts delivered}, kept for an alert that only partly went out
+        """
+        with self._lock:
+            self._in_flight.discard(alert_id)
+            alert = self._alerts.get(alert_id)
+            if alert is None:
+                return
+            if not delivered:
+                # Kept unsent, the next run queues it again and resumes each chat where it stopped
+                if progress and progress != alert.get("progress"):
+                    alert["progress"] = progress
+                    try:
+                        self._save({f"alerts.{alert_id}.progress": progress})
+                    except STORAGE_ERRORS as e:
+                        logging.error(f"{self.key}: could not save the progress of alert {alert_id}, it may be sent again: {e}")
+                return
+            try:
+                alert["sent"] = True
+                if self.phase == "applied" and not self._unsent():
+                    self._alerts = {}
+                    self.store.delete_run_journal(self.key)
+                    self._stored = False
+                else:
+                    self._save({f"alerts.{alert_id}.sent": True})
+            except STORAGE_ERRORS as e:
+                logging.error(f"{self.key}: could not mark alert {alert_id} as sent, it may be sent again: {e}")
+
+
+def open_run_journal(store, key):
+    """
+    Return the journal of a category job, loading it from storage on first use in this process.
+
+    Returns:
+        RunJournal: The journal, or None if RUN_JOURNAL=0
+    """
+    if not RUN_JOURNAL_ENABLED:
+        return None
+    with _journals_lock:
+        journal = _journals.get(key)
+        if journal is None or journal.store is not store:
+            journal = RunJournal(store, key, store.load_run_journal(key))
+            _journals[key] = journal
+        return journal
+
+
+def forget_run_journal(key):
+    """Drop the in-process journal of a job, e.g. when another worker may have run it since (see leases)."""
+    with _journals_lock:
+        _journals.pop(key, None)
+
+
+def run_journal_idle(key):
+    """True unless the job has alerts in the delivery queue, whose callbacks still update its journal."""
+    with _journals_lock:
+        journal = _journals.get(key)
+    return journal is None or not journal.alerts_in_flight()
+
+
+def reset_run_journals():
+    """Forget the in-process journals, so the next run reloads them from storage (as after a restart)."""
+    with _journals_lock:
+        _journals.clear()
@@ -1,44 +1,160 @@
-import time
+"""
+Entry point: schedules every tracker, or runs some of them once.
+
+Usage:
+    python scraper.py [--worker] [--profile-every N] ...    # run the trackers on their schedules
+    python scraper.py --once                                # run every tracker once and exit
+    python scraper.py --once gpu gameloot_cpu               # by category type or job name
+    python scraper.py --once price_history_maintenance
+
+A one-shot run (cron, a restart loop) exits after its alerts are delivered,
+with status 1 if a run failed. It does not start the metrics or stock API
+endpoints and does not take worker leases.
+"""
+
+import argparse
+import asyncio
+import atexit
+import functools
+import signal
+import sys
 import logging
-import logging_config
-import schedule
 from dotenv import load_dotenv
-from gameloot import track_gpu, track_cpu, track_mobo, track_ram
-
-# from cex import track_cex_gpu, track_cex_cpu  # Uncomment when CEX is implemented
 
-# Load environment variables
+# Before the project modules, which read their settings from the environment at import
 load_dotenv()
 
+import logging_config
+from async_scheduler import Job, run_scheduler
+from leases import LEASE_SCOPES, WORKER_ID, WORKER_MODE, LeaseManager, lease_name
+from metrics import register_tracker, start_metrics_server
+from profiling import PROFILE_MODES, configure as configure_profiling, profiled
+from run_journal import forget_run_journal, run_journal_idle
+from site_engine import track_category, track_price_history_maintenance, prepare_storage, apply_site_rate_limits
+from sites import load_site_specs
+from stock_api import start_api_server
+from storage import STORAGE_ERRORS, get_stock_store
+from telegram_helper import TELEGRAM_SHUTDOWN_TIMEOUT, flush_telegram_messages
+
+MAINTENANCE_JOB = "price_history_maintenance"
+
+
+def _handle_sigterm(signum, frame):
+    """Exit normally on SIGTERM (docker stop) so shutdown hooks close the MongoDB pool."""
+    logging.info("Received SIGTERM, shutting down")
+    sys.exit(0)
+
+
+def _start_worker(worker_id=None):
+    """Start the lease heartbeats of worker mode; leases are handed back at exit."""
+    manager = LeaseManager(get_stock_store(), worker_id).start()
+    atexit.register(manager.stop)
+    return manager
+
+
+def task_scheduler(worker=False, worker_id=None, lease_scope=None):
+    """Main task scheduler that orchestrates all scraping tasks.
+
+    Args:
+        worker: Share the trackers with other workers through leases (see leases.py)
+        worker_id: Name of this worker (defaults to WORKER_ID)
+        lease_scope: "category" or "site" (defaults to LEASE_SCOPE)
+    """
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+    try:
+        prepare_storage()
+    except STORAGE_ERRORS as e:
+        logging.warning(f"Could not bootstrap storage indexes at startup, will retry on first tracker run: {e}")
+    manager = _start_worker(worker_id) if worker else None
+
+    def job_func(name, func, lease, on_acquire=None, can_release=None):
+        func = profiled(name, func)
+        return manager.leased(name, lease, func, on_acquire, can_release) if manager else func
+
+    # One tracker job per category of every site spec in sites/
+    sites = load_site_specs()
+    apply_site_rate_limits(sites)
+    jobs = [
+        Job(
+            category.job_name,
+            job_func(
+                category.job_name,
+                functools.partial(track_category, category),
+                lease_name(category, lease_scope),
+                functools.partial(forget_run_journal, category.job_name),
+                functools.partial(run_journal_idle, category.job_name),
+            ),
+            category.interval_minutes,
+        )
+        for site in sites
+        for category in site.categories
+    ]
+    # Maintenance
+    jobs.append(Job(MAINTENANCE_JOB, job_func(MAINTENANCE_JOB, track_price_history_maintenance, f"job:{MAINTENANCE_JOB}"), 24 * 60))
+    for job in jobs:
+        register_tracker(job.name, job.interval)
+    start_metrics_server()
+    start_api_server()
+
+    try:
+        asyncio.run(run_scheduler(jobs))
+    except KeyboardInterrupt:
+        logging.info("Scheduler stopped")
+
 
-def task_scheduler():
-    """Main task scheduler that orchestrates all scraping tasks."""
-    # Gameloot tasks
-    schedule.every(15).minutes.do(track_gpu)
-    schedule.every(18).minutes.do(track_cpu)
-    schedule.every(22).minutes.do(track_mobo)
-    schedule.every(30).minutes.do(track_ram)
+def run_once(names=None):
+    """Run trackers once, one after another, and wait for their alerts to be delivered.
 
-    # CEX tasks (uncomment when implemented)
-    # schedule.every(20).minutes.do(track_cex_gpu)
-    # schedule.every(25).minutes.do(track_cex_cpu)
+    Args:
+        names: Category types ("gpu"), job names ("gameloot_gpu") or MAINTENANCE_JOB; None or empty = every category
 
-    logging.info("Scheduler started with Jobs:")
-    for jobs in schedule.get_jobs():
-        print(jobs)
+    Returns:
+        int: Exit status, 0 if every run succeeded, 1 if one failed, 2 for an unknown name
+    """
+    sites = load_site_specs()
+    apply_site_rate_limits(sites)
+    categories = [category for site in sites for category in site.categories]
+    names = set(names or ())
+    known = {category.type for category in categories} | {category.job_name for category in categories} | {MAINTENANCE_JOB}
+    if names - known:
+        logging.error(f"Unknown tracker(s) {', '.join(sorted(names - known))}, choose from {', '.join(sorted(known))}")
+        return 2
+    selected = [category for category in categories if not names or names & {category.type, category.job_name}]
+    try:
+        prepare_storage()
+    except STORAGE_ERRORS as e:
+        logging.warning(f"Could not bootstrap storage indexes, the runs will retry: {e}")
 
-    while True:
-        try:
-            schedule.run_pending()
-        except Exception as e:
-            logging.error(f"Error in scheduler: {e}", exc_info=True)
-        time.sleep(1)
+    failed = []
+    for category in selected:
+        result = profiled(category.job_name, functools.partial(track_category, category))()
+        if result not in ("ok", "unchanged"):
+            failed.append(f"{category.job_name} ({result})")
+    if MAINTENANCE_JOB in names and not profiled(MAINTENANCE_JOB, track_price_history_maintenance)():
+        failed.append(MAINTENANCE_JOB)
+    if not flush_telegram_messages(TELEGRAM_SHUTDOWN_TIMEOUT):
+        failed.append("alert delivery (timed out)")
+    if failed:
+        logging.error(f"One-shot run failed: {', '.join(failed)}")
+        return 1
+    logging.info(f"One-shot run done: {len(selected) + (MAINTENANCE_JOB in names)} tracker(s)")
+    return 0
 
 
 if __name__ == "__main__":
-    task_scheduler()
-    # process_gameloot_stock()
-    #track_cpu()
-    #track_mobo()
-    #track_ram()
-    #track_gpu()
+    parser = argparse.ArgumentParser(description="Run the stock trackers")
+    parser.add_argument("--profile-every", type=int, help="profile every Nth run of each tracker (PROFILE_EVERY)")
+    parser.add_argument("--profile-slower-than", type=float, help="keep profiles of runs slower than this many seconds (PROFILE_SLOWER_THAN)")
+    parser.add_argument("--profile-dir", help="directory for profile dumps (PROFILE_DIR)")
+    parser.add_argument("--profile-mode", choices=PROFILE_MODES, help="profiler for every-Nth runs (PROFILE_MODE)")
+    parser.add_argument("--worker", action="store_true", default=WORKER_MODE, help="share the trackers with other workers through leases (WORKER_MODE)")
+    parser.add_argument("--worker-id", help=f"name of this worker (WORKER_ID, default {WORKER_ID})")
+    parser.add_argument("--lease-scope", choices=LEASE_SCOPES, help="lease each category or each site (LEASE_SCOPE)")
+    parser.add_argument("--once", nargs="*", metavar="TRACKER", help="run these trackers (category type or job name, default all) once and exit")
+    args = parser.parse_args()
+    configure_profiling(args.profile_every, args.profile_slower_than, args.profile_dir, args.profile_mode)
+    if args.once is not None:
+        if args.worker:
+            logging.warning("One-shot runs do not take worker leases, a worker may run the same tracker meanwhile")
+        sys.exit(run_once(args.once))
+    task_scheduler(args.worker, args.worker_id, args.lease_scope)
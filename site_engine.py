@@ -0,0 +1,609 @@
+"""
+Scraper engine driven by declarative site specs (see sites.py).
+
+Every category of every spec goes through the same pipeline: listing pages
+are fetched in page order (up to GAMELOOT_FETCH_WORKERS ahead, capped by the
+site's max_connections), parsed with the spec's selectors and streamed
+through dedup and the stock diff into the configured StockStore. All
+categories of a site share its connection limit, so the scheduler can run
+any number of categories and sites at the same time while each store only
+ever sees max_connections requests in flight.
+
+Categories with incremental pages in their spec only scrape their first
+pages between full sweeps. Those runs report new, restocked and repriced
+listings; sold listings are only worked out by full sweeps.
+
+Every run is journaled (see run_journal): a run that restarts after a crash
+applies a diff its predecessor saved but never wrote, reuses its freshly
+checkpointed pages and sends the alerts that were not delivered yet.
+"""
+
+import requests
+import http_client
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from telegram_helper import MessageBuilder, queue_telegram_message
+from html_parsers import parse_listing
+from leases import LeaseLost, check_lease
+from metrics import DUPLICATES_DROPPED, PAGE_PARSE_SECONDS, RUN_CHANGES, RUN_PRODUCTS, RUN_STAGE_SECONDS, RUNS, StageTimer, record_success
+from page_cache import load_page_cache
+from product_identity import get_model_index
+from products import ProductRecord
+from run_journal import open_run_journal
+from stock_api import invalidate_stock_queries
+from stock_diff import StreamingStockDiff, load_sold_names, apply_stock_diff
+from storage import GAMELOOT_COLLECTION, STORAGE_ERRORS, get_stock_store
+from watchlist import build_watch_messages, get_watch_index, match_watch_rules
+
+# Pagination fetch settings
+FETCH_WORKERS = int(os.getenv("GAMELOOT_FETCH_WORKERS", "4"))  # per category, 1 = fetch pages one by one
+INCREMENTAL_SCRAPING = os.getenv("INCREMENTAL_SCRAPING", "1") != "0"  # 0 = every run is a full sweep
+
+
+def _fetch_page(site, url, headers=None):
+    """Fetch a listing page, holding one of the site's connection slots.
+
+    Args:
+        site: SiteSpec whose connection limit applies
+        url: Listing page URL
+        headers: Optional conditional request headers (a 304 is then accepted)
+
+    Returns:
+        requests.Response: Response if 200, or 304 for a conditional request
+        None: If page 404 (end of pagination)
+        "SCRAPE_FAILED": If non-200/404 error occurred
+    """
+    try:
+        with site.connections:
+            response = http_client.get(url, headers=headers)
+    except requests.RequestException as e:
+        logging.error(f"Request failed for URL: {url}: {e}")
+        return "SCRAPE_FAILED"
+
+    # 404 means end of pagination - this is expected
+    if response.status_code == 404:
+        return None
+
+    if response.status_code == 304 and headers:
+        return response
+
+    # Any other non-200 status is an error - abort scraping
+    if response.status_code != 200:
+        logging.error(f"Non-200 response received: {response.status_code} for URL: {url}")
+        return "SCRAPE_FAILED"
+
+    return response
+
+
+def parse_listing_page(site, content, backend=None):
+    """Parse a listing page with the site's selectors, name cleanup and price parsing.
+
+    Args:
+        site: SiteSpec of the page
+        content: Page body
+        backend: HTML parser backend (defaults to GAMELOOT_HTML_PARSER, see html_parsers)
+
+    Returns:
+        tuple: (products, last_page) where products is a list of ProductRecords and last_page is the highest page number
+        linked from the pagination block, or None if there are no page links
+    """
+    with PAGE_PARSE_SECONDS.time(site=site.name):
+        items, page_links = parse_listing(content, site.selectors, backend)
+
+    products = []
+    for name, price, href in items:
+        name = name.strip() if name is not None else "No name found"
+        logging.debug(name)
+        price = price.strip() if price is not None else "No price found"
+        href = href if href is not None else "No link found"
+        products.append(ProductRecord(site.clean_name(name), site.parse_price(price), href))
+
+    page_numbers = [number for number in map(site.page_number, page_links) if number is not None]
+    return products, max(page_numbers) if page_numbers else None
+
+
+def scrape_listing_page(site, url, page_cache=None):
+    """Fetch and parse a listing page, reusing the cached result when the page is unchanged.
+
+    Returns:
+        tuple: (products, last_page) where products is a list of ProductRecords,
+        None if the page 404s (end of pagination) or "SCRAPE_FAILED" on any
+        other non-200 response, and last_page is None when the page has no
+        pagination links
+    """
+    headers = page_cache.conditional_headers(url) if page_cache is not None else None
+    response = _fetch_page(site, url, headers)
+    if response is None or response == "SCRAPE_FAILED":
+        return response, None
+
+    if page_cache is not None:
+        cached = page_cache.match(url, response)
+        if cached is not None:
+            logging.debug(f"Page unchanged, skipping parse: {url}")
+            return [ProductRecord.from_dict(product) for product in cached["products"]], cached["lastPage"]
+
+    products, last_page = parse_listing_page(site, response.content)
+    if page_cache is not None:
+        page_cache.update(url, response, products, last_page)
+    return products, last_page
+
+
+def _scrape_page(category, page_number, page_cache=None, journal=None):
+    """scrape_listing_page for one page of a category, reusing the page when an interrupted run already fetched it."""
+    url = category.page_url(page_number)
+    if journal is not None:
+        page = journal.page(page_number)
+        if page is not None:
+            logging.debug(f"Page {page_number} taken from the run journal")
+            if page_cache is not None:
+                page_cache.forget(url)
+            return page
+    products, last_page = scrape_listing_page(category.site, url, page_cache)
+    if journal is not None and products and products != "SCRAPE_FAILED":
+        journal.record_page(page_number, products, last_page)
+    return products, last_page
+
+
+def _scrape_products(category, page_number, page_cache=None, journal=None):
+    logging.info(f"Scraping {category.job_name} page: {page_number}")
+    products, _ = _scrape_page(category, page_number, page_cache, journal)
+    return products
+
+
+def _probe_last_page(category, pages, page_cache=None, journal=None):
+    """Find the last non-empty page by probing 2, 4, 8, ... and then binary searching.
+
+    Every probed page is stored in ``pages`` so it is not fetched again.
+
+    Returns:
+        int: Last page number with products
+        "SCRAPE_FAILED": If any probe returned a non-200/404 error
+    """
+    last_good = 1
+    probe = 2
+    while True:
+        products = _scrape_products(category, probe, page_cache, journal)
+        pages[probe] = products
+        if products == "SCRAPE_FAILED":
+            return "SCRAPE_FAILED"
+        if not products:
+            break
+        last_good = probe
+        probe *= 2
+
+    # Binary search between the last page with products and the first empty page
+    low, high = last_good, probe
+    while high - low > 1:
+        middle = (low + high) // 2
+        products = _scrape_products(category, middle, page_cache, journal)
+        pages[middle] = products
+        if products == "SCRAPE_FAILED":
+            return "SCRAPE_FAILED"
+        if products:
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def _iter_pages_serial(category, page_cache=None, first_page=1, page_limit=None, journal=None):
+    """Yield (page_number, products) one page at a time until the first 404 or empty page, or page_limit."""
+    page_number = first_page
+    while True:
+        products = _scrape_products(category, page_number, page_cache, journal)
+
+        # Check for scrape failure - abort immediately
+        if products == "SCRAPE_FAILED":
+            logging.error(f"Scraping failed on page {page_number}. Aborting entire scrape run.")
+            yield page_number, "SCRAPE_FAILED"
+            return
+
+        # None means 404 - end of pagination (expected)
+        if products is None:
+            logging.info(f"No more product listing. End of page")
+            return
+
+        # Empty list means no products found on this page (shouldn't happen, but handle gracefully)
+        if not products:
+            logging.info(f"No products found on page {page_number}. End of page")
+            return
+
+        yield page_number, products
+        if category.site.pagination_style == "single" or page_number == page_limit:
+            return
+        page_number += 1
+
+
+def _iter_pages_concurrent(category, max_workers, page_cache=None, page_limit=None, journal=None):
+    """Yield (page_number, products) in page order, fetching up to max_workers pages ahead.
+
+    The last page is taken from the pagination links on page 1 (or probed when
+    there are none and no page_limit caps the walk anyway). Only a window of
+    max_workers pages is in flight or waiting to be consumed at any time, so
+    memory stays bounded by the window rather than the category size. Pages are
+    still handed out strictly in order, so any failed page before the end of
+    pagination aborts the run exactly like the serial loop.
+    """
+    logging.info(f"Scraping {category.job_name} page: 1")
+    first_page, last_page = _scrape_page(category, 1, page_cache, journal)
+    if first_page == "SCRAPE_FAILED":
+        logging.error("Scraping failed on page 1. Aborting entire scrape run.")
+        yield 1, "SCRAPE_FAILED"
+        return
+    if not first_page:
+        logging.info("No products found on page 1. End of page")
+        return
+
+    pages = {}  # probed pages, consumed as the walk reaches them
+    if last_page is None and page_limit:
+        last_page = page_limit
+    elif last_page is None:
+        last_page = _probe_last_page(category, pages, page_cache, journal)
+        if last_page == "SCRAPE_FAILED":
+            logging.error("Scraping failed while probing for the last page. Aborting entire scrape run.")
+            yield 1, "SCRAPE_FAILED"
+            return
+    logging.info(f"Expecting {last_page} page(s), fetching with {max_workers} workers")
+    yield 1, first_page
+    if page_limit == 1:
+        return
+
+    in_flight = {}  # page_number -> future
+    page_number = 2
+    next_page = 2
+    # Always fetch one page past the expected end to confirm it is really the end
+    upper = min(last_page + 1, page_limit) if page_limit else last_page + 1
+    # Named after the job so profiling samples the workers with their tracker
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{category.job_name}-fetch") as executor:
+        try:
+            while True:
+                while len(in_flight) < max_workers and next_page <= upper:
+                    if next_page not in pages:
+                        # Copy the context per task so request timings reach the caller's collector
+                        in_flight[next_page] = executor.submit(
+                            contextvars.copy_context().run, _scrape_products, category, next_page, page_cache, journal
+                        )
+                    next_page += 1
+
+                if page_number in pages:
+                    products = pages.pop(page_number)
+                elif page_number in in_flight:
+                    products = in_flight.pop(page_number).result()
+                else:
+                    # Pagination links were stale - keep going in worker-sized windows
+                    logging.info(f"Page {page_number - 1} still had products, fetching further pages")
+                    upper = page_number + max_workers - 1
+                    if page_limit:
+                        upper = min(upper, page_limit)
+                    continue
+
+                if products == "SCRAPE_FAILED":
+                    logging.error(f"Scraping failed on page {page_number}. Aborting entire scrape run.")
+                    yield page_number, "SCRAPE_FAILED"
+                    return
+                if products is None:
+                    logging.info(f"No more product listing. End of page")
+                    return
+                if not products:
+                    logging.info(f"No products found on page {page_number}. End of page")
+                    return
+                yield page_number, products
+                if page_number == page_limit:
+                    return
+                page_number += 1
+        finally:
+            # Drop queued fetches past the end (or after a failure / early close)
+            for future in in_flight.values():
+                future.cancel()
+
+
+def iter_category_pages(category, max_workers=None, page_cache=None, page_limit=None, journal=None):
+    """Stream the products of a category page by page, in page order.
+
+    Args:
+        category: CategorySpec to scrape
+        max_workers: Concurrent page fetches (defaults to GAMELOOT_FETCH_WORKERS capped by the
+            site's max_connections, 1 = serial)
+        page_cache: Optional PageCache used for conditional requests and to skip parsing unchanged pages
+        page_limit: Stop after this page even if there are more (incremental runs)
+        journal: Optional RunJournal that fetched pages are recorded in and
+            pages of an interrupted run are taken from
+
+    Yields:
+        tuple: (page_number, products) for every page with products. If a page
+        returned a non-200/404 error, (page_number, "SCRAPE_FAILED") is yielded
+        last and pagination stops; the run must then be discarded.
+    """
+    if max_workers is None:
+        max_workers = min(FETCH_WORKERS, category.site.max_connections)
+    if max_workers <= 1 or category.site.pagination_style == "single":
+        return _iter_pages_serial(category, page_cache, page_limit=page_limit, journal=journal)
+    return _iter_pages_concurrent(category, max_workers, page_cache, page_limit, journal)
+
+
+def scrape_all_products(category, max_workers=None, page_cache=None):
+    """Scrape all products of a category by paginating through pages.
+
+    Collects iter_category_pages into one list; process_category_stock consumes
+    the pages as a stream instead.
+
+    Returns:
+        list: List of all ProductRecords if successful
+        "SCRAPE_FAILED": If any page returned a non-200/404 error
+    """
+    all_products = []
+    for page_number, products in iter_category_pages(category, max_workers, page_cache):
+        if products == "SCRAPE_FAILED":
+            return "SCRAPE_FAILED"
+        all_products.extend(products)
+    return all_products
+
+
+def prepare_storage():
+    """Prepare the configured storage backend: indexes/tables and hot query checks (once per process).
+
+    Raises:
+        IndexNotUsedError: If a hot query's plan is a collection scan
+    """
+    get_stock_store().prepare()
+
+
+def apply_site_rate_limits(sites):
+    """Register the rate_limit of every spec that sets one for its hosts."""
+    for site in sites:
+        if site.rate_limit is not None:
+            for host in site.hosts:
+                http_client.set_host_rate_limit(host, site.rate_limit)
+
+
+def _incremental_run(category):
+    """True if this run may stop after the category's first pages because a full sweep ran recently."""
+    if not INCREMENTAL_SCRAPING or category.incremental_pages <= 0 or category.last_full_sweep is None:
+        return False
+    return time.monotonic() - category.last_full_sweep < category.full_sweep_minutes * 60
+
+
+def _record_full_sweep(category, started, requests_made):
+    category.last_full_sweep = started
+    category.full_sweep_requests = requests_made
+
+
+def _assign_models(store, diff, category):
+    """
+    Set the model key of every product the run writes and look up the earlier prices of the new listings' models.
+
+    Returns:
+        dict: {model key: {"low", "high", "listings"}} for models of new listings seen under other links
+    """
+    changed = diff.new + diff.restocked + diff.price_changed
+    if not changed:
+        return {}
+    try:
+        index = get_model_index(store, category.store_type)
+        for record in changed:
+            record.model = record.model or index.resolve(record.name)
+        ranges = store.load_model_price_ranges(category.store_type, {record.model for record in diff.new}) if diff.new else {}
+    except STORAGE_ERRORS as e:
+        logging.error(f"Model keys skipped for {category.job_name}: {e}")
+        return {}
+    for record in changed:
+        index.add(record.link, record.name, record.model)
+    return ranges
+
+
+def _match_watch_rules(store, diff, category):
+    """Watchlist messages of a run ({chat_id: parts}), worked out before its price points are written."""
+    try:
+        index = get_watch_index(store)
+        alerts = match_watch_rules(index, diff, category.type, lambda links: store.load_lowest_prices(category.store_type, links))
+    except STORAGE_ERRORS as e:
+        logging.error(f"Watch rules skipped for {category.job_name}: {e}")
+        return {}
+    return build_watch_messages(alerts)
+
+
+def _recover_interrupted_run(store, category, journal):
+    """Write the diff of a run that died before writing it, then queue the alerts earlier runs never delivered."""
+    diff = journal.interrupted_diff()
+    if diff is not None:
+        logging.warning(f"Applying the diff of interrupted {category.job_name} run {journal.run_id}: {diff.summary()}")
+        apply_stock_diff(store, diff, category.store_type, journal, replay=True)
+    queued = journal.send_alerts(queue_telegram_message)
+    if queued:
+        logging.info(f"Queued {queued} undelivered alert(s) of an earlier {category.job_name} run")
+
+
+def process_category_stock(category):
+    """Process stock updates of one category and send notifications for new/back in stock items.
+    Uses a single collection/table with a 'type' field (the category's store_type, e.g. gpu)."""
+    started = time.monotonic()
+    stages = StageTimer(RUN_STAGE_SECONDS, job=category.job_name)
+    incremental = _incremental_run(category)
+    logging.info(f"Started {category.job_name} ({'incremental' if incremental else 'full sweep'}) at: {datetime.now()}")
+    product_type = category.store_type
+    store = get_stock_store()
+    # Connect first: the diff consumes pages while they are being scraped
+    try:
+        store.connect()
+    except STORAGE_ERRORS as e:
+        logging.error(f"{store.name} storage not available for {GAMELOOT_COLLECTION}: {e}")
+        logging.info("Will retry on next scheduled run")
+        return "MONGODB_UNAVAILABLE"
+    store.prepare()
+    page_cache = load_page_cache(category.url, store)
+    journal = open_run_journal(store, category.job_name)
+    resumed = False
+    if journal is not None:
+        _recover_interrupted_run(store, category, journal)
+        resumed = journal.begin(incremental)
+
+    # Pages flow through dedup, type tagging and diff classification one at a time.
+    # Nothing is written (or marked sold) until pagination has completed.
+    stream = StreamingStockDiff(lambda: store.load_stock_state(product_type))
+    scrape_failed = False
+    page_limit = category.incremental_pages if incremental else None
+    last_page_number = 0
+    new_on_page = 0
+    with http_client.track_timings() as http_timings:
+        pages = iter_category_pages(category, page_cache=page_cache, page_limit=page_limit, journal=journal)
+        while True:
+            for page_number, products in pages:
+                if products == "SCRAPE_FAILED":
+                    scrape_failed = True
+                    break
+                if journal is not None:
+                    journal.checkpoint()
+                unchanged = page_cache is not None and page_cache.is_unchanged(category.page_url(page_number))
+                for product in products:
+                    product.type = product_type
+                    logging.debug(f"Product Name: {product.name}, Price: {product.price}, Link: {product.link}")
+                new_on_page = stream.add_page(products, unchanged=unchanged)
+                last_page_number = page_number
+            if scrape_failed or last_page_number != page_limit or not new_on_page:
+                break
+            # Listings are newest first: more new ones may have pushed past the limit
+            page_limit += 1
+            logging.info(f"Page {last_page_number} still had {new_on_page} new listing(s), fetching page {page_limit}")
+            pages = _iter_pages_serial(category, page_cache, first_page=page_limit, page_limit=page_limit, journal=journal)
+    requests_made = http_timings.request_count
+    stages.lap("scrape")
+    logging.info(f"HTTP timings: {http_timings.summary()}")
+    if scrape_failed:
+        logging.warning("Scraping failed with non-200 response. Aborting to prevent false 'sold' notifications. Will retry on next scheduled run.")
+        if journal is not None:
+            # The retry resumes from the pages fetched so far
+            journal.checkpoint(force=True)
+        return "SCRAPE_FAILED"
+    logging.info(f"Total Products: {len(stream.dedup)}")
+    RUN_PRODUCTS.set(len(stream.dedup), job=category.job_name)
+    DUPLICATES_DROPPED.inc(stream.dedup.collisions, job=category.job_name)
+    if incremental:
+        full = category.full_sweep_requests
+        logging.info(
+            f"Incremental run: {last_page_number} page(s) in {requests_made} request(s), "
+            f"last full sweep took {full} ({full - requests_made} saved)"
+        )
+
+    # Reused pages were never checked against the page cache, so a resumed run always diffs
+    if page_cache is not None and not resumed:
+        if page_cache.fetched_pages_unchanged() if incremental else page_cache.category_unchanged():
+            logging.info("All listing pages unchanged since last run. Skipping diff and MongoDB update")
+            if not incremental:
+                _record_full_sweep(category, started, requests_made)
+            if journal is not None:
+                journal.finish()
+            return "UNCHANGED"
+        logging.info(f"Changed listing pages: {page_cache.changed_page_count}")
+
+    if resumed:
+        # Pages fetched minutes apart can miss a listing that moved between them, leave sold to the next full sweep
+        logging.info("Resumed scrape: listings not seen are not marked sold this run")
+    diff = stream.finish(partial=incremental or resumed)
+    logging.info(f"Diff: {diff.summary()}")
+    load_sold_names(store, diff, product_type)
+    for change in ("new", "restocked", "price_changed", "sold"):
+        RUN_CHANGES.inc(len(getattr(diff, change)), job=category.job_name, change=change)
+    stages.lap("diff")
+
+    model_ranges = _assign_models(store, diff, category)
+    new_items_message = MessageBuilder(header="NEW PRODUCT IN STOCK! :")
+    sold_items_message = MessageBuilder(header="NO LONGER IN STOCK, SOLD!:")
+    for product in diff.new:
+        logging.info(f"New Listing: {product.name}, {product.price}")
+        seen = model_ranges.get(product.model)
+        # Same model listed before under another link
+        history = f" (seen before at {seen['low']}-{seen['high']}, {seen['listings']} listing(s))" if seen else ""
+        new_items_message.add_entry(f"-{product.name} - {product.price} - {product.link}{history}")
+    for product in diff.restocked:
+        logging.info(f"Back in Stock: {product.name}, {product.price}, {product.link}")
+        new_items_message.add_entry(f"-{product.name} - {product.price} - {product.link}")
+    for db_product in diff.sold:
+        logging.info(f"No Longer in Stock: {db_product['name']}, {db_product['price']}")
+        sold_items_message.add_entry(f"-{db_product['name']} - {db_product['price']} - {db_product['link']}")
+    count_new_items = new_items_message.entries
+    count_sold_items = sold_items_message.entries
+    watch_messages = _match_watch_rules(store, diff, category)
+    # (text, chat_ids) of every alert, chat_ids None for the default chats
+    alerts = [(part, None) for part in new_items_message.parts()] if count_new_items >= 1 else []
+    if count_sold_items >= 1:
+        alerts.extend((part, None) for part in sold_items_message.parts())
+    for chat_id, parts in watch_messages.items():
+        alerts.extend((part, [chat_id]) for part in parts)
+    # In worker mode, stop here if another worker took this category over meanwhile
+    check_lease()
+    if journal is not None and (diff.changed or alerts):
+        journal.record_diff(diff, alerts)
+    stages.lap("watchlist")
+
+    apply_stock_diff(store, diff, product_type, journal)
+
+    # Only cache pages once the database reflects them
+    if page_cache is not None:
+        page_cache.commit(merge=incremental)
+    if not incremental and not resumed:
+        _record_full_sweep(category, started, requests_made)
+    stages.lap("write")
+
+    logging.info(f"# New Listing/Back in Stock items: {count_new_items}")
+    logging.info(f"# No Longer in Stock: {count_sold_items}")
+    logging.info("Sending Telegram Messages")
+    if journal is not None:
+        journal.send_alerts(queue_telegram_message)
+    else:
+        for part, chat_ids in alerts:
+            queue_telegram_message(part, chat_ids=chat_ids)
+    stages.lap("alerts")
+    logging.info("Completed")
+
+
+def track_category(category):
+    """
+    Track the stock of one category (the scheduler job of every spec category).
+
+    Returns:
+        str: Run result as counted in RUNS ("ok", "unchanged", "scrape_failed", "mongodb_unavailable", "lease_lost", "error")
+    """
+    name = category.job_name
+    result = "error"  # also when the run is interrupted
+    try:
+        logging.info(f"Tracking {name}")
+        result = process_category_stock(category)
+        if result == "MONGODB_UNAVAILABLE":
+            logging.warning(f"{name} tracking skipped due to MongoDB unavailability")
+        elif result == "SCRAPE_FAILED":
+            logging.warning(f"{name} tracking skipped due to scraping failure (non-200 response)")
+        else:
+            if result == "UNCHANGED":
+                logging.info(f"{name} listing unchanged since last run")
+            record_success(name)
+        result = (result or "OK").lower()
+    except LeaseLost as e:
+        result = "lease_lost"
+        logging.warning(f"{name} run abandoned before writing: {e}")
+    except Exception as e:
+        result = "error"
+        logging.error(f"Error in track_category({name}): {e}", exc_info=True)
+    finally:
+        RUNS.inc(job=name, result=result)
+        # Even a failed run may have written (e.g. an interrupted run's diff)
+        invalidate_stock_queries(category.store_type)
+    return result
+
+
+def track_price_history_maintenance():
+    """Apply price history retention and downsampling. Returns True if it ran."""
+    try:
+        logging.info("Maintaining price history")
+        get_stock_store().maintain_price_history()
+        invalidate_stock_queries()
+        record_success("price_history_maintenance")
+        return True
+    except STORAGE_ERRORS as e:
+        logging.warning(f"Price history maintenance skipped due to a storage error: {e}")
+    except Exception as e:
+        logging.error(f"Error in track_price_history_maintenance: {e}", exc_info=True)
+    return False
@@ -0,0 +1,317 @@
+"""
+Declarative site specs.
+
+Every store is described by one JSON file in SITE_SPECS_DIR, so adding a
+store or a category needs no new Python:
+
+    {
+      "name": "gameloot",
+      "type_prefix": "",
+      "max_connections": 4,
+      "rate_limit": 2,
+      "item": "div.kad_product",
+      "fields": {
+        "name": {"selector": "h5", "cut_from_last": "("},
+        "price": {"selector": ["ins span.amount", "span.amount"], "thousands_separator": ","},
+        "link": {"selector": "a.product_item_link", "attribute": "href"}
+      },
+      "pagination": {
+        "style": "numbered",
+        "url": "{category}/page/{page}/?stock=instock",
+        "links": "a.page-numbers",
+        "page_pattern": "/page/(\\d+)/"
+      },
+      "incremental": {"pages": 2, "full_sweep_minutes": 60},
+      "categories": [
+        {"type": "gpu", "url": "https://gameloot.in/product-category/graphics-card", "interval_minutes": 15}
+      ]
+    }
+
+name: Unique site name, used in job names and logs
+type_prefix: Prefix of the stored product type, so two stores' "gpu"
+    categories never mark each other's products sold (defaults to "<name>:")
+max_connections: Requests in flight to the site across all its categories
+rate_limit: Optional requests/second for the site's hosts (HTTP_HOST_RATE_LIMIT otherwise)
+item / fields: CSS selectors of a product container and of its name, price
+    (a list is tried in order, e.g. sale price first) and link. The price is
+    the first number in the price text; cut_from_last drops the name from
+    the last occurrence of a marker, e.g. Gameloot's "(Used)" suffixes
+pagination: "numbered" pages built from the url template until the first
+    404 or empty page (the last page is read from the links matched by
+    page_pattern when present), or "single" for one page per category
+incremental: Scrape only the first pages (listings sorted newest first)
+    between full sweeps; runs keep going past them while the last page
+    still had new listings. Sold products are only detected by full sweeps,
+    which run at least every full_sweep_minutes. Omit or use "pages": 0 to
+    crawl every page on every run
+categories: Stored product type, listing URL and scrape interval of each
+    category; incremental_pages and full_sweep_minutes override the site's
+
+Specs with "enabled": false are skipped, and SITES restricts the run to a
+comma-separated list of site names.
+
+Usage:
+    python sites.py check                # validate every spec and list its categories
+    python sites.py try gameloot gpu     # fetch and parse page 1 of a category
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+from urllib.parse import urlparse
+
+from html_parsers import ListingSelectors
+
+SITE_SPECS_DIR = os.getenv("SITE_SPECS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sites"))
+ENABLED_SITES = os.getenv("SITES", "")  # comma-separated site names, empty = every enabled spec
+PAGINATION_STYLES = ("numbered", "single")
+DEFAULT_INTERVAL_MINUTES = 30
+DEFAULT_FULL_SWEEP_MINUTES = 60
+
+
+class CategorySpec:
+    """One listing category of a site."""
+
+    def __init__(self, site, type, url, interval_minutes=DEFAULT_INTERVAL_MINUTES, incremental_pages=None, full_sweep_minutes=None):
+        self.site = site
+        self.type = type
+        self.url = url
+        self.interval_minutes = interval_minutes
+        self.incremental_pages = site.incremental_pages if incremental_pages is None else incremental_pages
+        self.full_sweep_minutes = site.full_sweep_minutes if full_sweep_minutes is None else full_sweep_minutes
+        # Last successful full sweep (time.monotonic()) and its request count, kept by site_engine
+        self.last_full_sweep = None
+        self.full_sweep_requests = None
+
+    @property
+    def store_type(self):
+        """Product type stored in the database for this category."""
+        return f"{self.site.type_prefix}{self.type}"
+
+    @property
+    def job_name(self):
+        return f"{self.site.name}_{self.type}"
+
+    def page_url(self, page_number):
+        """Listing URL of a page (the category URL itself for single-page sites)."""
+        if self.site.pagination_style == "single":
+            return self.url
+        return self.site.page_url_template.format(category=self.url, page=page_number)
+
+    def __repr__(self):
+        mode = f", first {self.incremental_pages} page(s) between full sweeps every {self.full_sweep_minutes:g} minutes" if self.incremental_pages else ""
+        return f"CategorySpec({self.job_name}, {self.url}, every {self.interval_minutes} minutes{mode})"
+
+
+class SiteSpec:
+    """A store: selectors, pagination, price parsing, connection limits and categories."""
+
+    def __init__(self, doc):
+        self.name = _require(doc, "name", str, "site")
+        where = f"site spec {self.name}"
+        self.enabled = doc.get("enabled", True)
+        self.type_prefix = doc.get("type_prefix", f"{self.name}:")
+        self.max_connections = int(doc.get("max_connections", 4))
+        if self.max_connections < 1:
+            raise ValueError(f"{where}: max_connections must be at least 1")
+        self.rate_limit = float(doc["rate_limit"]) if doc.get("rate_limit") is not None else None
+
+        fields = _require(doc, "fields", dict, where)
+        name_field = _require(fields, "name", dict, where)
+        price_field = _require(fields, "price", dict, where)
+        link_field = _require(fields, "link", dict, where)
+        pagination = doc.get("pagination", {"style": "single"})
+        self.pagination_style = pagination.get("style", "numbered")
+        if self.pagination_style not in PAGINATION_STYLES:
+            raise ValueError(f"{where}: unknown pagination style {self.pagination_style} (choose from {', '.join(PAGINATION_STYLES)})")
+        if self.pagination_style == "numbered":
+            self.page_url_template = _require(pagination, "url", str, where)
+            if "{page}" not in self.page_url_template or "{category}" not in self.page_url_template:
+                raise ValueError(f"{where}: pagination url needs {{category}} and {{page}} placeholders")
+        else:
+            self.page_url_template = None
+        self.page_pattern = re.compile(pagination["page_pattern"]) if pagination.get("page_pattern") else None
+
+        self.selectors = ListingSelectors(
+            item=_require(doc, "item", str, where),
+            name=_require(name_field, "selector", str, where),
+            price=_require(price_field, "selector", (str, list), where),
+            link=_require(link_field, "selector", str, where),
+            link_attribute=link_field.get("attribute", "href"),
+            pages=pagination.get("links") if self.page_pattern else None,
+        )
+        incremental = doc.get("incremental", {})
+        self.incremental_pages = int(incremental.get("pages", 0))
+        self.full_sweep_minutes = float(incremental.get("full_sweep_minutes", DEFAULT_FULL_SWEEP_MINUTES))
+        if self.incremental_pages and self.pagination_style != "numbered":
+            raise ValueError(f"{where}: incremental scraping needs numbered pagination")
+
+        self.name_cut = name_field.get("cut_from_last")
+        thousands = re.escape(price_field.get("thousands_separator", ","))
+        self.decimal_separator = price_field.get("decimal_separator", ".")
+        self.thousands_pattern = re.compile(thousands)
+        self.price_pattern = re.compile(r"\d(?:[\d%s]*\d)?(?:%s\d+)?" % (thousands, re.escape(self.decimal_separator)))
+
+        self.categories = []
+        for category in _require(doc, "categories", list, where):
+            self.categories.append(
+                CategorySpec(
+                    self,
+                    _require(category, "type", str, where),
+                    _require(category, "url", str, where),
+                    category.get("interval_minutes", DEFAULT_INTERVAL_MINUTES),
+                    category.get("incremental_pages"),
+                    category.get("full_sweep_minutes"),
+                )
+            )
+        if not self.categories:
+            raise ValueError(f"{where}: no categories")
+        # Shared by every category of the site, across tracker threads
+        self.connections = threading.BoundedSemaphore(self.max_connections)
+
+    def category(self, product_type):
+        """Return the category with the given (unprefixed) type."""
+        for category in self.categories:
+            if category.type == product_type:
+                return category
+        raise KeyError(f"{self.name} has no category {product_type}")
+
+    @property
+    def hosts(self):
+        return sorted({urlparse(category.url).netloc for category in self.categories})
+
+    def parse_price(self, text):
+        """
+        Convert a listing's price text to an integer, e.g. "Rs. 12,345" -> 12345.
+
+        Raises:
+            ValueError: If the text holds no number
+        """
+        match = self.price_pattern.search(text)
+        if match is None:
+            raise ValueError(f"No price in {text!r} ({self.name})")
+        number = self.thousands_pattern.sub("", match.group())
+        if self.decimal_separator != ".":
+            number = number.replace(self.decimal_separator, ".")
+        return int(float(number))
+
+    def clean_name(self, name):
+        """Strip the name and cut it at the last name_cut marker, if configured."""
+        if self.name_cut:
+            pos = name.rfind(self.name_cut)
+            if pos != -1:
+                return name[:pos].strip()
+        return name.strip()
+
+    def page_number(self, href):
+        """Page number of a pagination link, or None."""
+        match = self.page_pattern.search(href) if self.page_pattern else None
+        return int(match.group(1)) if match else None
+
+    def __repr__(self):
+        return f"SiteSpec({self.name}, {len(self.categories)} categories, max {self.max_connections} connections)"
+
+
+def _require(doc, key, kind, where):
+    value = doc.get(key)
+    if not isinstance(value, kind):
+        raise ValueError(f"{where}: missing or invalid {key!r}")
+    return value
+
+
+def load_site_spec(path):
+    """
+    Load and validate one site spec.
+
+    Args:
+        path: JSON file, or a site name looked up in SITE_SPECS_DIR
+
+    Raises:
+        ValueError: If the spec is invalid
+    """
+    if not path.endswith(".json"):
+        path = os.path.join(SITE_SPECS_DIR, f"{path}.json")
+    with open(path, encoding="utf-8") as f:
+        return SiteSpec(json.load(f))
+
+
+def load_site_specs(directory=None, names=None):
+    """
+    Load every enabled site spec in a directory, sorted by file name.
+
+    Args:
+        directory: Spec directory (defaults to SITE_SPECS_DIR)
+        names: Site names to keep (defaults to SITES, empty = all)
+
+    Returns:
+        list: SiteSpec objects
+
+    Raises:
+        ValueError: If a spec is invalid or two specs share a name or type prefix
+    """
+    directory = directory or SITE_SPECS_DIR
+    if names is None:
+        names = [name.strip() for name in ENABLED_SITES.split(",") if name.strip()]
+    sites = []
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith(".json"):
+            continue
+        site = load_site_spec(os.path.join(directory, file_name))
+        if not site.enabled:
+            logging.info(f"Site {site.name} is disabled in its spec, skipping")
+        elif names and site.name not in names:
+            logging.debug(f"Site {site.name} not in SITES, skipping")
+        else:
+            sites.append(site)
+
+    for index, site in enumerate(sites):
+        for other in sites[:index]:
+            if site.name == other.name or site.type_prefix == other.type_prefix:
+                raise ValueError(f"Site specs {other.name} and {site.name} share a name or type prefix")
+    return sites
+
+
+def main():
+    import logging_config
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Site spec tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("check", help="validate every spec and list its categories")
+    try_parser = commands.add_parser("try", help="fetch and parse page 1 of a category")
+    try_parser.add_argument("site")
+    try_parser.add_argument("type")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        try:
+            sites = load_site_specs(names=[])
+        except (OSError, ValueError) as e:
+            print(f"Invalid site specs: {e}")
+            return 1
+        for site in sites:
+            print(site)
+            for category in site.categories:
+                print(f"  {category}")
+        return 0
+
+    from site_engine import scrape_listing_page
+
+    site = load_site_spec(args.site)
+    url = site.category(args.type).page_url(1)
+    products, last_page = scrape_listing_page(site, url)
+    if products is None or products == "SCRAPE_FAILED":
+        print(f"Could not fetch {url}: {products}")
+        return 1
+    for product in products:
+        print(f"{product.name} - {product.price} - {product.link}")
+    print(f"{len(products)} product(s), last page {last_page}")
+    return 0 if products else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,337 @@
+"""
+Read API and CLI over the stored stock and price history.
+
+Answers the questions dashboards ask of the data the trackers collect,
+without raw database queries:
+
+    stock: current stock of a type, cheapest first
+    history: every price point of a product
+    lowest: the lowest price ever recorded for a product
+    time-to-sell: how long products of a type stayed listed before selling
+    new-listings: products first seen per day
+
+Every query is one aggregation (pipeline on MongoDB, GROUP BY on SQLite)
+over an index the StockStore checks at startup, so no query scans a whole
+collection. Results are kept in an in-process LRU cache for up to
+STOCK_API_CACHE_SECONDS. A tracker run drops the cached results of its type
+when it finishes, so in the scraper process the API never serves data
+older than the last run, and dashboards polling it only reach the database
+once per run. A standalone `serve` (or another worker's runs) relies on the
+expiry alone.
+
+The scraper serves the API on STOCK_API_HOST:STOCK_API_PORT next to the
+metrics endpoint:
+
+    GET /api/stock?type=gpu[&all=1]
+    GET /api/history?type=gpu&link=<product link>
+    GET /api/lowest?type=gpu&link=<product link>
+    GET /api/time-to-sell?type=gpu
+    GET /api/new-listings?type=gpu[&days=30]
+
+Usage:
+    python stock_api.py stock gpu [--all]
+    python stock_api.py history gpu <product link>
+    python stock_api.py lowest gpu <product link>
+    python stock_api.py time-to-sell gpu
+    python stock_api.py new-listings gpu [--days 30]
+    python stock_api.py serve [--host 127.0.0.1] [--port 9109]
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from metrics import API_QUERIES
+
+STOCK_API_HOST = os.getenv("STOCK_API_HOST", "127.0.0.1")
+STOCK_API_PORT = int(os.getenv("STOCK_API_PORT", "9109"))  # 0 = no endpoint in the scraper
+STOCK_API_CACHE_SECONDS = float(os.getenv("STOCK_API_CACHE_SECONDS", "300"))  # longest a cached result is served
+STOCK_API_CACHE_SIZE = int(os.getenv("STOCK_API_CACHE_SIZE", "256"))  # cached results kept, least recently used dropped first
+NEW_LISTINGS_DAYS = 30
+
+
+class QueryCache:
+    """
+    LRU cache of query results with an expiry, dropped per product type.
+
+    Concurrent misses on the same key run the query once. A result computed
+    while its type was invalidated is returned but not kept, so a run that
+    finishes mid-query never leaves an older result behind.
+    """
+
+    def __init__(self, seconds=STOCK_API_CACHE_SECONDS, size=STOCK_API_CACHE_SIZE):
+        self.seconds = seconds
+        self.size = size
+        self._entries = OrderedDict()  # (query, product type, *args) -> (expires at, value)
+        self._generations = {}  # product type -> invalidations of that type
+        self._flushes = 0  # invalidations of every type
+        self._pending = {}  # key -> lock held by the thread computing it
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        """Return the cached value of ``key`` (query name, product type, ...), calling compute() on a miss."""
+        query, product_type = key[0], key[1]
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    API_QUERIES.inc(query=query, result="hit")
+                    return entry[1]
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Lock()
+                    pending.acquire()
+                    generation = self._generation(product_type)
+                    break
+            # Another thread is running this query: wait for it and look again
+            with pending:
+                pass
+        API_QUERIES.inc(query=query, result="miss")
+        try:
+            value = compute()
+            with self._lock:
+                if self._generation(product_type) == generation and self.seconds > 0:
+                    self._entries[key] = (time.monotonic() + self.seconds, value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.size:
+                        self._entries.popitem(last=False)
+            return value
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.release()
+
+    def _generation(self, product_type):
+        return self._flushes, self._generations.get(product_type, 0)
+
+    def invalidate(self, product_type=None):
+        """Drop the cached results of one product type, or of every type. Returns the number dropped."""
+        with self._lock:
+            doomed = [key for key in self._entries if product_type is None or key[1] == product_type]
+            for key in doomed:
+                del self._entries[key]
+            if product_type is None:
+                self._flushes += 1
+            else:
+                self._generations[product_type] = self._generations.get(product_type, 0) + 1
+        return len(doomed)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+_cache = QueryCache()
+
+
+def invalidate_stock_queries(product_type=None):
+    """Drop cached API results of a type (all types if None), e.g. when a tracker run has finished."""
+    dropped = _cache.invalidate(product_type)
+    if dropped:
+        logging.debug(f"Dropped {dropped} cached stock API result(s) for {product_type or 'every type'}")
+
+
+def _store():
+    from storage import get_stock_store
+
+    store = get_stock_store()
+    store.prepare()
+    return store
+
+
+def _iso(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def current_stock(product_type, in_stock_only=True):
+    """Stored products of a type, cheapest first (only those in stock unless in_stock_only is False)."""
+
+    def compute():
+        products = _store().load_stock(product_type, in_stock_only)
+        listed = [{**product, "firstSeenAt": _iso(product.get("firstSeenAt")), "priceUpdatedAt": _iso(product.get("priceUpdatedAt"))} for product in products]
+        return {"type": product_type, "count": len(listed), "products": listed}
+
+    return _cache.get(("stock", product_type, in_stock_only), compute)
+
+
+def price_history(product_type, link):
+    """Every recorded price point of one product, oldest first."""
+
+    def compute():
+        points = _store().load_price_history(product_type, link)
+        return {"type": product_type, "link": link, "points": [{**point, "at": _iso(point["at"])} for point in points]}
+
+    return _cache.get(("history", product_type, link), compute)
+
+
+def lowest_price(product_type, link):
+    """The lowest price ever recorded for one product (None without history)."""
+
+    def compute():
+        lowest = _store().load_lowest_prices(product_type, [link])
+        return {"type": product_type, "link": link, "lowest": lowest.get(link)}
+
+    return _cache.get(("lowest", product_type, link), compute)
+
+
+def time_to_sell(product_type):
+    """How long products of a type were listed before they first sold, in hours."""
+
+    def compute():
+        hours = sorted((sold - first).total_seconds() / 3600 for first, sold in _store().load_sell_times(product_type).values())
+        summary = {"type": product_type, "sold": len(hours), "meanHours": None, "medianHours": None, "p90Hours": None}
+        if hours:
+            summary.update(
+                meanHours=round(statistics.fmean(hours), 2),
+                medianHours=round(statistics.median(hours), 2),
+                p90Hours=round(hours[min(len(hours) - 1, int(len(hours) * 0.9))], 2),
+            )
+        return summary
+
+    return _cache.get(("time-to-sell", product_type), compute)
+
+
+def daily_new_listings(product_type, days=NEW_LISTINGS_DAYS):
+    """Products of a type first seen on each of the last ``days`` days (UTC), days without any included."""
+    if days < 1:
+        raise ValueError(f"days must be at least 1, got {days}")
+    today = datetime.utcnow().date()
+    first_day = today - timedelta(days=days - 1)
+
+    def compute():
+        counts = dict(_store().load_daily_new_listings(product_type, datetime.combine(first_day, datetime.min.time())))
+        listed = [(first_day + timedelta(days=n)).isoformat() for n in range(days)]
+        return {"type": product_type, "days": [{"day": day, "count": counts.get(day, 0)} for day in listed]}
+
+    # Keyed by day, so the window moves at midnight
+    return _cache.get(("new-listings", product_type, days, today), compute)
+
+
+def _flag(value):
+    return value.lower() in ("1", "true", "yes")
+
+
+# path -> (query function, its positional parameters, optional keyword parameters with their converters)
+ROUTES = {
+    "/api/stock": (lambda product_type, all=False: current_stock(product_type, not all), ("type",), {"all": _flag}),
+    "/api/history": (price_history, ("type", "link"), {}),
+    "/api/lowest": (lowest_price, ("type", "link"), {}),
+    "/api/time-to-sell": (time_to_sell, ("type",), {}),
+    "/api/new-listings": (daily_new_listings, ("type",), {"days": int}),
+}
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        from storage import STORAGE_ERRORS
+
+        url = urlparse(self.path)
+        route = ROUTES.get(url.path)
+        if route is None:
+            self._respond(404, {"error": "not found", "paths": sorted(ROUTES)})
+            return
+        func, required, optional = route
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        missing = [name for name in required if not params.get(name)]
+        if missing:
+            self._respond(400, {"error": f"missing parameter(s): {', '.join(missing)}"})
+            return
+        try:
+            kwargs = {name: convert(params[name]) for name, convert in optional.items() if name in params}
+            self._respond(200, func(*(params[name] for name in required), **kwargs))
+        except ValueError as e:
+            self._respond(400, {"error": str(e)})
+        except STORAGE_ERRORS as e:
+            logging.warning(f"Stock API query {url.path} failed: {e}")
+            self._respond(503, {"error": "storage unavailable"})
+        except Exception as e:
+            logging.error(f"Stock API query {self.path} failed: {e}", exc_info=True)
+            self._respond(500, {"error": "internal error"})
+
+    def _respond(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(f"stock api {self.address_string()} {format % args}")
+
+
+def start_api_server(host=STOCK_API_HOST, port=STOCK_API_PORT):
+    """Serve the read API on a daemon thread. Returns the server, or None if disabled."""
+    if not port:
+        logging.info("Stock API disabled (STOCK_API_PORT=0)")
+        return None
+    server = ThreadingHTTPServer((host, port), _ApiHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stock-api", daemon=True).start()
+    logging.info(f"Stock API on http://{host}:{server.server_address[1]}/api/")
+    return server
+
+
+def main():
+    # Only configure logging and load .env when run as a script
+    import logging_config
+    from dotenv import load_dotenv
+    from storage import STORAGE_ERRORS
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Query the stored stock and price history")
+    commands = parser.add_subparsers(dest="command", required=True)
+    stock = commands.add_parser("stock", help="current stock of a type, cheapest first")
+    stock.add_argument("type")
+    stock.add_argument("--all", action="store_true", help="include products no longer in stock")
+    for name, help_text in (("history", "price history of a product"), ("lowest", "lowest recorded price of a product")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("type")
+        command.add_argument("link")
+    commands.add_parser("time-to-sell", help="hours products of a type were listed before selling").add_argument("type")
+    new_listings = commands.add_parser("new-listings", help="products first seen per day")
+    new_listings.add_argument("type")
+    new_listings.add_argument("--days", type=int, default=NEW_LISTINGS_DAYS)
+    serve = commands.add_parser("serve", help="serve the HTTP API (cached results expire after STOCK_API_CACHE_SECONDS)")
+    serve.add_argument("--host", default=STOCK_API_HOST)
+    serve.add_argument("--port", type=int, default=STOCK_API_PORT or 9109)
+    args = parser.parse_args()
+
+    try:
+        if args.command == "serve":
+            _store()
+            start_api_server(args.host, args.port)
+            threading.Event().wait()
+        elif args.command == "stock":
+            result = current_stock(args.type, not args.all)
+        elif args.command == "history":
+            result = price_history(args.type, args.link)
+        elif args.command == "lowest":
+            result = lowest_price(args.type, args.link)
+        elif args.command == "time-to-sell":
+            result = time_to_sell(args.type)
+        else:
+            result = daily_new_listings(args.type, args.days)
+    except ValueError as e:
+        print(f"Invalid query: {e}")
+        return 1
+    except STORAGE_ERRORS as e:
+        logging.error(f"Stock API {args.command} failed: {e}")
+        return 1
+    except KeyboardInterrupt:
+        return 0
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,220 @@
+"""
+Bulk stock diff engine.
+
+Loads the stored state of one product type with a single query, works out
+new, restocked, price-changed and sold products in memory and writes every
+change in one batch through the StockStore (one unordered bulk_write on
+MongoDB), instead of a find_one/update_one pair per product plus an
+update_one per sold item. StreamingStockDiff does the classification page
+by page while the scrape is still running.
+"""
+
+import logging
+from datetime import datetime
+
+from price_history import price_point
+from products import ProductDeduplicator
+from storage import STORAGE_ERRORS
+
+
+class StockDiff:
+    """Result of comparing a scrape against the stored state of a product type."""
+
+    def __init__(self):
+        self.new = []  # scraped records not in the database
+        self.restocked = []  # scraped records stored as out of stock
+        self.price_changed = []  # in-stock records whose price changed
+        self.sold = []  # stored in-stock documents missing from the scrape
+        self.previous_prices = {}  # link -> stored price of each price_changed record
+        self.unchanged = 0
+        self.scraped = 0
+
+    @property
+    def changed(self):
+        return bool(self.new or self.restocked or self.price_changed or self.sold)
+
+    def summary(self):
+        return (
+            f"{len(self.new)} new, {len(self.restocked)} restocked, {len(self.price_changed)} price changed, "
+            f"{len(self.sold)} sold, {self.unchanged} unchanged"
+        )
+
+
+class StreamingStockDiff:
+    """
+    Classify scraped pages against the stored state as they arrive.
+
+    Records go through a ProductDeduplicator and are classified page by
+    page, so only the dedup keys and the changed products are kept, never
+    the whole scrape. Sold products are only worked out in finish(), which
+    must not be called unless pagination completed successfully, and never
+    for a partial (incremental) scrape.
+
+    Pages flagged unchanged by the page cache only contribute their keys:
+    their bytes match what the last successful run stored, so none of their
+    products can need an update. The stored state is loaded on the first
+    changed page (or in finish()), so a category with no changed pages never
+    queries it at all.
+    """
+
+    def __init__(self, load_state, dedup_policy=None):
+        self.diff = StockDiff()
+        self.dedup = ProductDeduplicator(dedup_policy)
+        self._changes = {}  # key -> (StockDiff list name, record), in first-seen order
+        self._load_state = load_state
+        self._state = None
+
+    @property
+    def state(self):
+        if self._state is None:
+            self._state = self._load_state()
+        return self._state
+
+    def _classify(self, record):
+        stored = self.state.get(record.link)
+        if stored is None:
+            return "new"
+        if stored.get("inStock") is False:
+            return "restocked"
+        if stored.get("price") != record.price:
+            return "price_changed"
+        return None
+
+    def add_page(self, records, unchanged=False):
+        """Deduplicate and classify one page of scraped ProductRecords.
+
+        Returns:
+            int: Number of records on the page that are not in the database yet
+        """
+        diff = self.diff
+        new = 0
+        for record in records:
+            diff.scraped += 1
+            outcome = self.dedup.offer(record)
+            if outcome == "skip":
+                continue
+            change = None if unchanged else self._classify(record)
+            if outcome == "replace":
+                # Undo the classification of the copy this one replaces
+                if record.key in self._changes:
+                    replaced_change, replaced = self._changes[record.key]
+                    if replaced_change == "price_changed":
+                        # Its old price must not reach the alert or the journal
+                        diff.previous_prices.pop(replaced.link, None)
+                    if change is None:
+                        del self._changes[record.key]
+                else:
+                    diff.unchanged -= 1
+            if change is None:
+                diff.unchanged += 1
+            else:
+                self._changes[record.key] = (change, record)
+                new += change == "new"
+                if change == "price_changed":
+                    diff.previous_prices[record.link] = self.state[record.link].get("price")
+        return new
+
+    def finish(self, partial=False):
+        """Fill in the changed and sold products and return the diff.
+
+        Args:
+            partial: The scrape only covered some pages, so products that were
+                not seen are not sold
+        """
+        diff = self.diff
+        for change, record in self._changes.values():
+            getattr(diff, change).append(record)
+        if not partial:
+            seen_links = {link for _, link in self.dedup.prices}
+            for link, stored in self.state.items():
+                if link not in seen_links and stored.get("inStock") is True:
+                    diff.sold.append(stored)
+        self.dedup.log_summary()
+        return diff
+
+
+def compute_stock_diff(products, state, dedup_policy=None):
+    """
+    Compare scraped products with the stored state.
+
+    Args:
+        products: Scraped ProductRecords (duplicate listings are dropped per dedup_policy)
+        state: Stored products keyed by link, from StockStore.load_stock_state
+        dedup_policy: "first", "lowest" or "last" (defaults to GAMELOOT_DEDUP_POLICY)
+
+    Returns:
+        StockDiff: Records grouped by the change they need, stored documents for sold products
+    """
+    stream = StreamingStockDiff(lambda: state, dedup_policy)
+    stream.add_page(products)
+    return stream.finish()
+
+
+def load_sold_names(store, diff, product_type):
+    """Fetch the names of sold products for the alert (the state query does not load them)."""
+    if not diff.sold:
+        return
+    names = store.load_names(product_type, [stored["link"] for stored in diff.sold])
+    for stored in diff.sold:
+        stored["name"] = names.get(stored["link"]) or "No name found"
+
+
+def build_history_points(diff, product_type, now=None):
+    """Return the (type, link, point) price history entries for every new, restocked, repriced and sold product."""
+    if now is None:
+        now = datetime.utcnow()
+    points = [(product_type, product.link, price_point(product.price, now, True)) for product in diff.new + diff.restocked + diff.price_changed]
+    points.extend((product_type, stored["link"], price_point(stored["price"], now, False)) for stored in diff.sold)
+    return points
+
+
+def apply_stock_diff(store, diff, product_type, journal=None, replay=False):
+    """
+    Write a diff through a StockStore, append its price points and log the round trips saved.
+
+    The old per-product path cost one find_one and one update_one per scraped
+    product, one find for the sold pass and one update_one per sold product.
+
+    Where the store supports transactions (see StockStore.atomic) the stock
+    writes, the price points and the run journal's "applied" mark commit
+    together, and a failed price history write fails the whole run, which
+    the journal then applies again. Without one, a failed price history
+    write is logged and does not fail the run, so the stock state (and
+    alerts) stay consistent.
+
+    Writes are stamped with the journal's write time where there is one, so
+    replaying an interrupted diff rewrites the same documents, and a replay
+    leaves out the price points the interrupted run already recorded.
+
+    Args:
+        journal: Optional RunJournal of the run, marked applied with the writes
+        replay: The diff is one an interrupted run may have partly written
+
+    Returns:
+        int: Number of product writes
+    """
+    now = journal.write_time() if journal is not None else None
+    if now is None:
+        now = datetime.utcnow()
+    history_writes = 0
+    with store.atomic() as transactional:
+        writes = store.write_stock_changes(product_type, diff, now)
+        points = build_history_points(diff, product_type, now)
+        if transactional:
+            history_writes = 1 if store.record_price_history(points, skip_recorded=replay) else 0
+        else:
+            try:
+                history_writes = 1 if store.record_price_history(points, skip_recorded=replay) else 0
+            except STORAGE_ERRORS as e:
+                logging.error(f"Failed to record price history for {product_type}: {e}")
+        if journal is not None:
+            journal.applied()
+
+    old_round_trips = 2 * diff.scraped + 1 + len(diff.sold)
+    # state query + sold names + product writes + price history
+    new_round_trips = 1 + (1 if diff.sold else 0) + (1 if writes else 0) + history_writes
+    logging.info(
+        f"Applied {writes} update(s) in {new_round_trips} round trip(s){' in one transaction' if transactional else ''} "
+        f"(per-product path: {old_round_trips}, saved {old_round_trips - new_round_trips})"
+    )
+    return writes
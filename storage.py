@@ -0,0 +1,927 @@
+"""
+Storage backends for stock state, price history and the listing page cache.
+
+process_category_stock talks to a StockStore instead of pymongo directly:
+
+    mongo: MongoDB through the shared client in db_utils (default)
+    sqlite: Embedded SQLite database in WAL mode, for single-node
+            deployments that do not want to run a MongoDB server
+
+STORAGE_BACKEND picks one. "auto" (default) uses SQLite when MONGODB_URI is
+a sqlite:///path URI (sqlite:////abs/path for an absolute path) and MongoDB
+otherwise. With STORAGE_BACKEND=sqlite and no sqlite URI the database is
+SQLITE_PATH.
+
+Both backends keep the same semantics: one row/document per (type, link),
+price points appended per change and a page cache entry per category.
+
+The read queries behind stock_api.py (stock listing, time to sell, daily
+new listings) and the model price ranges of new-listing alerts (see
+product_identity.py) are index-backed on both backends; prepare() checks their
+plans along with the tracker's hot queries.
+
+Leases (see leases.py) live in the same database, so worker mode
+coordinates several nodes through MongoDB and several processes on one
+host through SQLite.
+
+atomic() groups a run's stock, price history and run journal writes into
+one transaction: always on SQLite, and on MongoDB when it is a replica set
+or sharded cluster (STORAGE_TRANSACTIONS=off turns them off there).
+"""
+
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from db_utils import IndexNotUsedError, get_mongo_conn, ensure_indexes, verify_index_usage
+from metrics import STORAGE_ERRORS as STORAGE_ERRORS_TOTAL, STORAGE_OP_SECONDS
+from price_history import (
+    PRICE_HISTORY_COLLECTION,
+    PRICE_HISTORY_DOWNSAMPLE_DAYS,
+    PRICE_HISTORY_RETENTION_DAYS,
+    downsample_points,
+    downsample_price_history,
+    load_price_history,
+    price_history_indexes,
+    record_price_history,
+)
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "auto")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "gameloot.db")
+SQLITE_BUSY_TIMEOUT = 30  # seconds a writer waits for another writer's lock
+SQLITE_MAX_VARIABLES = 500  # links per IN (...) query
+STORAGE_TRANSACTIONS = os.getenv("STORAGE_TRANSACTIONS", "auto")  # auto = MongoDB transactions on replica sets, off = never
+
+# Single collection/table for all Gameloot product types (gpu, cpu, mobo, ram)
+GAMELOOT_COLLECTION = "gameloot_products"
+PAGE_CACHE_COLLECTION = "gameloot_page_cache"
+WATCH_RULES_COLLECTION = "gameloot_watch_rules"
+RUN_JOURNAL_COLLECTION = "gameloot_run_journal"
+LEASES_COLLECTION = "gameloot_leases"
+# Query shapes process_category_stock runs every time, checked with explain() at startup
+GAMELOOT_HOT_QUERIES = [
+    {"type": "gpu"},
+    {"link": "https://gameloot.in/product/example/", "type": "gpu"},
+    {"type": "gpu", "inStock": True},
+    {"type": "gpu", "link": {"$in": ["https://gameloot.in/product/example/"]}},
+    # stock_api.py
+    {"type": "gpu", "firstSeenAt": {"$gte": datetime(2024, 1, 1)}},
+    # Model price ranges of new-listing alerts
+    {"type": "gpu", "modelKey": {"$in": ["msi|rtx 3060|12gb|-"]}},
+]
+
+# Fields the diff needs from stored products; names are only fetched for sold products
+STATE_PROJECTION = {"_id": 0, "link": 1, "price": 1, "inStock": 1}
+SOLD_PROJECTION = {"_id": 0, "link": 1, "name": 1}
+LISTING_PROJECTION = {"_id": 0, "link": 1, "name": 1, "price": 1, "inStock": 1, "firstSeenAt": 1, "priceUpdatedAt": 1, "modelKey": 1}
+MODEL_PROJECTION = {"_id": 0, "link": 1, "name": 1, "modelKey": 1}
+
+# Errors a backend raises when the database is unavailable or a query fails
+STORAGE_ERRORS = (PyMongoError, sqlite3.Error)
+
+
+class StockStore:
+    """Interface process_category_stock, the page cache and the maintenance job use."""
+
+    name = None
+
+    def connect(self):
+        """Make sure the database is reachable (retrying where the backend can), raising a STORAGE_ERROR if not."""
+        raise NotImplementedError
+
+    def prepare(self):
+        """Create collections/tables and indexes and check the hot queries use them (once per process)."""
+        raise NotImplementedError
+
+    def load_stock_state(self, product_type):
+        """Return {link: {"link", "price", "inStock"}} for every stored product of a type."""
+        raise NotImplementedError
+
+    def load_names(self, product_type, links):
+        """Return {link: name} for the given links."""
+        raise NotImplementedError
+
+    def write_stock_changes(self, product_type, diff, now):
+        """Write the new, restocked, repriced and sold products of a StockDiff. Returns the number of writes."""
+        raise NotImplementedError
+
+    def record_price_history(self, points, skip_recorded=False):
+        """Append (type, link, point) price points, leaving out the ones already stored if skip_recorded. Returns the number written."""
+        raise NotImplementedError
+
+    def load_price_history(self, product_type, link):
+        """Return every stored price point of a product, oldest first."""
+        raise NotImplementedError
+
+    def maintain_price_history(self, now=None):
+        """Apply retention and downsampling. Returns the number of points removed."""
+        raise NotImplementedError
+
+    def load_lowest_prices(self, product_type, links):
+        """Return {link: lowest recorded price} for the given links (links without history are left out)."""
+        raise NotImplementedError
+
+    def load_stock(self, product_type, in_stock_only=True):
+        """Return the stored products of a type ({"link", "name", "price", "inStock", "firstSeenAt", "priceUpdatedAt", "modelKey"}), cheapest first."""
+        raise NotImplementedError
+
+    def load_model_names(self, product_type):
+        """Return (link, name, model key or None) of every stored product of a type."""
+        raise NotImplementedError
+
+    def write_model_keys(self, product_type, keys):
+        """Set the model key of stored products from {link: model key}."""
+        raise NotImplementedError
+
+    def load_model_price_ranges(self, product_type, model_keys):
+        """Return {model key: {"low", "high", "listings"}}: recorded prices and number of stored listings of each model with a price history."""
+        raise NotImplementedError
+
+    def load_sell_times(self, product_type):
+        """Return {link: (first price point, first out-of-stock point)} for every product of a type that sold."""
+        raise NotImplementedError
+
+    def load_daily_new_listings(self, product_type, since):
+        """Return [("YYYY-MM-DD", products first seen that day)] for days from ``since`` on, oldest first."""
+        raise NotImplementedError
+
+    def load_watch_rules(self):
+        """Return every stored watch rule document (see watchlist.WatchRule.to_dict)."""
+        raise NotImplementedError
+
+    def save_watch_rule(self, doc):
+        """Insert or replace a watch rule by its id."""
+        raise NotImplementedError
+
+    def delete_watch_rule(self, rule_id):
+        """Remove a watch rule. Returns True if it existed."""
+        raise NotImplementedError
+
+    def load_run_journal(self, key):
+        """Return the run journal document of a job (see run_journal), or None."""
+        raise NotImplementedError
+
+    def save_run_journal(self, key, fields):
+        """Create or update a run journal like a MongoDB $set (dotted field paths update nested fields)."""
+        raise NotImplementedError
+
+    def delete_run_journal(self, key):
+        raise NotImplementedError
+
+    def acquire_lease(self, name, owner, seconds):
+        """
+        Take a lease that is free, expired or already ours, for ``seconds`` from now.
+
+        Returns:
+            int: Fencing token, bumped on every acquisition, or None if another owner holds it
+        """
+        raise NotImplementedError
+
+    def renew_leases(self, names, owner, seconds):
+        """Extend the given leases of an owner. Returns the set of names it still holds."""
+        raise NotImplementedError
+
+    def release_lease(self, name, owner):
+        raise NotImplementedError
+
+    def load_leases(self):
+        """Return every lease as {"name", "owner", "expiresAt" (Unix time), "token"}."""
+        raise NotImplementedError
+
+    @contextmanager
+    def atomic(self):
+        """Run the writes of the with block in one transaction where the backend supports it. Yields True if it does."""
+        yield False
+
+    def load_page_cache(self, category):
+        """Return the cached page entries of a category ([] if none)."""
+        raise NotImplementedError
+
+    def save_page_cache(self, category, entries):
+        raise NotImplementedError
+
+    def delete_page_cache(self, category):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def load_stock_state(collection, product_type):
+    """Return {link: stored product} for a product type using one projected query."""
+    return {doc["link"]: doc for doc in collection.find({"type": product_type}, STATE_PROJECTION)}
+
+
+def _fold_model_ranges(models, link_ranges):
+    """Combine (link, low, high) price ranges into {model key: {"low", "high", "listings"}} through {link: model key}."""
+    ranges = {}
+    for link, low, high in link_ranges:
+        if low is None:
+            continue
+        model = ranges.setdefault(models[link], {"low": low, "high": high, "listings": 0})
+        model["low"] = min(model["low"], low)
+        model["high"] = max(model["high"], high)
+        model["listings"] += 1
+    return ranges
+
+
+def build_update_ops(diff, product_type, now=None):
+    """Build the UpdateOne operations that bring the stored state in line with the diff."""
+    if now is None:
+        now = datetime.utcnow()
+    ops = []
+    for product in diff.new:
+        set_doc = {**product.to_dict(), "priceUpdatedAt": now, "firstSeenAt": now}
+        ops.append(UpdateOne({"link": product.link, "type": product_type}, {"$set": set_doc}, upsert=True))
+    for product in diff.restocked + diff.price_changed:
+        ops.append(UpdateOne({"link": product.link, "type": product_type}, {"$set": {**product.to_dict(), "priceUpdatedAt": now}}, upsert=True))
+    for stored in diff.sold:
+        ops.append(UpdateOne({"link": stored["link"], "type": product_type}, {"$set": {"inStock": False}}))
+    return ops
+
+
+class MongoStockStore(StockStore):
+    """MongoDB backend: documents in GAMELOOT_COLLECTION, bucketed price history and cached pages."""
+
+    name = "mongo"
+
+    def __init__(self, verify_indexes=True):
+        self.verify_indexes = verify_indexes
+        self._prepared = False
+        self._transactions = None
+        self._local = threading.local()
+
+    def collection(self, name, retry=False):
+        return get_mongo_conn(name, retry=retry)
+
+    def _session(self):
+        """The session of the atomic() block running on this thread, or None."""
+        return getattr(self._local, "session", None)
+
+    def transactions_supported(self):
+        """True on replica sets and sharded clusters (transactions need one), checked once with the hello command."""
+        if self._transactions is None:
+            if STORAGE_TRANSACTIONS == "off":
+                self._transactions = False
+            else:
+                try:
+                    hello = self.collection(GAMELOOT_COLLECTION).database.client.admin.command("hello")
+                    self._transactions = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+                except (PyMongoError, NotImplementedError) as e:
+                    logging.warning(f"Could not check MongoDB transaction support, writing without transactions: {e}")
+                    self._transactions = False
+            logging.info(f"MongoDB transactions {'on' if self._transactions else 'off (standalone server)'}")
+        return self._transactions
+
+    @contextmanager
+    def atomic(self):
+        if self._session() is not None:
+            yield True
+            return
+        if not self.transactions_supported():
+            yield False
+            return
+        client = self.collection(GAMELOOT_COLLECTION).database.client
+        with client.start_session() as session:
+            with session.start_transaction():
+                self._local.session = session
+                try:
+                    yield True
+                finally:
+                    self._local.session = None
+
+    def connect(self):
+        self.collection(GAMELOOT_COLLECTION, retry=True)
+
+    def prepare(self):
+        if self._prepared:
+            return
+        products = self.collection(GAMELOOT_COLLECTION)
+        ensure_indexes(products)
+        if self.verify_indexes:
+            verify_index_usage(products, GAMELOOT_HOT_QUERIES)
+        ensure_indexes(self.collection(PRICE_HISTORY_COLLECTION), price_history_indexes())
+        self._prepared = True
+
+    def load_stock_state(self, product_type):
+        return load_stock_state(self.collection(GAMELOOT_COLLECTION), product_type)
+
+    def load_names(self, product_type, links):
+        cursor = self.collection(GAMELOOT_COLLECTION).find({"type": product_type, "link": {"$in": list(links)}}, SOLD_PROJECTION)
+        return {doc["link"]: doc.get("name") for doc in cursor}
+
+    def write_stock_changes(self, product_type, diff, now):
+        ops = build_update_ops(diff, product_type, now)
+        if ops:
+            result = self.collection(GAMELOOT_COLLECTION).bulk_write(ops, ordered=False, session=self._session())
+            logging.debug(f"bulk_write result: {result.bulk_api_result}")
+        return len(ops)
+
+    def record_price_history(self, points, skip_recorded=False):
+        return record_price_history(self.collection(PRICE_HISTORY_COLLECTION), points, session=self._session(), skip_recorded=skip_recorded)
+
+    def load_price_history(self, product_type, link):
+        return load_price_history(self.collection(PRICE_HISTORY_COLLECTION), product_type, link)
+
+    def maintain_price_history(self, now=None):
+        # Retention is the TTL index on the buckets
+        return downsample_price_history(self.collection(PRICE_HISTORY_COLLECTION), now=now)
+
+    def load_lowest_prices(self, product_type, links):
+        pipeline = [
+            {"$match": {"type": product_type, "link": {"$in": list(links)}}},
+            {"$unwind": "$points"},
+            {"$group": {"_id": "$link", "lowest": {"$min": "$points.price"}}},
+        ]
+        return {doc["_id"]: doc["lowest"] for doc in self.collection(PRICE_HISTORY_COLLECTION).aggregate(pipeline)}
+
+    def load_stock(self, product_type, in_stock_only=True):
+        query = {"type": product_type, "inStock": True} if in_stock_only else {"type": product_type}
+        return list(self.collection(GAMELOOT_COLLECTION).find(query, LISTING_PROJECTION).sort([("price", 1), ("link", 1)]))
+
+    def load_model_names(self, product_type):
+        cursor = self.collection(GAMELOOT_COLLECTION).find({"type": product_type}, MODEL_PROJECTION)
+        return [(doc["link"], doc.get("name"), doc.get("modelKey")) for doc in cursor]
+
+    def write_model_keys(self, product_type, keys):
+        ops = [UpdateOne({"link": link, "type": product_type}, {"$set": {"modelKey": key}}) for link, key in keys.items()]
+        if ops:
+            self.collection(GAMELOOT_COLLECTION).bulk_write(ops, ordered=False)
+        return len(ops)
+
+    def load_model_price_ranges(self, product_type, model_keys):
+        cursor = self.collection(GAMELOOT_COLLECTION).find({"type": product_type, "modelKey": {"$in": list(model_keys)}}, MODEL_PROJECTION)
+        models = {doc["link"]: doc["modelKey"] for doc in cursor}
+        if not models:
+            return {}
+        pipeline = [
+            {"$match": {"type": product_type, "link": {"$in": list(models)}}},
+            {"$unwind": "$points"},
+            {"$group": {"_id": "$link", "low": {"$min": "$points.price"}, "high": {"$max": "$points.price"}}},
+        ]
+        return _fold_model_ranges(models, ((doc["_id"], doc["low"], doc["high"]) for doc in self.collection(PRICE_HISTORY_COLLECTION).aggregate(pipeline)))
+
+    def load_sell_times(self, product_type):
+        pipeline = [
+            {"$match": {"type": product_type}},
+            {"$unwind": "$points"},
+            {
+                "$group": {
+                    "_id": "$link",
+                    "first": {"$min": "$points.at"},
+                    # $min skips the nulls of in-stock points
+                    "sold": {"$min": {"$cond": [{"$eq": ["$points.inStock", False]}, "$points.at", None]}},
+                }
+            },
+            {"$match": {"sold": {"$ne": None}}},
+        ]
+        return {doc["_id"]: (doc["first"], doc["sold"]) for doc in self.collection(PRICE_HISTORY_COLLECTION).aggregate(pipeline)}
+
+    def load_daily_new_listings(self, product_type, since):
+        pipeline = [
+            {"$match": {"type": product_type, "firstSeenAt": {"$gte": since}}},
+            {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$firstSeenAt"}}, "count": {"$sum": 1}}},
+            {"$sort": {"_id": 1}},
+        ]
+        return [(doc["_id"], doc["count"]) for doc in self.collection(GAMELOOT_COLLECTION).aggregate(pipeline)]
+
+    def load_watch_rules(self):
+        return list(self.collection(WATCH_RULES_COLLECTION).find({}, {"_id": 0}))
+
+    def save_watch_rule(self, doc):
+        self.collection(WATCH_RULES_COLLECTION).replace_one({"_id": doc["id"]}, {"_id": doc["id"], **doc}, upsert=True)
+
+    def delete_watch_rule(self, rule_id):
+        return self.collection(WATCH_RULES_COLLECTION).delete_one({"_id": rule_id}).deleted_count > 0
+
+    def load_run_journal(self, key):
+        return self.collection(RUN_JOURNAL_COLLECTION).find_one({"_id": key}, {"_id": 0})
+
+    def save_run_journal(self, key, fields):
+        self.collection(RUN_JOURNAL_COLLECTION).update_one({"_id": key}, {"$set": fields}, upsert=True, session=self._session())
+
+    def delete_run_journal(self, key):
+        self.collection(RUN_JOURNAL_COLLECTION).delete_one({"_id": key}, session=self._session())
+
+    def acquire_lease(self, name, owner, seconds):
+        now = time.time()
+        try:
+            doc = self.collection(LEASES_COLLECTION).find_one_and_update(
+                {"_id": name, "$or": [{"owner": owner}, {"expiresAt": {"$lt": now}}]},
+                {"$set": {"owner": owner, "expiresAt": now + seconds}, "$inc": {"token": 1}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The lease exists and is held by someone else, so the upsert tried to insert it again
+            return None
+        return doc["token"]
+
+    def renew_leases(self, names, owner, seconds):
+        leases = self.collection(LEASES_COLLECTION)
+        query = {"_id": {"$in": list(names)}, "owner": owner}
+        leases.update_many(query, {"$set": {"expiresAt": time.time() + seconds}})
+        return {doc["_id"] for doc in leases.find(query, {"_id": 1})}
+
+    def release_lease(self, name, owner):
+        self.collection(LEASES_COLLECTION).delete_one({"_id": name, "owner": owner})
+
+    def load_leases(self):
+        return [{"name": doc.pop("_id"), **doc} for doc in self.collection(LEASES_COLLECTION).find()]
+
+    def load_page_cache(self, category):
+        doc = self.collection(PAGE_CACHE_COLLECTION).find_one({"_id": category})
+        return doc["pages"] if doc else []
+
+    def save_page_cache(self, category, entries):
+        self.collection(PAGE_CACHE_COLLECTION).replace_one(
+            {"_id": category},
+            {"_id": category, "pages": entries, "updatedAt": datetime.utcnow()},
+            upsert=True,
+        )
+
+    def delete_page_cache(self, category):
+        self.collection(PAGE_CACHE_COLLECTION).delete_one({"_id": category})
+
+
+SQLITE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {GAMELOOT_COLLECTION} (
+    type TEXT NOT NULL,
+    link TEXT NOT NULL,
+    name TEXT,
+    price INTEGER,
+    inStock INTEGER NOT NULL,
+    priceUpdatedAt TEXT,
+    firstSeenAt TEXT,
+    modelKey TEXT,
+    PRIMARY KEY (type, link)
+);
+CREATE INDEX IF NOT EXISTS type_inStock ON {GAMELOOT_COLLECTION} (type, inStock);
+CREATE INDEX IF NOT EXISTS type_firstSeenAt ON {GAMELOOT_COLLECTION} (type, firstSeenAt);
+CREATE TABLE IF NOT EXISTS {PRICE_HISTORY_COLLECTION} (
+    type TEXT NOT NULL,
+    link TEXT NOT NULL,
+    price INTEGER,
+    at TEXT NOT NULL,
+    inStock INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS type_link_at ON {PRICE_HISTORY_COLLECTION} (type, link, at);
+CREATE INDEX IF NOT EXISTS at ON {PRICE_HISTORY_COLLECTION} (at);
+CREATE TABLE IF NOT EXISTS {PAGE_CACHE_COLLECTION} (
+    category TEXT PRIMARY KEY,
+    pages TEXT NOT NULL,
+    updatedAt TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS {WATCH_RULES_COLLECTION} (
+    id TEXT PRIMARY KEY,
+    chatId INTEGER NOT NULL,
+    rule TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS {RUN_JOURNAL_COLLECTION} (
+    key TEXT PRIMARY KEY,
+    doc TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS {LEASES_COLLECTION} (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expiresAt REAL NOT NULL,
+    token INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS storage_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+# Columns added since the first schema: (table, column, type), added to older databases by prepare()
+SQLITE_ADDED_COLUMNS = [
+    (GAMELOOT_COLLECTION, "modelKey", "TEXT"),
+]
+SQLITE_ADDED_INDEXES = f"""
+CREATE INDEX IF NOT EXISTS type_modelKey ON {GAMELOOT_COLLECTION} (type, modelKey);
+"""
+# Same hot query shapes as GAMELOOT_HOT_QUERIES, checked with EXPLAIN QUERY PLAN
+SQLITE_HOT_QUERIES = [
+    (f"SELECT link, price, inStock FROM {GAMELOOT_COLLECTION} WHERE type = ?", ("gpu",)),
+    (f"SELECT name FROM {GAMELOOT_COLLECTION} WHERE type = ? AND link = ?", ("gpu", "https://gameloot.in/product/example/")),
+    (f"SELECT link FROM {GAMELOOT_COLLECTION} WHERE type = ? AND inStock = 1", ("gpu",)),
+    # stock_api.py
+    (f"SELECT firstSeenAt FROM {GAMELOOT_COLLECTION} WHERE type = ? AND firstSeenAt >= ?", ("gpu", "2024-01-01")),
+    (f"SELECT link, MIN(at) FROM {PRICE_HISTORY_COLLECTION} WHERE type = ? GROUP BY link", ("gpu",)),
+    (f"SELECT link FROM {GAMELOOT_COLLECTION} WHERE type = ? AND modelKey IN (?)", ("gpu", "msi|rtx 3060|12gb|-")),
+]
+_UPSERT_PRODUCT = f"""
+INSERT INTO {GAMELOOT_COLLECTION} (type, link, name, price, inStock, priceUpdatedAt, firstSeenAt, modelKey)
+VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+ON CONFLICT (type, link) DO UPDATE SET
+    name = excluded.name, price = excluded.price, inStock = 1, priceUpdatedAt = excluded.priceUpdatedAt,
+    firstSeenAt = COALESCE(excluded.firstSeenAt, firstSeenAt), modelKey = COALESCE(excluded.modelKey, modelKey)
+"""
+
+
+def _set_path(doc, path, value):
+    """Apply one MongoDB-style dotted $set path to a nested dict."""
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+class SQLiteStockStore(StockStore):
+    """
+    Embedded SQLite backend.
+
+    Every thread gets its own connection to the same WAL-mode database, so
+    readers never block the tracker that is writing. Each run's writes go
+    through executemany in a single IMMEDIATE transaction, and atomic()
+    widens that transaction to everything written in its with block.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._prepared = False
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        if conn.in_transaction:
+            # Part of an atomic() block, which commits
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @contextmanager
+    def atomic(self):
+        with self._transaction():
+            yield True
+
+    def connect(self):
+        self._connection().execute("SELECT 1")
+
+    def prepare(self):
+        if self._prepared:
+            return
+        conn = self._connection()
+        conn.executescript(SQLITE_SCHEMA)
+        for table, column, column_type in SQLITE_ADDED_COLUMNS:
+            if column not in {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                logging.info(f"Adding column {column} to {table}")
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+        conn.executescript(SQLITE_ADDED_INDEXES)
+        for sql, params in SQLITE_HOT_QUERIES:
+            plan = " | ".join(row["detail"] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+            if "SCAN" in plan and "INDEX" not in plan:
+                raise IndexNotUsedError(f"Hot query does a table scan: {sql} ({plan})")
+        logging.info(f"SQLite storage ready at {self.path}")
+        self._prepared = True
+
+    def load_stock_state(self, product_type):
+        rows = self._connection().execute(f"SELECT link, price, inStock FROM {GAMELOOT_COLLECTION} WHERE type = ?", (product_type,))
+        return {row["link"]: {"link": row["link"], "price": row["price"], "inStock": bool(row["inStock"])} for row in rows}
+
+    def _select_links(self, sql, product_type, links):
+        """Run a "... WHERE type = ? AND <column> IN ({links})" query in chunks of SQLITE_MAX_VARIABLES values."""
+        links = list(links)
+        conn = self._connection()
+        for start in range(0, len(links), SQLITE_MAX_VARIABLES):
+            chunk = links[start : start + SQLITE_MAX_VARIABLES]
+            yield from conn.execute(sql.format(links=", ".join("?" * len(chunk))), [product_type, *chunk])
+
+    def load_names(self, product_type, links):
+        sql = f"SELECT link, name FROM {GAMELOOT_COLLECTION} WHERE type = ? AND link IN ({{links}})"
+        return {row["link"]: row["name"] for row in self._select_links(sql, product_type, links)}
+
+    def write_stock_changes(self, product_type, diff, now):
+        now = now.isoformat()
+        upserts = [(product_type, product.link, product.name, product.price, now, now, product.model) for product in diff.new]
+        upserts += [
+            (product_type, product.link, product.name, product.price, now, None, product.model) for product in diff.restocked + diff.price_changed
+        ]
+        sold = [(product_type, stored["link"]) for stored in diff.sold]
+        if upserts or sold:
+            with self._transaction() as conn:
+                conn.executemany(_UPSERT_PRODUCT, upserts)
+                conn.executemany(f"UPDATE {GAMELOOT_COLLECTION} SET inStock = 0 WHERE type = ? AND link = ?", sold)
+        return len(upserts) + len(sold)
+
+    def record_price_history(self, points, skip_recorded=False):
+        rows = [(product_type, link, point["price"], point["at"].isoformat(), int(point["inStock"])) for product_type, link, point in points]
+        if rows:
+            with self._transaction() as conn:
+                if skip_recorded:
+                    times = sorted({row[3] for row in rows})
+                    recorded = {
+                        tuple(found)
+                        for found in conn.execute(
+                            f"SELECT type, link, at FROM {PRICE_HISTORY_COLLECTION} WHERE at IN ({', '.join('?' * len(times))})", times
+                        )
+                    }
+                    rows = [row for row in rows if row[:2] + row[3:4] not in recorded]
+                conn.executemany(f"INSERT INTO {PRICE_HISTORY_COLLECTION} (type, link, price, at, inStock) VALUES (?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def load_price_history(self, product_type, link):
+        rows = self._connection().execute(
+            f"SELECT price, at, inStock FROM {PRICE_HISTORY_COLLECTION} WHERE type = ? AND link = ? ORDER BY at", (product_type, link)
+        )
+        return [{"price": row["price"], "at": datetime.fromisoformat(row["at"]), "inStock": bool(row["inStock"])} for row in rows]
+
+    def maintain_price_history(self, now=None):
+        """Delete points past retention, then downsample products with points added since the last cutoff."""
+        now = now or datetime.utcnow()
+        removed = 0
+        with self._transaction() as conn:
+            if PRICE_HISTORY_RETENTION_DAYS > 0:
+                expired = (now - timedelta(days=PRICE_HISTORY_RETENTION_DAYS)).isoformat()
+                removed += conn.execute(f"DELETE FROM {PRICE_HISTORY_COLLECTION} WHERE at < ?", (expired,)).rowcount
+            if PRICE_HISTORY_DOWNSAMPLE_DAYS > 0:
+                cutoff = now - timedelta(days=PRICE_HISTORY_DOWNSAMPLE_DAYS)
+                row = conn.execute("SELECT value FROM storage_meta WHERE key = 'price_history_compacted_until'").fetchone()
+                previous = row["value"] if row else ""
+                rows = conn.execute(
+                    f"""SELECT rowid, type, link, price, at, inStock FROM {PRICE_HISTORY_COLLECTION}
+                    WHERE at < :cutoff AND (type, link) IN (
+                        SELECT DISTINCT type, link FROM {PRICE_HISTORY_COLLECTION} WHERE at >= :previous AND at < :cutoff
+                    ) ORDER BY type, link, at""",
+                    {"cutoff": cutoff.isoformat(), "previous": previous},
+                ).fetchall()
+                doomed = []
+                start = 0
+                while start < len(rows):
+                    end = start
+                    while end < len(rows) and (rows[end]["type"], rows[end]["link"]) == (rows[start]["type"], rows[start]["link"]):
+                        end += 1
+                    points = [
+                        {"rowid": row["rowid"], "price": row["price"], "at": datetime.fromisoformat(row["at"]), "inStock": bool(row["inStock"])}
+                        for row in rows[start:end]
+                    ]
+                    kept = {point["rowid"] for point in downsample_points(points, cutoff)}
+                    doomed.extend((point["rowid"],) for point in points if point["rowid"] not in kept)
+                    start = end
+                conn.executemany(f"DELETE FROM {PRICE_HISTORY_COLLECTION} WHERE rowid = ?", doomed)
+                conn.execute(
+                    "INSERT INTO storage_meta (key, value) VALUES ('price_history_compacted_until', ?) "
+                    "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                    (cutoff.isoformat(),),
+                )
+                removed += len(doomed)
+        logging.info(f"Price history maintenance removed {removed} point(s)")
+        return removed
+
+    def load_lowest_prices(self, product_type, links):
+        sql = f"SELECT link, MIN(price) AS lowest FROM {PRICE_HISTORY_COLLECTION} WHERE type = ? AND link IN ({{links}}) GROUP BY link"
+        return {row["link"]: row["lowest"] for row in self._select_links(sql, product_type, links)}
+
+    def load_stock(self, product_type, in_stock_only=True):
+        sql = f"SELECT link, name, price, inStock, firstSeenAt, priceUpdatedAt, modelKey FROM {GAMELOOT_COLLECTION} WHERE type = ?"
+        if in_stock_only:
+            sql += " AND inStock = 1"
+        rows = self._connection().execute(f"{sql} ORDER BY price, link", (product_type,))
+        return [
+            {
+                "link": row["link"],
+                "name": row["name"],
+                "price": row["price"],
+                "inStock": bool(row["inStock"]),
+                "firstSeenAt": datetime.fromisoformat(row["firstSeenAt"]) if row["firstSeenAt"] else None,
+                "priceUpdatedAt": datetime.fromisoformat(row["priceUpdatedAt"]) if row["priceUpdatedAt"] else None,
+                "modelKey": row["modelKey"],
+            }
+            for row in rows
+        ]
+
+    def load_model_names(self, product_type):
+        rows = self._connection().execute(f"SELECT link, name, modelKey FROM {GAMELOOT_COLLECTION} WHERE type = ?", (product_type,))
+        return [(row["link"], row["name"], row["modelKey"]) for row in rows]
+
+    def write_model_keys(self, product_type, keys):
+        rows = [(key, product_type, link) for link, key in keys.items()]
+        if rows:
+            with self._transaction() as conn:
+                conn.executemany(f"UPDATE {GAMELOOT_COLLECTION} SET modelKey = ? WHERE type = ? AND link = ?", rows)
+        return len(rows)
+
+    def load_model_price_ranges(self, product_type, model_keys):
+        sql = f"SELECT link, modelKey FROM {GAMELOOT_COLLECTION} WHERE type = ? AND modelKey IN ({{links}})"
+        models = {row["link"]: row["modelKey"] for row in self._select_links(sql, product_type, model_keys)}
+        sql = f"SELECT link, MIN(price) AS low, MAX(price) AS high FROM {PRICE_HISTORY_COLLECTION} WHERE type = ? AND link IN ({{links}}) GROUP BY link"
+        return _fold_model_ranges(models, ((row["link"], row["low"], row["high"]) for row in self._select_links(sql, product_type, models)))
+
+    def load_sell_times(self, product_type):
+        rows = self._connection().execute(
+            f"SELECT link, MIN(at) AS first, MIN(CASE WHEN inStock = 0 THEN at END) AS sold "
+            f"FROM {PRICE_HISTORY_COLLECTION} WHERE type = ? GROUP BY link HAVING sold IS NOT NULL",
+            (product_type,),
+        )
+        return {row["link"]: (datetime.fromisoformat(row["first"]), datetime.fromisoformat(row["sold"])) for row in rows}
+
+    def load_daily_new_listings(self, product_type, since):
+        rows = self._connection().execute(
+            f"SELECT substr(firstSeenAt, 1, 10) AS day, COUNT(*) AS count FROM {GAMELOOT_COLLECTION} "
+            "WHERE type = ? AND firstSeenAt >= ? GROUP BY day ORDER BY day",
+            (product_type, since.isoformat()),
+        )
+        return [(row["day"], row["count"]) for row in rows]
+
+    def load_watch_rules(self):
+        rows = self._connection().execute(f"SELECT rule FROM {WATCH_RULES_COLLECTION}")
+        return [json.loads(row["rule"]) for row in rows]
+
+    def save_watch_rule(self, doc):
+        with self._transaction() as conn:
+            conn.execute(
+                f"INSERT INTO {WATCH_RULES_COLLECTION} (id, chatId, rule) VALUES (?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET chatId = excluded.chatId, rule = excluded.rule",
+                (doc["id"], doc["chatId"], json.dumps(doc, default=str)),
+            )
+
+    def delete_watch_rule(self, rule_id):
+        with self._transaction() as conn:
+            return conn.execute(f"DELETE FROM {WATCH_RULES_COLLECTION} WHERE id = ?", (rule_id,)).rowcount > 0
+
+    def load_run_journal(self, key):
+        row = self._connection().execute(f"SELECT doc FROM {RUN_JOURNAL_COLLECTION} WHERE key = ?", (key,)).fetchone()
+        return json.loads(row["doc"]) if row else None
+
+    def save_run_journal(self, key, fields):
+        with self._transaction() as conn:
+            row = conn.execute(f"SELECT doc FROM {RUN_JOURNAL_COLLECTION} WHERE key = ?", (key,)).fetchone()
+            doc = json.loads(row["doc"]) if row else {}
+            for path, value in fields.items():
+                _set_path(doc, path, value)
+            conn.execute(
+                f"INSERT INTO {RUN_JOURNAL_COLLECTION} (key, doc) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET doc = excluded.doc",
+                (key, json.dumps(doc, default=str)),
+            )
+
+    def delete_run_journal(self, key):
+        with self._transaction() as conn:
+            conn.execute(f"DELETE FROM {RUN_JOURNAL_COLLECTION} WHERE key = ?", (key,))
+
+    def acquire_lease(self, name, owner, seconds):
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(f"SELECT owner, expiresAt, token FROM {LEASES_COLLECTION} WHERE name = ?", (name,)).fetchone()
+            if row and row["owner"] != owner and row["expiresAt"] >= now:
+                return None
+            token = (row["token"] if row else 0) + 1
+            conn.execute(
+                f"INSERT INTO {LEASES_COLLECTION} (name, owner, expiresAt, token) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expiresAt = excluded.expiresAt, token = excluded.token",
+                (name, owner, now + seconds, token),
+            )
+        return token
+
+    def renew_leases(self, names, owner, seconds):
+        names = list(names)
+        with self._transaction() as conn:
+            conn.executemany(
+                f"UPDATE {LEASES_COLLECTION} SET expiresAt = ? WHERE name = ? AND owner = ?",
+                [(time.time() + seconds, name, owner) for name in names],
+            )
+            rows = conn.execute(f"SELECT name FROM {LEASES_COLLECTION} WHERE owner = ?", (owner,)).fetchall()
+        return {row["name"] for row in rows} & set(names)
+
+    def release_lease(self, name, owner):
+        with self._transaction() as conn:
+            conn.execute(f"DELETE FROM {LEASES_COLLECTION} WHERE name = ? AND owner = ?", (name, owner))
+
+    def load_leases(self):
+        rows = self._connection().execute(f"SELECT name, owner, expiresAt, token FROM {LEASES_COLLECTION}")
+        return [dict(row) for row in rows]
+
+    def load_page_cache(self, category):
+        row = self._connection().execute(f"SELECT pages FROM {PAGE_CACHE_COLLECTION} WHERE category = ?", (category,)).fetchone()
+        return json.loads(row["pages"]) if row else []
+
+    def save_page_cache(self, category, entries):
+        with self._transaction() as conn:
+            conn.execute(
+                f"INSERT INTO {PAGE_CACHE_COLLECTION} (category, pages, updatedAt) VALUES (?, ?, ?) "
+                "ON CONFLICT (category) DO UPDATE SET pages = excluded.pages, updatedAt = excluded.updatedAt",
+                (category, json.dumps(entries), datetime.utcnow().isoformat()),
+            )
+
+    def delete_page_cache(self, category):
+        with self._transaction() as conn:
+            conn.execute(f"DELETE FROM {PAGE_CACHE_COLLECTION} WHERE category = ?", (category,))
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+# StockStore calls timed by MeteredStockStore
+METERED_OPERATIONS = {
+    "connect", "prepare", "load_stock_state", "load_names", "write_stock_changes", "record_price_history",
+    "load_price_history", "maintain_price_history", "load_lowest_prices", "load_stock", "load_model_names",
+    "write_model_keys", "load_model_price_ranges", "load_sell_times", "load_daily_new_listings", "load_watch_rules",
+    "save_watch_rule", "delete_watch_rule", "load_run_journal", "save_run_journal", "delete_run_journal",
+    "acquire_lease", "renew_leases", "release_lease", "load_leases", "load_page_cache", "save_page_cache",
+    "delete_page_cache",
+}
+
+
+class MeteredStockStore:
+    """StockStore wrapper that records the count, latency and errors of every database call."""
+
+    def __init__(self, store):
+        self._store = store
+        self.name = store.name
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        if name not in METERED_OPERATIONS:
+            return attr
+
+        def metered(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            except STORAGE_ERRORS:
+                STORAGE_ERRORS_TOTAL.inc(backend=self.name, op=name)
+                raise
+            finally:
+                STORAGE_OP_SECONDS.observe(time.perf_counter() - start, backend=self.name, op=name)
+
+        return metered
+
+
+def create_stock_store(backend=None, uri=None):
+    """
+    Build a store for a backend name ("auto", "mongo" or "sqlite").
+
+    Args:
+        backend: Defaults to STORAGE_BACKEND
+        uri: Defaults to MONGODB_URI, a sqlite:///path URI selects SQLite under "auto"
+    """
+    backend = backend or STORAGE_BACKEND
+    if uri is None:
+        uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+    if backend == "auto":
+        backend = "sqlite" if uri.startswith("sqlite:") else "mongo"
+    if backend == "sqlite":
+        path = uri[len("sqlite:///") :] if uri.startswith("sqlite:///") else SQLITE_PATH
+        return SQLiteStockStore(path)
+    if backend == "mongo":
+        return MongoStockStore()
+    raise ValueError(f"Unknown storage backend: {backend} (choose from auto, mongo, sqlite)")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_stock_store():
+    """Return the process-wide store, creating it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MeteredStockStore(create_stock_store())
+            logging.info(f"Using {_store.name} storage")
+        return _store
+
+
+def close_stock_store():
+    """Shutdown hook: close the shared store's connections."""
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+            _store = None
+
+
+atexit.register(close_stock_store)
@@ -1,74 +1,465 @@
-from telegram import Bot
-import requests
+import http_client
+import atexit
+import html
+import logging
 import os
+import re
 import asyncio
-from dotenv import load_dotenv
+import threading
+import time
+from metrics import TELEGRAM_SEND_SECONDS
 
-load_dotenv()
+# python-telegram-bot is imported on the first send (the slowest import of a run); entry points load .env before this module
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 CHAT_IDS = [
     6071212724,
 ]
-print("Telegram message chat IDs", CHAT_IDS)
 
+# Delivery settings (Telegram allows ~30 messages/second per bot and ~1 message/second per chat)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))  # messages/second across all chats
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))  # messages/second per chat
+TELEGRAM_COALESCE_SECONDS = float(os.getenv("TELEGRAM_COALESCE_SECONDS", "5"))  # wait to merge alerts into one message
+TELEGRAM_MAX_RETRIES = 5
+TELEGRAM_RETRY_DELAY = 2  # seconds, doubled per network error retry
+TELEGRAM_SHUTDOWN_TIMEOUT = 30  # seconds to flush pending alerts at exit
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+MARKDOWN_V2_SPECIAL = re.compile(r"([_*\[\]()~`>#+\-=|{}.!\\])")
+MARKDOWN_SPECIAL = re.compile(r"([_*`\[])")
 
-def split_paragraph(paragraph, max_length=4096):
+
+def escape_text(text, parse_mode=None):
+    """Escape text for the given Telegram parse mode ("HTML", "MarkdownV2", "Markdown" or None for plain text)."""
+    if parse_mode == "HTML":
+        return html.escape(text, quote=False)
+    if parse_mode == "MarkdownV2":
+        return MARKDOWN_V2_SPECIAL.sub(r"\\\1", text)
+    if parse_mode == "Markdown":
+        return MARKDOWN_SPECIAL.sub(r"\\\1", text)
+    return text
+
+
+class MessageBuilder:
+    """
+    Stream lines and alert entries into Telegram-sized message parts.
+
+    Parts are kept as lists of lines and joined once, so building is linear
+    in the total text size. Lines are only split across parts at line
+    boundaries; a single line longer than max_length is hard-wrapped without
+    cutting an HTML entity or a Markdown escape in half.
+    """
+
+    def __init__(self, header=None, max_length=TELEGRAM_MAX_MESSAGE_LENGTH, parse_mode=None):
+        self.max_length = max_length
+        self.parse_mode = parse_mode
+        self.entries = 0
+        self._parts = []
+        self._lines = []
+        self._length = 0
+        if header:
+            self.add_text(header)
+
+    def _wrap(self, line):
+        while len(line) > self.max_length:
+            cut = self.max_length
+            if self.parse_mode == "HTML":
+                amp = line.rfind("&", max(0, cut - 10), cut)
+                if amp > 0 and line.find(";", amp, cut) == -1:
+                    cut = amp
+            elif self.parse_mode:
+                backslashes = len(line[:cut]) - len(line[:cut].rstrip("\\"))
+                if backslashes % 2:
+                    cut -= 1
+            yield line[:cut]
+            line = line[cut:]
+        yield line
+
+    def _flush(self):
+        while self._lines and not self._lines[-1]:
+            self._lines.pop()
+        if self._lines:
+            self._parts.append("\n".join(self._lines))
+        self._lines = []
+        self._length = 0
+
+    def add_line(self, line):
+        """Append one already-escaped line, starting a new part when it does not fit."""
+        for chunk in self._wrap(line):
+            if not self._lines:
+                if chunk:  # a part never starts with a blank line
+                    self._lines.append(chunk)
+                    self._length = len(chunk)
+                continue
+            if self._length + 1 + len(chunk) > self.max_length:
+                self._flush()
+                if chunk:
+                    self._lines.append(chunk)
+                    self._length = len(chunk)
+                continue
+            self._lines.append(chunk)
+            self._length += 1 + len(chunk)
+
+    def add_text(self, text):
+        """Escape text for the parse mode and append it line by line."""
+        for line in escape_text(text, self.parse_mode).split("\n"):
+            self.add_line(line)
+
+    def add_entry(self, text):
+        """Append an alert entry separated from the previous one by a blank line."""
+        self.entries += 1
+        self.add_line("")
+        self.add_text(text)
+
+    def parts(self):
+        """Return the finished message parts (never empty strings)."""
+        self._flush()
+        return list(self._parts)
+
+
+def split_paragraph(paragraph, max_length=TELEGRAM_MAX_MESSAGE_LENGTH):
+    """Split text into parts of at most max_length characters, on line boundaries where possible."""
     if len(paragraph) <= max_length:
         return [paragraph]
 
-    lines = paragraph.split("\n")
-    parts = []
-    current_part = ""
+    builder = MessageBuilder(max_length=max_length)
+    for line in paragraph.split("\n"):
+        builder.add_line(line)
+    return builder.parts()
+
+
+class _AsyncRateLimiter:
+    """Space out sends per key (chat ID, or None for the global limit) on the delivery loop."""
 
-    for line in lines:
-        if len(current_part) + len(line) + 1 <= max_length:  # +1 for the newline character
-            if current_part:
-                current_part += "\n"
-            current_part += line
+    def __init__(self, rate):
+        self.rate = rate
+        self._next_slot = {}
+
+    async def wait(self, key=None):
+        if self.rate <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next_slot.get(key, now))
+        self._next_slot[key] = slot + 1 / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def _retry_after_seconds(error):
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+
+
+async def _send_with_retry(bot, chat_id, text, global_limiter, chat_limiter):
+    """Send one message within the rate limits, honouring retry_after and backing off on network errors.
+
+    Returns:
+        str: "sent", "rejected" if Telegram refused it for good or "failed" if it gave up retrying
+    """
+    from telegram.error import BadRequest, Forbidden, InvalidToken, NetworkError, RetryAfter, TelegramError
+
+    for attempt in range(1, TELEGRAM_MAX_RETRIES + 1):
+        await chat_limiter.wait(chat_id)
+        await global_limiter.wait()
+        outcome = "error"
+        start = time.perf_counter()
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+            outcome = "sent"
+            return outcome
+        except RetryAfter as e:
+            outcome = "flood_limited"
+            delay = _retry_after_seconds(e)
+            logging.warning(f"Telegram flood limit for {chat_id}, retrying after {delay:.0f} seconds")
+        except (BadRequest, Forbidden, InvalidToken) as e:
+            # BadRequest is a NetworkError subclass but retrying it cannot succeed
+            outcome = "rejected"
+            logging.error(f"Telegram rejected message to {chat_id}: {e}")
+            return outcome
+        except NetworkError as e:
+            outcome = "network_error"
+            delay = TELEGRAM_RETRY_DELAY * (2 ** (attempt - 1))
+            logging.warning(f"Error sending message to {chat_id}: {e}. Attempt {attempt} of {TELEGRAM_MAX_RETRIES}")
+        except TelegramError as e:
+            logging.error(f"Telegram error sending message to {chat_id}: {e}")
+            return "rejected"
+        finally:
+            TELEGRAM_SEND_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
+        if attempt < TELEGRAM_MAX_RETRIES:
+            await asyncio.sleep(delay)
+    logging.error(f"Failed to send message to {chat_id} after {TELEGRAM_MAX_RETRIES} attempts.")
+    return "failed"
+
+
+def _pack_parts(parts, max_length=TELEGRAM_MAX_MESSAGE_LENGTH):
+    """Join consecutive parts into as few Telegram messages as fit.
+
+    Args:
+        parts: (key, text) tuples in sending order
+
+    Returns:
+        list: (text, keys) per Telegram message, keys of the parts it carries
+    """
+    packed = []
+    for key, text in parts:
+        if packed and packed[-1][1] + 2 + len(text) <= max_length:
+            packed[-1][0].append(text)
+            packed[-1][1] += 2 + len(text)
+            packed[-1][2].append(key)
         else:
-            parts.append(current_part)
-            current_part = line
+            packed.append([[text], len(text), [key]])
+    return [("\n\n".join(texts), keys) for texts, _, keys in packed]
 
-    # Don't forget to add the last part
-    if current_part:
-        parts.append(current_part)
 
-    return parts
+async def _send_messages(bot, messages, chat_ids, global_limiter, chat_limiter, resume=None):
+    """Send messages to every chat concurrently, in order within a chat.
 
-'''
-async def send_telegram_message(message):
-    bot = Bot(token=BOT_TOKEN)
-    for chat_id in CHAT_IDS:
-        print("CHAT id: ", chat_id)
-        for msg in split_paragraph(message):
-            await bot.send_message(chat_id=chat_id, text=msg)'''
+    Each message is split into Telegram-sized parts and consecutive parts are
+    merged where they fit. A chat stops at the first part that failed after
+    every retry, so nothing is sent out of order (parts Telegram rejected are
+    not worth retrying and count as done).
+
+    Args:
+        resume: Optional {str(chat_id): parts already delivered} per message
+
+    Returns:
+        list: (number of parts, {str(chat_id): parts delivered}) per message
+    """
+    parts = [split_paragraph(message) for message in messages]
+    progress = [dict(resume[index] or {}) if resume else {} for index in range(len(messages))]
+
+    async def send_parts(chat_id):
+        chat = str(chat_id)
+        todo = [
+            ((index, number), text)
+            for index, message_parts in enumerate(parts)
+            for number, text in enumerate(message_parts)
+            if number >= progress[index].get(chat, 0)
+        ]
+        for text, keys in _pack_parts(todo):
+            if await _send_with_retry(bot, chat_id, text, global_limiter, chat_limiter) == "failed":
+                return
+            for index, number in keys:
+                progress[index][chat] = number + 1
+
+    await asyncio.gather(*(send_parts(chat_id) for chat_id in chat_ids))
+    return [(len(message_parts), done) for message_parts, done in zip(parts, progress)]
+
+
+async def send_telegram_message(message, chat_ids=None):
+    """Send a message to every chat right away (without the delivery queue)."""
+    from telegram import Bot
 
-async def send_telegram_message(message):
     bot = Bot(token=BOT_TOKEN)
+    await _send_messages(
+        bot, [message], chat_ids or CHAT_IDS, _AsyncRateLimiter(TELEGRAM_GLOBAL_RATE), _AsyncRateLimiter(TELEGRAM_CHAT_RATE)
+    )
+
+
+class TelegramDelivery:
+    """
+    Long-lived alert delivery queue running on its own thread and event loop.
+
+    enqueue() returns immediately, so a tracker never waits on Telegram.
+    Messages arriving within TELEGRAM_COALESCE_SECONDS of each other for the
+    same chats are packed together, so alerts from several categories go out
+    as fewer Telegram messages. A message's on_done callback is called on the
+    delivery thread once it is out of the queue, with its own delivery
+    progress per chat, so a batch that only partly went out can be resumed
+    where each chat stopped rather than sent again as a whole.
+
+    If the bot cannot be created (e.g. TELEGRAM_BOT_TOKEN unset or invalid)
+    or the delivery thread has stopped, enqueue() logs the message and
+    reports it undelivered instead of raising into the tracker.
+    """
+
+    def __init__(self, token=None, coalesce_seconds=TELEGRAM_COALESCE_SECONDS):
+        self.token = token or BOT_TOKEN
+        self.coalesce_seconds = coalesce_seconds
+        self._loop = None
+        self._queue = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._start_lock = threading.Lock()
+        self._idle = threading.Condition()
+        self._pending = 0
+        self.start_error = None  # why the bot could not be created
+
+    def start(self):
+        """
+        Start the delivery thread on first use.
+
+        Raises:
+            Exception: The error that kept the bot from being created (InvalidToken, ImportError, ...)
+        """
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._thread_main, name="telegram-delivery", daemon=True)
+                self._thread.start()
+        self._ready.wait()
+        if self.start_error is not None:
+            raise self.start_error
+
+    def _thread_main(self):
+        try:
+            asyncio.run(self._run())
+        except Exception as e:
+            logging.error(f"Telegram delivery stopped: {e}", exc_info=True)
+        finally:
+            self._ready.set()
+            # Nothing drains the queue any more, so flush() must not wait for it
+            with self._idle:
+                if self._pending:
+                    logging.error(f"Telegram delivery: {self._pending} queued message(s) dropped")
+                self._pending = 0
+                self._idle.notify_all()
+
+    def enqueue(self, message, chat_ids=None, on_done=None, resume=None):
+        """Queue a message for delivery to chat_ids (defaults to CHAT_IDS).
 
-    async def send_with_retry(chat_id, msg, retries=10, delay=10):
-        for attempt in range(retries):
+        Args:
+            on_done: Optional callback(delivered, progress), delivered False if
+                sending failed after every retry and the message is worth trying
+                again; progress is {str(chat_id): parts delivered}, or None if
+                nothing is known
+            resume: Optional progress of an earlier attempt, parts already
+                delivered to a chat are not sent to it again
+        """
+        try:
+            self.start()
+        except Exception:
+            # Logged once by the delivery thread
+            self._undelivered(message, on_done, "bot not available")
+            return
+        with self._idle:
             try:
-                await bot.send_message(chat_id=chat_id, text=msg)
-                return
+                self._loop.call_soon_threadsafe(self._queue.put_nowait, (message, tuple(chat_ids or CHAT_IDS), on_done, resume))
+            except RuntimeError:
+                # The delivery thread has stopped and its event loop is closed
+                queued = False
+            else:
+                self._pending += 1
+                queued = True
+        if not queued:
+            self._undelivered(message, on_done, "delivery thread stopped")
+
+    def _undelivered(self, message, on_done, reason):
+        logging.error(f"Telegram delivery: message not sent ({reason}):\n{message}")
+        if on_done is not None:
+            try:
+                on_done(False)
             except Exception as e:
-                print(f"Error sending message to {chat_id}: {e}. Attempt {attempt + 1} of {retries}")
-                if attempt < retries - 1:
-                    await asyncio.sleep(delay)
-                else:
-                    print(f"Failed to send message to {chat_id} after {retries} attempts.")
-    
-    for chat_id in CHAT_IDS:
-        print("CHAT id:", chat_id)
-        for msg in split_paragraph(message):
-            await send_with_retry(chat_id, msg)
+                logging.error(f"Telegram delivery callback failed: {e}", exc_info=True)
+
+    def flush(self, timeout=None):
+        """Block until every queued message was delivered or given up on. Returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def stop(self, timeout=TELEGRAM_SHUTDOWN_TIMEOUT):
+        """Flush pending messages and stop the delivery thread."""
+        if self._loop is None or not self._thread.is_alive():
+            return
+        if not self.flush(timeout):
+            logging.warning(f"Telegram delivery: {self._pending} message(s) still pending at shutdown")
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+        except RuntimeError:
+            return
+        self._thread.join(timeout)
+
+    async def _run(self):
+        try:
+            from telegram import Bot
+
+            bot = Bot(token=self.token)
+        except Exception as e:
+            logging.error(f"Telegram delivery not started, alerts will not be sent: {e}")
+            self.start_error = e
+            self._ready.set()
+            return
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._ready.set()
+        logging.info(f"Telegram delivery started, default chat IDs {CHAT_IDS}")
+        global_limiter = _AsyncRateLimiter(TELEGRAM_GLOBAL_RATE)
+        chat_limiter = _AsyncRateLimiter(TELEGRAM_CHAT_RATE)
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.coalesce_seconds
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            # Pack messages bound for the same chats together, keeping their order
+            merged = {}
+            for message, chat_ids, on_done, resume in batch:
+                merged.setdefault(chat_ids, []).append((message, on_done, resume))
+            if len(batch) > len(merged):
+                logging.info(f"Telegram delivery: coalesced {len(batch)} alerts into {len(merged)} group(s)")
+            groups = list(merged.items())
+            results = await asyncio.gather(
+                *(
+                    _send_messages(
+                        bot, [message for message, _, _ in items], chat_ids, global_limiter, chat_limiter, [resume for _, _, resume in items]
+                    )
+                    for chat_ids, items in groups
+                ),
+                return_exceptions=True,
+            )
+            for (chat_ids, items), outcome in zip(groups, results):
+                if isinstance(outcome, Exception):
+                    logging.error(f"Telegram delivery failed: {outcome}", exc_info=outcome)
+                    outcome = [(None, None)] * len(items)
+                for (_, on_done, _), (part_count, progress) in zip(items, outcome):
+                    if on_done is None:
+                        continue
+                    delivered = progress is not None and all(progress.get(str(chat_id), 0) >= part_count for chat_id in chat_ids)
+                    try:
+                        on_done(delivered, progress)
+                    except Exception as e:
+                        logging.error(f"Telegram delivery callback failed: {e}", exc_info=True)
+            with self._idle:
+                self._pending -= len(batch)
+                self._idle.notify_all()
+        try:
+            await bot.shutdown()
+        except Exception as e:
+            logging.debug(f"Telegram bot shutdown: {e}")
+
+
+_delivery = TelegramDelivery()
+atexit.register(_delivery.stop)
+
+
+def queue_telegram_message(message, chat_ids=None, on_done=None, resume=None):
+    """Hand a message to the shared delivery queue without blocking the caller."""
+    _delivery.enqueue(message, chat_ids, on_done, resume)
+
+
+def flush_telegram_messages(timeout=None):
+    """Wait for the shared delivery queue to drain."""
+    return _delivery.flush(timeout)
 
 
 def get_chat_id():
     token = BOT_TOKEN
     print(token)
     url = f"https://api.telegram.org/bot{token}/getUpdates"
-    response = requests.get(url)
+    response = http_client.get(url)
     data = response.json()
     print(data)
 
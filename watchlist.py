@@ -0,0 +1,351 @@
+"""
+Per-chat watch rules evaluated against each run's stock diff.
+
+A rule belongs to one Telegram chat and combines any of:
+
+    keywords: words that must all appear in the product name ("rtx 3080")
+    pattern: regular expression the name must match (case-insensitive)
+    type: category type (gpu, cpu, mobo, ram, ...)
+    max_price: highest price worth an alert
+    drop_percent: price must be this far below the lowest recorded price
+
+New, restocked and cheaper listings of a run are checked against the
+rules. Rules are not scanned one by one: keyword rules are indexed under
+their two rarest tokens (or their only one), and rules without keywords are
+bucketed by type and sorted by max_price, so a changed product only looks
+at the rules that can match it. The cost of a run follows the number of changed products, not
+rules x products. Price minimums are loaded in one query, only for products
+that matched a drop_percent rule.
+
+Rules live in WATCH_RULES_COLLECTION of the configured StockStore and are
+reloaded at most every WATCH_RULES_REFRESH_SECONDS.
+
+Usage:
+    python watchlist.py add --chat 123456 --keywords "rtx 3080" --type gpu --max-price 40000
+    python watchlist.py add --chat 123456 --pattern "ryzen [79] 7\\d00x" --drop-percent 10
+    python watchlist.py list [--chat 123456]
+    python watchlist.py remove <rule id>
+"""
+
+import argparse
+import bisect
+import itertools
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from datetime import datetime
+
+from telegram_helper import MessageBuilder
+
+WATCH_RULES_REFRESH_SECONDS = float(os.getenv("WATCH_RULES_REFRESH_SECONDS", "60"))
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercase alphanumeric tokens of a product name or keyword list."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class WatchRule:
+    """One chat's alert condition."""
+
+    __slots__ = ("id", "chat_id", "keywords", "pattern", "type", "max_price", "drop_percent", "tokens", "regex")
+
+    def __init__(self, id, chat_id, keywords=(), pattern=None, type=None, max_price=None, drop_percent=None):
+        self.id = id
+        self.chat_id = chat_id
+        self.keywords = list(keywords)
+        self.pattern = pattern
+        self.type = type
+        self.max_price = max_price
+        self.drop_percent = drop_percent
+        self.tokens = frozenset(token for keyword in self.keywords for token in tokenize(keyword))
+        self.regex = re.compile(pattern, re.IGNORECASE) if pattern else None
+        if not (self.tokens or pattern or type or max_price is not None or drop_percent is not None):
+            raise ValueError("A watch rule needs keywords, a pattern, a type, a max price or a drop percent")
+
+    @classmethod
+    def from_dict(cls, doc):
+        return cls(
+            doc["id"], doc["chatId"], doc.get("keywords", ()), doc.get("pattern"), doc.get("type"), doc.get("maxPrice"), doc.get("dropPercent")
+        )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "chatId": self.chat_id,
+            "keywords": self.keywords,
+            "pattern": self.pattern,
+            "type": self.type,
+            "maxPrice": self.max_price,
+            "dropPercent": self.drop_percent,
+        }
+
+    def matches(self, product, tokens, product_type):
+        """Check everything but drop_percent, which needs the price history."""
+        if self.type is not None and self.type != product_type:
+            return False
+        if self.max_price is not None and product.price > self.max_price:
+            return False
+        if not self.tokens <= tokens:
+            return False
+        return self.regex is None or self.regex.search(product.name) is not None
+
+    def describe(self):
+        parts = []
+        if self.keywords:
+            parts.append(f"keywords {' '.join(self.keywords)!r}")
+        if self.pattern:
+            parts.append(f"pattern /{self.pattern}/")
+        if self.type:
+            parts.append(f"type {self.type}")
+        if self.max_price is not None:
+            parts.append(f"max {self.max_price}")
+        if self.drop_percent is not None:
+            parts.append(f"{self.drop_percent:g}% below lowest")
+        return ", ".join(parts)
+
+    def __repr__(self):
+        return f"WatchRule({self.id}, chat {self.chat_id}, {self.describe()})"
+
+
+class WatchIndex:
+    """
+    Rules indexed for lookup by product tokens, type and price.
+
+    Keyword rules sit under the pair of tokens that the fewest rules share
+    (a single token for one-word rules), so a product only checks the rules
+    anchored on a pair, or a token, of its own name. Rules
+    without keywords are grouped by type (None = any type) and sorted by
+    max_price, so only rules whose max_price the product is under are checked.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.by_token = {}  # token -> one-token rules
+        self.by_pair = {}  # (token, token) in sorted order -> rules anchored on the pair
+        self.pair_tokens = set()  # tokens appearing in a by_pair key
+        self.by_price = {}  # type -> (sorted max prices, rules in the same order)
+        self.unbounded = {}  # type -> keyword-less rules without a max price
+
+        frequency = {}
+        for rule in self.rules:
+            for token in rule.tokens:
+                frequency[token] = frequency.get(token, 0) + 1
+        priced = {}
+        for rule in self.rules:
+            if len(rule.tokens) == 1:
+                self.by_token.setdefault(next(iter(rule.tokens)), []).append(rule)
+            elif rule.tokens:
+                rarest = sorted(rule.tokens, key=lambda token: (frequency[token], -len(token), token))[:2]
+                self.by_pair.setdefault(tuple(sorted(rarest)), []).append(rule)
+                self.pair_tokens.update(rarest)
+            elif rule.max_price is not None:
+                priced.setdefault(rule.type, []).append(rule)
+            else:
+                self.unbounded.setdefault(rule.type, []).append(rule)
+        for product_type, rules in priced.items():
+            rules.sort(key=lambda rule: rule.max_price)
+            self.by_price[product_type] = ([rule.max_price for rule in rules], rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def candidates(self, tokens, product_type, price):
+        """Yield every rule that could match a product (each rule at most once)."""
+        for token in tokens:
+            yield from self.by_token.get(token, ())
+        for pair in itertools.combinations(sorted(tokens & self.pair_tokens), 2):
+            yield from self.by_pair.get(pair, ())
+        for key in (product_type, None):
+            if key in self.by_price:
+                prices, rules = self.by_price[key]
+                yield from rules[bisect.bisect_left(prices, price) :]
+            yield from self.unbounded.get(key, ())
+
+    def match(self, product, product_type):
+        """
+        Return the rules a product matches, drop_percent not checked yet.
+
+        Returns:
+            tuple: (matching rules, number of candidate rules checked)
+        """
+        tokens = frozenset(tokenize(product.name))
+        checked = 0
+        matched = []
+        for rule in self.candidates(tokens, product_type, product.price):
+            checked += 1
+            if rule.matches(product, tokens, product_type):
+                matched.append(rule)
+        return matched, checked
+
+
+def _diff_events(diff):
+    """(product, reason) for every listing a watcher may care about: new, back in stock or cheaper."""
+    events = [(product, "new listing") for product in diff.new]
+    events += [(product, "back in stock") for product in diff.restocked]
+    for product in diff.price_changed:
+        previous = diff.previous_prices.get(product.link)
+        if previous is not None and product.price < previous:
+            events.append((product, f"price drop {previous} -> {product.price}"))
+    return events
+
+
+def match_watch_rules(index, diff, product_type, load_lowest_prices):
+    """
+    Evaluate watch rules against a run's diff.
+
+    Must run before the diff's price points are written, so the recorded
+    minimum does not include this run's prices.
+
+    Args:
+        index: WatchIndex of the current rules
+        diff: StockDiff of the run
+        product_type: Category type rules are matched against (unprefixed, e.g. "gpu")
+        load_lowest_prices: Called with a list of links, returns {link: lowest recorded price};
+            only called when a drop_percent rule matched
+
+    Returns:
+        dict: {chat_id: [(product, reason, rule), ...]} with each product at most once per chat
+    """
+    if not len(index):
+        return {}
+    events = _diff_events(diff)
+    checked = 0
+    pending = []  # (product, reason, rules)
+    for product, reason in events:
+        rules, count = index.match(product, product_type)
+        checked += count
+        if rules:
+            pending.append((product, reason, rules))
+
+    lowest = {}
+    drop_links = [product.link for product, _, rules in pending if any(rule.drop_percent is not None for rule in rules)]
+    if drop_links:
+        lowest = load_lowest_prices(drop_links)
+
+    alerts = {}
+    matched = 0
+    for product, reason, rules in pending:
+        for rule in rules:
+            if rule.drop_percent is not None:
+                floor = lowest.get(product.link)
+                if floor is None or product.price > floor * (1 - rule.drop_percent / 100):
+                    continue
+                rule_reason = f"{reason}, lowest recorded {floor}"
+            else:
+                rule_reason = reason
+            chat_alerts = alerts.setdefault(rule.chat_id, [])
+            if not chat_alerts or chat_alerts[-1][0] is not product:
+                chat_alerts.append((product, rule_reason, rule))
+                matched += 1
+    logging.info(
+        f"Watchlist: {len(index)} rule(s), {len(events)} changed product(s), {checked} candidate check(s), "
+        f"{matched} alert(s) for {len(alerts)} chat(s)"
+    )
+    return alerts
+
+
+def build_watch_messages(alerts):
+    """Return {chat_id: [message parts]} for the output of match_watch_rules."""
+    messages = {}
+    for chat_id, entries in alerts.items():
+        builder = MessageBuilder(header="WATCHLIST MATCH:")
+        for product, reason, rule in entries:
+            builder.add_entry(f"-{product.name} - {product.price} - {product.link}\n  {reason} (rule {rule.id})")
+        messages[chat_id] = builder.parts()
+    return messages
+
+
+_index = None
+_index_loaded_at = None
+_index_lock = threading.Lock()
+
+
+def get_watch_index(store):
+    """
+    Return the shared WatchIndex, reloading the rules from storage at most every WATCH_RULES_REFRESH_SECONDS.
+
+    A failed reload keeps the previous rules (or none) and is retried on the next run.
+    """
+    global _index, _index_loaded_at
+    from storage import STORAGE_ERRORS
+
+    with _index_lock:
+        now = time.monotonic()
+        if _index is None or now - _index_loaded_at >= WATCH_RULES_REFRESH_SECONDS:
+            try:
+                rules = []
+                for doc in store.load_watch_rules():
+                    try:
+                        rules.append(WatchRule.from_dict(doc))
+                    except (KeyError, ValueError, re.error) as e:
+                        logging.warning(f"Skipping invalid watch rule {doc.get('id')}: {e}")
+                _index = WatchIndex(rules)
+                logging.debug(f"Loaded {len(rules)} watch rule(s)")
+            except STORAGE_ERRORS as e:
+                logging.warning(f"Could not load watch rules, using the previous ones: {e}")
+                if _index is None:
+                    _index = WatchIndex([])
+            _index_loaded_at = now
+        return _index
+
+
+def reset_watch_index():
+    """Drop the cached rules so the next run reloads them."""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def main():
+    import logging_config
+    from dotenv import load_dotenv
+    from storage import STORAGE_ERRORS, get_stock_store
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Manage watch rules")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="add a rule")
+    add.add_argument("--chat", type=int, required=True, help="Telegram chat ID to alert")
+    add.add_argument("--keywords", default="", help="words that must all appear in the name")
+    add.add_argument("--pattern", help="regular expression the name must match")
+    add.add_argument("--type", help="category type, e.g. gpu")
+    add.add_argument("--max-price", type=int)
+    add.add_argument("--drop-percent", type=float, help="alert when the price is this far below the lowest recorded price")
+    listing = commands.add_parser("list", help="list rules")
+    listing.add_argument("--chat", type=int)
+    remove = commands.add_parser("remove", help="remove a rule")
+    remove.add_argument("id")
+    args = parser.parse_args()
+
+    store = get_stock_store()
+    try:
+        store.prepare()
+        if args.command == "add":
+            try:
+                keywords = args.keywords.split()
+                rule = WatchRule(secrets.token_hex(4), args.chat, keywords, args.pattern, args.type, args.max_price, args.drop_percent)
+            except (ValueError, re.error) as e:
+                print(f"Invalid rule: {e}")
+                return 1
+            store.save_watch_rule({**rule.to_dict(), "createdAt": datetime.utcnow()})
+            print(f"Added {rule}")
+        elif args.command == "list":
+            for doc in store.load_watch_rules():
+                if args.chat is None or doc["chatId"] == args.chat:
+                    print(WatchRule.from_dict(doc))
+        elif not store.delete_watch_rule(args.id):
+            print(f"No rule {args.id}")
+            return 1
+    except STORAGE_ERRORS as e:
+        logging.error(f"Watch rule {args.command} failed: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())